@@ -0,0 +1,521 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure ripped audio: its loudness for ReplayGain, following EBU R128, and
+where it is silent.
+"""
+
+import logging
+import math
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import dartt.cue as cue
+import dartt.utils as utils
+
+# CD audio.
+SampleRate = 44100
+Channels = 2
+
+# Gating blocks are 400 ms long and start every 100 ms.
+HopSamples = SampleRate // 10
+HopsPerBlock = 4
+
+# Blocks quieter than this never count toward the loudness.
+AbsoluteGate = -70.0
+
+# Blocks more than this far below the loudness of the louder blocks do not
+# count either.
+RelativeGate = -10.0
+
+# The histogram of block loudness covers [AbsoluteGate, HistogramTop) in steps
+# of HistogramStep LU.  Nothing a CD can hold is louder than the top.
+HistogramStep = 0.01
+HistogramTop = 10.0
+HistogramBins = round((HistogramTop - AbsoluteGate) / HistogramStep)
+
+# The length of the K-weighting filter's impulse response, past which less
+# than a millionth of its energy is left.
+FilterTaps = 2048
+
+# The FFT size the filter works in, which keeps the transforms in cache.
+FilterSize = 1 << 14
+
+# Samples read at once, which bounds the size of the temporary arrays.
+ChunkSamples = 1 << 18
+
+# The loudness ReplayGain 2.0 adjusts tracks to, in LUFS.
+ReferenceLoudness = -18.0
+
+# Silence is found a CD sector at a time.
+WindowSamples = 588
+
+# The RMS level in dBFS below which a window is silent.
+SilenceThreshold = -60.0
+
+# Silence at the start of a track longer than this, in samples, is likely a
+# gap that belongs at the end of the track before it.
+LeadingGapSamples = 2 * SampleRate
+
+def _getBiquadResponse(
+        B: Sequence[float],
+        A: Sequence[float],
+        Size: int
+) -> np.ndarray:
+    Z = np.exp(-2j * np.pi * np.arange(Size // 2 + 1) / Size)
+    return ((B[0] + B[1] * Z + B[2] * Z * Z) /
+            (A[0] + A[1] * Z + A[2] * Z * Z))
+
+def getKWeightingTaps(Rate: int = SampleRate) -> np.ndarray:
+    """Return the impulse response of the BS.1770 K-weighting filter, a high
+    shelf for the head followed by a high-pass, at any sample rate.  The two
+    biquads are derived from their analog prototypes, as in libebur128, and
+    applied in the frequency domain so that no IIR filter runs sample by
+    sample in Python.
+
+    :param Rate: The sample rate
+    :returns: The first FilterTaps samples of the filter's impulse response
+
+    """
+    # The high shelf.
+    K = math.tan(math.pi * 1681.974450955533 / Rate)
+    Q = 0.7071752369554196
+    Vh = 10 ** (3.999843853973347 / 20)
+    Vb = Vh ** 0.4996667741545416
+    A0 = 1 + K / Q + K * K
+    Shelf = ([ (Vh + Vb * K / Q + K * K) / A0, 2 * (K * K - Vh) / A0,
+               (Vh - Vb * K / Q + K * K) / A0 ],
+             [ 1.0, 2 * (K * K - 1) / A0, (1 - K / Q + K * K) / A0 ])
+
+    # The high-pass.
+    K = math.tan(math.pi * 38.13547087602444 / Rate)
+    Q = 0.5003270373238773
+    A0 = 1 + K / Q + K * K
+    HighPass = ([ 1.0, -2.0, 1.0 ],
+                [ 1.0, 2 * (K * K - 1) / A0, (1 - K / Q + K * K) / A0 ])
+
+    # Sample the response finely enough that the impulse response does not
+    # wrap around.
+    Size = 8 * FilterTaps
+    Response = (_getBiquadResponse(*Shelf, Size) *
+                _getBiquadResponse(*HighPass, Size))
+    return np.fft.irfft(Response, Size)[:FilterTaps]
+
+class KWeightingFilter:
+    """Apply K-weighting to a stream of samples by overlap-save convolution,
+    so that the audio can be filtered a chunk at a time."""
+    def __init__(
+            self,
+            Rate: int = SampleRate
+    ):
+        self._Response = np.fft.rfft(getKWeightingTaps(Rate), FilterSize)
+        self._History = np.zeros((Channels, FilterTaps - 1))
+
+    def filter(self, Samples: np.ndarray) -> np.ndarray:
+        """Filter the next samples of the stream.
+
+        :param Samples: Floating point samples, one row per channel
+        :returns: The filtered samples, one row per channel
+
+        """
+        Input = np.concatenate((self._History, Samples), axis=1)
+        Output = np.empty(Samples.shape)
+        Step = FilterSize - (FilterTaps - 1)
+        for Start in range(0, Samples.shape[1], Step):
+            Block = Input[:, Start:Start + FilterSize]
+            Filtered = np.fft.irfft(np.fft.rfft(Block, FilterSize) *
+                                    self._Response, FilterSize)
+            Output[:, Start:Start + Step] = (
+                Filtered[:, FilterTaps - 1:Block.shape[1]]
+            )
+        self._History = Input[:, Input.shape[1] - (FilterTaps - 1):]
+        return Output
+
+def getLoudness(Power: float) -> float:
+    """Return the loudness in LUFS of a K-weighted mean square summed over the
+    channels."""
+    return -0.691 + 10 * math.log10(Power)
+
+class BlockHistogram:
+    """The gating blocks of some audio, binned by loudness.  Histograms add,
+    so an album's loudness comes from the histograms of its tracks without
+    reading the audio again.  Each bin keeps the total power of its blocks
+    as well as their number, so only the relative gate is rounded to a
+    bin."""
+    def __init__(self):
+        self._Counts = np.zeros(HistogramBins, dtype=np.int64)
+        self._Powers = np.zeros(HistogramBins)
+
+    def add(self, Powers: np.ndarray):
+        """Add gating blocks.
+
+        :param Powers: The K-weighted mean square of each block, summed over
+                       the channels
+        :returns: Nothing
+
+        """
+        with np.errstate(divide='ignore'):
+            Loudness = -0.691 + 10 * np.log10(Powers)
+        Bins = np.floor((Loudness - AbsoluteGate) / HistogramStep)
+        Gated = Bins >= 0
+        Bins = np.minimum(Bins[Gated], HistogramBins - 1).astype(np.int64)
+        self._Counts += np.bincount(Bins, minlength=HistogramBins)
+        self._Powers += np.bincount(Bins, weights=Powers[Gated],
+                                    minlength=HistogramBins)
+
+    def __add__(self, Other: 'BlockHistogram') -> 'BlockHistogram':
+        Sum = BlockHistogram()
+        Sum._Counts = self._Counts + Other._Counts
+        Sum._Powers = self._Powers + Other._Powers
+        return Sum
+
+    @property
+    def Count(self) -> int:
+        return int(self._Counts.sum())
+
+    @property
+    def Loudness(self) -> Optional[float]:
+        """The gated loudness in LUFS, or None if every block is gated."""
+        Count = self.Count
+        if Count == 0:
+            return None
+        Gate = getLoudness(self._Powers.sum() / Count) + RelativeGate
+        First = max(0, math.floor((Gate - AbsoluteGate) / HistogramStep))
+        Count = self._Counts[First:].sum()
+        if Count == 0:
+            return None
+        return getLoudness(self._Powers[First:].sum() / Count)
+
+class LoudnessMeter:
+    """Measure the loudness and peak of a stream of 16-bit stereo samples fed
+    in chunks of any size."""
+    def __init__(self):
+        self._Filter = KWeightingFilter()
+        self._Histogram = BlockHistogram()
+        self._Peak = 0
+        # Squared filtered samples that do not yet fill a hop.
+        self._Pending = np.zeros((0, Channels))
+        # The power of the last hops, which start the next block.
+        self._Recent = np.zeros(0)
+
+    def feed(self, Samples: np.ndarray):
+        """Measure the next samples of the stream.
+
+        :param Samples: 16-bit samples, one row per sample
+        :returns: Nothing
+
+        """
+        if len(Samples) == 0:
+            return
+        self._Peak = max(self._Peak,
+                         int(np.abs(Samples.astype(np.int32)).max()))
+
+        Squares = np.concatenate((
+            self._Pending, self._Filter.filter(Samples.T / 32768.0).T ** 2
+        ))
+        Hops = len(Squares) // HopSamples
+        self._Pending = Squares[Hops * HopSamples:]
+        Powers = np.concatenate((
+            self._Recent,
+            Squares[:Hops * HopSamples].reshape(Hops, HopSamples, Channels)
+            .mean(axis=1).sum(axis=1)
+        ))
+
+        if len(Powers) >= HopsPerBlock:
+            End = len(Powers) - HopsPerBlock + 1
+            self._Histogram.add(sum(Powers[Hop:Hop + End]
+                                    for Hop in range(HopsPerBlock)) /
+                                HopsPerBlock)
+        self._Recent = Powers[max(0, len(Powers) - (HopsPerBlock - 1)):]
+
+    @property
+    def Histogram(self) -> BlockHistogram:
+        return self._Histogram
+
+    @property
+    def Peak(self) -> float:
+        """The sample peak, relative to full scale."""
+        return self._Peak / 32768
+
+class TrackSilence:
+    """Where a track is silent.  All counts are in samples."""
+    def __init__(
+            self,
+            Length: int,
+            Leading: int,
+            Trailing: int
+    ):
+        """Construct a TrackSilence.
+
+        :param Length: The length of the track
+        :param Leading: The silence at the start of the track, which is all
+                        of it for a silent track
+        :param Trailing: The silence at the end of the track
+        :returns: A TrackSilence
+
+        """
+        self._Length = Length
+        self._Leading = Leading
+        self._Trailing = Trailing
+
+    @property
+    def Length(self) -> int:
+        return self._Length
+
+    @property
+    def Leading(self) -> int:
+        return self._Leading
+
+    @property
+    def Trailing(self) -> int:
+        return self._Trailing
+
+    @property
+    def IsSilent(self) -> bool:
+        return self._Leading == self._Length
+
+    @property
+    def Audible(self) -> Tuple[int, int]:
+        """The start and length of the track without its silence."""
+        return self._Leading, self._Length - self._Leading - self._Trailing
+
+    def __repr__(self) -> str:
+        if self.IsSilent:
+            return f'silent for {self.Length / SampleRate:.2f}s'
+        return (f'{self.Leading / SampleRate:.2f}s leading and '
+                f'{self.Trailing / SampleRate:.2f}s trailing silence')
+
+class SilenceScanner:
+    """Find the silence at the ends of a stream of 16-bit stereo samples fed
+    in chunks of any size, from the RMS level of each CD sector."""
+    def __init__(
+            self,
+            Threshold: float = SilenceThreshold
+    ):
+        # Compare mean squares rather than take square roots.
+        self._Limit = (10 ** (Threshold / 20) * 32768) ** 2
+        self._Length = 0
+        # The start of the first audible window and the end of the last.
+        self._First: Optional[int] = None
+        self._End = 0
+        # Samples that do not yet fill a window.
+        self._Pending = np.zeros((0, Channels), dtype='<i2')
+
+    def _scan(
+            self,
+            Samples: np.ndarray,
+            Windows: int,
+            Size: int
+    ):
+        Values = Samples[:Windows * Size].reshape(
+            Windows, Size * Channels
+        ).astype(np.float32)
+        Powers = np.einsum('ij,ij->i', Values, Values) / (Size * Channels)
+        Audible = np.flatnonzero(Powers > self._Limit)
+        if len(Audible):
+            if self._First is None:
+                self._First = self._Length + int(Audible[0]) * Size
+            self._End = self._Length + (int(Audible[-1]) + 1) * Size
+        self._Length += Windows * Size
+
+    def feed(self, Samples: np.ndarray):
+        """Scan the next samples of the stream.
+
+        :param Samples: 16-bit samples, one row per sample
+        :returns: Nothing
+
+        """
+        if len(self._Pending):
+            Samples = np.concatenate((self._Pending, Samples))
+        Windows = len(Samples) // WindowSamples
+        self._scan(Samples, Windows, WindowSamples)
+        # Copy, so that a memory map is not kept open by what is left over.
+        self._Pending = np.array(Samples[Windows * WindowSamples:])
+
+    def finish(self) -> TrackSilence:
+        """Return the silence in the stream, which has ended."""
+        if len(self._Pending):
+            self._scan(self._Pending, 1, len(self._Pending))
+            self._Pending = self._Pending[:0]
+        if self._First is None:
+            return TrackSilence(self._Length, self._Length, 0)
+        return TrackSilence(self._Length, self._First,
+                            self._Length - self._End)
+
+def readExtents(
+        Extents: Sequence[cue.Extent]
+) -> Iterator[np.ndarray]:
+    """Read the audio in some byte ranges of WAV or BIN files in chunks,
+    memory mapped rather than copied.
+
+    :param Extents: The byte ranges of the audio, with None for silence
+    :returns: An iterator over 16-bit samples, one row per sample
+
+    """
+    for FilePath, Offset, Length in Extents:
+        Count = Length // (2 * Channels)
+        if Count == 0:
+            continue
+        if FilePath is None:
+            Samples = np.zeros((Count, Channels), dtype='<i2')
+        else:
+            Samples = np.memmap(FilePath, dtype='<i2', mode='r',
+                                offset=Offset, shape=(Count, Channels))
+        for Start in range(0, Count, ChunkSamples):
+            yield Samples[Start:Start + ChunkSamples]
+
+def scanSilence(
+        Extents: Sequence[cue.Extent],
+        Threshold: float = SilenceThreshold
+) -> TrackSilence:
+    """Find the silence at the ends of some audio.
+
+    :param Extents: The byte ranges of the audio, with None for silence
+    :param Threshold: The RMS level in dBFS below which audio is silent
+    :returns: The silence in the audio
+
+    """
+    Scanner = SilenceScanner(Threshold)
+    for Samples in readExtents(Extents):
+        Scanner.feed(Samples)
+    return Scanner.finish()
+
+def analyzeExtents(
+        Extents: Sequence[cue.Extent],
+        Threshold: float = SilenceThreshold
+) -> Tuple[BlockHistogram, float, TrackSilence]:
+    """Measure the audio in some byte ranges of WAV or BIN files in one pass.
+    This runs in the analysis processes, so it takes and returns only what
+    pickles.
+
+    :param Extents: The byte ranges of the audio, with None for silence
+    :param Threshold: The RMS level in dBFS below which audio is silent
+    :returns: The block histogram, sample peak and silence of the audio
+
+    """
+    Meter = LoudnessMeter()
+    Scanner = SilenceScanner(Threshold)
+    for Samples in readExtents(Extents):
+        Meter.feed(Samples)
+        Scanner.feed(Samples)
+    return Meter.Histogram, Meter.Peak, Scanner.finish()
+
+def findLeadingGaps(
+        Silences: Dict[int, TrackSilence]
+) -> List[int]:
+    """Find the tracks that start with a long silence while the track before
+    them does not end with one.  On a CD the gap between two tracks belongs
+    to the end of the first, so these usually have their index 01 placed too
+    early.
+
+    :param Silences: The silence of each track of a disc, by number
+    :returns: The numbers of the tracks
+
+    """
+    Numbers = sorted(Silences)
+    return [ Number for Previous, Number in zip(Numbers, Numbers[1:])
+             if not Silences[Number].IsSilent and
+             Silences[Number].Leading >= LeadingGapSamples and
+             Silences[Previous].Trailing < Silences[Number].Leading ]
+
+class ReplayGain:
+    """The ReplayGain 2.0 gains and peaks of a track and its album."""
+    def __init__(
+            self,
+            TrackGain: Optional[float],
+            TrackPeak: float,
+            AlbumGain: Optional[float],
+            AlbumPeak: float
+    ):
+        """Construct a ReplayGain.
+
+        :param TrackGain: The track gain in dB, or None for silence
+        :param TrackPeak: The track's sample peak, relative to full scale
+        :param AlbumGain: The album gain in dB, or None for silence
+        :param AlbumPeak: The album's sample peak, relative to full scale
+        :returns: A ReplayGain
+
+        """
+        self._TrackGain = TrackGain
+        self._TrackPeak = TrackPeak
+        self._AlbumGain = AlbumGain
+        self._AlbumPeak = AlbumPeak
+
+    @property
+    def TrackGain(self) -> Optional[float]:
+        return self._TrackGain
+
+    @property
+    def TrackPeak(self) -> float:
+        return self._TrackPeak
+
+    @property
+    def AlbumGain(self) -> Optional[float]:
+        return self._AlbumGain
+
+    @property
+    def AlbumPeak(self) -> float:
+        return self._AlbumPeak
+
+    def __repr__(self) -> str:
+        def format(Gain: Optional[float]) -> str:
+            return 'silent' if Gain is None else f'{Gain:+.2f} dB'
+
+        return (f'track {format(self.TrackGain)} peak {self.TrackPeak:.6f}, '
+                f'album {format(self.AlbumGain)} peak {self.AlbumPeak:.6f}')
+
+def getGain(Loudness: Optional[float]) -> Optional[float]:
+    """Return the ReplayGain 2.0 gain for a loudness in LUFS."""
+    return None if Loudness is None else ReferenceLoudness - Loudness
+
+def analyzeTracks(
+        Tracks: Sequence[Tuple[int, Sequence[cue.Extent]]],
+        Jobs: int,
+        Threshold: float = SilenceThreshold
+) -> Tuple[Dict[int, ReplayGain], Dict[int, TrackSilence]]:
+    """Measure the tracks of an album in parallel, computing their ReplayGain
+    and finding their silence.  The album is measured from the tracks' block
+    histograms.
+
+    :param Tracks: The number and audio extents of every track of the album
+    :param Jobs: The number of processes to measure with
+    :param Threshold: The RMS level in dBFS below which audio is silent
+    :returns: The ReplayGain and the silence of each track, by number
+
+    """
+    # The filtering is NumPy bound, so it runs in processes.
+    Pool = utils.getPool('analysis', Jobs, Processes=True)
+    Futures = [ (Number, Pool.submit(analyzeExtents, Extents, Threshold))
+                for Number, Extents in Tracks ]
+    Results = [ (Number, *Future.result()) for Number, Future in Futures ]
+    if not Results:
+        return dict(), dict()
+
+    Album = sum((Histogram for _, Histogram, _, _ in Results[1:]),
+                Results[0][1])
+    AlbumGain = getGain(Album.Loudness)
+    AlbumPeak = max(Peak for _, _, Peak, _ in Results)
+    logging.info(f'Album loudness {Album.Loudness} LUFS')
+    return ({ Number: ReplayGain(getGain(Histogram.Loudness), Peak, AlbumGain,
+                                 AlbumPeak)
+              for Number, Histogram, Peak, _ in Results },
+            { Number: Silence for Number, _, _, Silence in Results })
@@ -0,0 +1,308 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compress archived tracks losslessly, checking that they decode bit-exactly
+before the WAV files are removed.
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import logging
+import os
+from pathlib import Path
+import sh
+from typing import Dict, Iterable, List, Optional, Type
+
+import dartt.config as config
+import dartt.cue as cue
+from dartt.disc import AudioTrack
+import dartt.manifest as manifest
+from dartt.transcoder import TranscodedTrack
+import dartt.utils as utils
+
+class ArchiveVerifyError(RuntimeError):
+    def __init__(self, TrackPath: Path):
+        super().__init__(f'{TrackPath} does not decode to the ripped audio')
+
+class ArchiveCompressor(ABC):
+    """Base class for lossless archive formats.  Subclasses give the commands
+    that compress a WAV file at a fast preset and decode a compressed file to
+    raw little-endian PCM on stdout.  A track is compressed next to its WAV
+    file, which is replaced only once the rest of the disc is done with it."""
+
+    Extension: str = ''
+    Encoder: str = ''
+    Decoder: str = ''
+
+    def __init__(
+            self,
+            Config: config.Config
+    ):
+        self._Encoder = Config.getAudioArchiveEncoder() or self.Encoder
+        self._Decoder = Config.getAudioArchiveDecoder() or self.Decoder
+        self._Jobs = Config.getAudioTranscodeJobs()
+
+    @abstractmethod
+    def encodeArguments(self, Input: Path, Output: Path) -> List[str]:
+        """Return the encoder arguments to compress Input to Output."""
+        pass
+
+    @abstractmethod
+    def decodeArguments(self, Input: Path) -> List[str]:
+        """Return the decoder arguments to write the PCM of Input to
+        stdout."""
+        pass
+
+    def outputPath(self, Track: AudioTrack) -> Path:
+        return Track.RippedPath.with_suffix(f'.{self.Extension}')
+
+    def decode(self, TrackPath: Path) -> manifest.PCMHasher:
+        """Decode a compressed track and hash its audio.
+
+        :param TrackPath: The compressed track
+        :returns: The hashes of the decoded audio
+
+        """
+        Hasher = manifest.PCMHasher(0)
+        Cmd = sh.Command(self._Decoder)
+        Cmd(*self.decodeArguments(TrackPath), _out=Hasher,
+            _out_bufsize=1 << 16)
+        return Hasher
+
+    def decodeToWav(
+            self,
+            TrackPath: Path,
+            WavPath: Path
+    ) -> manifest.PCMHasher:
+        """Decode a compressed track to a WAV file and hash its audio.
+
+        :param TrackPath: The compressed track
+        :param WavPath: The WAV file to write
+        :returns: The hashes of the decoded audio
+
+        """
+        Hasher = manifest.PCMHasher(0)
+        with open(WavPath, 'wb') as File:
+            # The real header follows once the size is known.
+            File.write(cue.getWavHeader(0))
+            Cmd = sh.Command(self._Decoder)
+            Cmd(*self.decodeArguments(TrackPath),
+                _out=manifest.HashingWriter(File, Hasher),
+                _out_bufsize=1 << 16)
+            File.seek(0)
+            File.write(cue.getWavHeader(Hasher.Size))
+        return Hasher
+
+    def encodeTrack(self, Track: AudioTrack) -> Path:
+        """Compress an archived track beside its WAV file and check that it
+        decodes to the same audio.
+
+        :param Track: The archived track
+        :returns: The compressed file, for replaceTrack to put in place
+
+        """
+        Input = Track.RippedPath
+        Expected = Track.Checksums.get('sha256', None)
+        if Expected is None:
+            Entry = manifest.AlbumManifest(Input.parent).get(Input)
+            Expected = Entry['sha256'] if Entry else None
+        if Expected is None:
+            Hasher = manifest.PCMHasher()
+            with open(Input, 'rb') as File:
+                while Chunk := File.read(1 << 20):
+                    Hasher.update(Chunk)
+            Expected = Hasher.Checksums['sha256']
+
+        Output = self.outputPath(Track)
+        Partial = Output.with_name(Output.name + '.part')
+        try:
+            Cmd = sh.Command(self._Encoder)
+            Cmd(*self.encodeArguments(Input, Partial))
+            if self.decode(Partial).Checksums['sha256'] != Expected:
+                raise ArchiveVerifyError(Partial)
+        except BaseException:
+            Partial.unlink(missing_ok=True)
+            raise
+        return Partial
+
+    def replaceTrack(
+            self,
+            Track: AudioTrack,
+            Partial: Path
+    ) -> AudioTrack:
+        """Put a track compressed by encodeTrack in place of its WAV file.
+
+        :param Track: The archived track
+        :param Partial: The compressed file
+        :returns: The track, archived in this format
+
+        """
+        Input = Track.RippedPath
+        Output = self.outputPath(Track)
+        os.replace(Partial, Output)
+        manifest.AlbumManifest(Input.parent).rename(Input, Output)
+        Input.unlink()
+        logging.debug(f'Compressed {Input} to {Output}')
+        print(f'Archived {Output}')
+
+        Compressed = AudioTrack(Output, Track.TrackInfo, Track.Checksums)
+        if isinstance(Track, TranscodedTrack):
+            return TranscodedTrack(Compressed, Track.TranscodedPath,
+                                   Track.Elapsed, Track.Fingerprint)
+        return Compressed
+
+    def compressTrack(self, Track: AudioTrack) -> AudioTrack:
+        """Compress an archived track and remove its WAV file once the
+        compressed file is shown to decode to the same audio.
+
+        :param Track: The archived track
+        :returns: The track, archived in this format
+
+        """
+        return self.replaceTrack(Track, self.encodeTrack(Track))
+
+    def submit(self, Track: AudioTrack) -> Optional[Future]:
+        """Start compressing a track on the pool shared by all drives.
+
+        :param Track: The archived track
+        :returns: A future for the compressed file, or None if the track was
+                  not archived
+
+        """
+        if Track.RippedPath is None:
+            return None
+        return utils.getPool('archive', self._Jobs).submit(self.encodeTrack,
+                                                           Track)
+
+    def finish(
+            self,
+            Track: AudioTrack,
+            Job: Optional[Future]
+    ) -> AudioTrack:
+        """Wait for a track started with submit and put it in place.  A track
+        that cannot be compressed or does not decode bit-exactly stays in the
+        archive as a WAV file.
+
+        :param Track: The archived track
+        :param Job: The future submit returned for it
+        :returns: The track as archived
+
+        """
+        if Job is None:
+            return Track
+        try:
+            return self.replaceTrack(Track, Job.result())
+        except (sh.ErrorReturnCode, ArchiveVerifyError) as Error:
+            # The WAV file is still there and still archived.
+            logging.error(f'Could not compress {Track.RippedPath}: {Error}')
+            return Track
+
+    def discard(self, Jobs: Iterable[Optional[Future]]):
+        """Wait for compressions that will not be finished and remove what
+        they wrote.
+
+        :param Jobs: The futures submit returned
+        :returns: Nothing
+
+        """
+        for Job in Jobs:
+            # A compression that failed has already removed its file.
+            if Job is None or Job.cancel() or Job.exception() is not None:
+                continue
+            Job.result().unlink(missing_ok=True)
+
+    def compress(
+            self,
+            Tracks: Iterable[AudioTrack]
+    ) -> List[AudioTrack]:
+        """Compress tracks in parallel.  Tracks that cannot be compressed or do
+        not decode bit-exactly stay in the archive as WAV files.
+
+        :param Tracks: The archived tracks
+        :returns: The tracks as archived, in the order given
+
+        """
+        Jobs = [ (Track, self.submit(Track)) for Track in Tracks ]
+        return [ self.finish(Track, Job) for Track, Job in Jobs ]
+
+class FLACCompressor(ArchiveCompressor):
+    Extension = 'flac'
+    Encoder = 'flac'
+    Decoder = 'flac'
+
+    def encodeArguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--fast', '--silent', '--force', '-o', str(Output),
+                 str(Input) ]
+
+    def decodeArguments(self, Input: Path) -> List[str]:
+        return [ '--decode', '--stdout', '--silent', '--force-raw-format',
+                 '--endian=little', '--sign=signed', str(Input) ]
+
+class WavPackCompressor(ArchiveCompressor):
+    Extension = 'wv'
+    Encoder = 'wavpack'
+    Decoder = 'wvunpack'
+
+    def encodeArguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '-f', '-q', '-y', str(Input), '-o', str(Output) ]
+
+    def decodeArguments(self, Input: Path) -> List[str]:
+        return [ '--raw', '-q', '-y', str(Input), '-' ]
+
+ArchiveCompressors: Dict[str, Type[ArchiveCompressor]] = {
+    'flac': FLACCompressor,
+    'wavpack': WavPackCompressor,
+}
+
+def createArchiveCompressor(
+        Config: config.Config
+) -> Optional[ArchiveCompressor]:
+    """Create the compressor for the configured archive format.
+
+    :param Config: The dartt config
+    :returns: The compressor, or None to archive WAV files
+
+    """
+    Format = Config.getAudioArchiveFormat()
+    if Format == 'wav':
+        return None
+
+    Compressor = ArchiveCompressors.get(Format, None)
+    if Compressor is None:
+        raise RuntimeError(f'Unknown audio archive format {Format}')
+
+    return Compressor(Config)
+
+def findArchiveCompressor(
+        TrackPath: Path,
+        Config: config.Config
+) -> Optional[ArchiveCompressor]:
+    """Find the compressor of an archived track from its extension.
+
+    :param TrackPath: The archived track
+    :param Config: The dartt config
+    :returns: The compressor, or None for a WAV file
+
+    """
+    for Compressor in ArchiveCompressors.values():
+        if Path(TrackPath).suffix == f'.{Compressor.Extension}':
+            return Compressor(Config)
+    return None
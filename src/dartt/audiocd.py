@@ -19,15 +19,31 @@
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import contextlib
 import discid
 import logging
-from typing import List
+import numpy as np
+from pathlib import Path
+import threading
+from typing import (Dict, Iterable, Iterator, List, Optional, Sequence, Tuple,
+                    Union)
 
+import dartt.analysis as analysis
+import dartt.archive as archive
 import dartt.config as config
+import dartt.cue as cue
 import dartt.device as device
 import dartt.musicbrainz as mb
 import dartt.disc as disc
+import dartt.index as index
 import dartt.ripper as ripper
+import dartt.tagging as tagging
+import dartt.transcoder as transcoder
+import dartt.verify as verify
+
+# CD TOC addresses count the two second lead-in.
+LeadInSectors = 150
 
 class AudioCD(disc.AudioDisc):
     def __init__(self, Dev: device.Device, Musicbrainz: mb.MusicBrainz):
@@ -35,21 +51,285 @@ class AudioCD(disc.AudioDisc):
         self._Musicbrainz = Musicbrainz
 
         logging.debug('Reading disc ID')
-        self._DiscIDInfo = discid.read(self._Device.path)
+        self._DiscIDInfo = self.readDiscID()
         logging.debug(f'Done reading disc ID: {self._DiscIDInfo}')
 
-        self._DiscInfo = self._Musicbrainz.getDiscInfo(self._DiscIDInfo)
-        logging.debug(f'Disc info: {self._DiscInfo}')
+        self._DiscInfoFuture: Optional['Future[mb.DiscInfo]'] = None
+        self._DiscInfoLock = threading.Lock()
+
+    def readDiscID(self) -> discid.Disc:
+        """Read the disc's TOC and compute its ID."""
+        return discid.read(self._Device.path)
+
+    def createRipper(self, Config: config.Config) -> ripper.AudioRipper:
+        """Return the ripper that reads this disc."""
+        return ripper.createAudioRipper(Config)
+
+    def lookupDiscInfo(self) -> Future:
+        """Start looking up the disc info unless it has been started already.
+        Ripping does not need the disc info, so the lookup runs while the disc
+        is read and only naming and tagging wait for it.
+
+        :returns: A future for the DiscInfo
+
+        """
+        with self._DiscInfoLock:
+            if self._DiscInfoFuture is None:
+                self._DiscInfoFuture = self._Musicbrainz.getDiscInfoAsync(
+                    self._DiscIDInfo
+                )
+            return self._DiscInfoFuture
+
+    def getDiscInfo(self) -> mb.DiscInfo:
+        """Return the disc info, waiting for the lookup if needed."""
+        return self.lookupDiscInfo().result()
+
+    @property
+    def id(self) -> str:
+        return self._DiscIDInfo.id
 
     def getTitle(self) -> str:
-        return self._DiscInfo.Title
+        return self.getDiscInfo().Title
 
     def getArtists(self) -> List[str]:
-        return self._DiscInfo.Artists
+        return self.getDiscInfo().Artists
 
     def getTrackInfo(self) -> List[mb.TrackInfo]:
-        return self._DiscInfo.Tracks
+        return self.getDiscInfo().Tracks
+
+    def getTrackNumbers(self) -> List[int]:
+        """Return the track numbers from the disc's TOC.  Unlike getTrackInfo,
+        this does not wait for the disc info lookup."""
+        return list(range(self._DiscIDInfo.first_track_num,
+                          self._DiscIDInfo.last_track_num + 1))
+
+    def getAudioTrackNumbers(self) -> List[int]:
+        """Return the numbers of the tracks that are ripped as audio."""
+        return self.getTrackNumbers()
 
     def rip(self, Config: config.Config) -> List[disc.AudioTrack]:
-        Ripper = ripper.createAudioRipper(Config)
-        return Ripper.rip(self)
+        Index = index.getArchiveIndex(Config)
+        if not Config.getOption('force', False) and Index.isArchived(self.id):
+            print(f'Audio disc {self.id} is already archived')
+            return []
+        # Archived discs are skipped without a lookup.
+        self.lookupDiscInfo()
+
+        Layout = Config.getAudioArchiveLayout()
+        if Layout not in ('tracks', 'image'):
+            raise RuntimeError(f'Unknown archive layout {Layout}')
+
+        Ripper = self.createRipper(Config)
+        Transcoder = transcoder.createAudioTranscoder(Config)
+        # An image stays a WAV file so that its tracks can be mapped.
+        Compressor = (archive.createArchiveCompressor(Config)
+                      if Layout != 'image' else None)
+        Compressing: Dict[Optional[Path], Optional[Future]] = dict()
+
+        def compress(
+                Ripped: Iterable[disc.AudioTrack]
+        ) -> Iterator[disc.AudioTrack]:
+            # Each track is compressed while the following tracks are ripped.
+            for Track in Ripped:
+                if Compressor is not None:
+                    Compressing[Track.RippedPath] = Compressor.submit(Track)
+                yield Track
+
+        Tracks: Sequence[disc.AudioTrack]
+        Archived: Sequence[disc.AudioTrack]
+        try:
+            if Layout == 'image':
+                # Tracks are transcoded from the archived image, so there is
+                # nothing to stream.
+                Archived = Ripper.ripImage(self)
+                Tracks = (Archived if Transcoder is None
+                          else Transcoder.transcode(Archived))
+            elif Transcoder is None:
+                Tracks = list(compress(Ripper.ripTracks(self)))
+            elif Config.getAudioStreaming():
+                Tracks = list(compress(Ripper.streamTracks(
+                    self, Transcoder, Config.getAudioStreamArchive()
+                )))
+            else:
+                # Each track is transcoded while the following tracks are
+                # ripped.
+                Tracks = Transcoder.transcode(compress(Ripper.ripTracks(self)))
+
+            if Layout != 'image':
+                Archived = Tracks
+
+            if Config.getAudioVerify():
+                self.verify(Config, Archived)
+
+            Gains, Silences = (self.analyze(Config, Archived)
+                               if Config.getAudioAnalyze()
+                               else (dict(), dict()))
+
+            # The WAV files are replaced once they have been verified and
+            # analyzed.
+            if Compressor is not None:
+                Tracks = [ Compressor.finish(Track,
+                                             Compressing.get(Track.RippedPath))
+                           for Track in Tracks ]
+        except BaseException:
+            if Compressor is not None:
+                Compressor.discard(Compressing.values())
+            raise
+
+        for Track in Tracks:
+            Track.setReplayGain(Gains.get(int(Track.Number), None))
+            if Track.Silence is None:
+                Track.setSilence(Silences.get(int(Track.Number), None))
+
+        # Tag last, so that each file is tagged once with everything.
+        if Config.getAudioTag():
+            tagging.tagTracks(Tracks, self.getDiscInfo(), self.id, Config)
+
+        self._indexTracks(Index, Tracks)
+        return list(Tracks)
+
+    def getAccurateRipID(self) -> verify.AccurateRipDiscID:
+        return verify.AccurateRipDiscID.fromTOC(self._DiscIDInfo.toc_string)
+
+    def getTrackOffsets(self) -> List[int]:
+        """Return the start of each track from the disc's TOC, in sectors
+        including the two second lead-in."""
+        return [ int(Field) for Field in
+                 self._DiscIDInfo.toc_string.split()[3:] ]
+
+    def verify(
+            self,
+            Config: config.Config,
+            Tracks: Iterable[disc.AudioTrack]
+    ) -> List[verify.TrackVerification]:
+        """Check archived tracks against AccurateRip.
+
+        :param Config: The dartt config
+        :param Tracks: The archived tracks of the whole disc
+        :returns: A TrackVerification for each track
+
+        """
+        Tracks = [ Track for Track in Tracks if Track.RippedPath is not None ]
+        DiscID = self.getAccurateRipID()
+        if len(Tracks) != DiscID.TrackCount:
+            # AccurateRip CRCs are only meaningful for a whole disc.
+            logging.warning(f'Cannot verify {self.id}: {len(Tracks)} of '
+                            f'{DiscID.TrackCount} tracks archived')
+            return []
+
+        with contextlib.ExitStack() as Stack:
+            Archived = sorted(
+                (int(Track.Number), self._getTrackSamples(Track, Stack))
+                for Track in Tracks
+            )
+            Results = verify.verifyDisc(Archived, DiscID,
+                                        verify.createAccurateRipClient(Config))
+        for Result in Results:
+            print(str(Result))
+        return Results
+
+    def analyze(
+            self,
+            Config: config.Config,
+            Tracks: Iterable[disc.AudioTrack]
+    ) -> Tuple[Dict[int, analysis.ReplayGain],
+               Dict[int, analysis.TrackSilence]]:
+        """Measure the loudness of archived tracks and the disc as a whole and
+        find their silence.  Tracks that start with what looks like the gap
+        after the track before them are reported, as is audio hidden before
+        the first track.
+
+        :param Config: The dartt config
+        :param Tracks: The archived tracks of the whole disc
+        :returns: The ReplayGain and the silence of each track, by number
+
+        """
+        Tracks = list(Tracks)
+        if any(Track.RippedPath is None for Track in Tracks):
+            # Streamed without an archive, so there is nothing to read.
+            logging.warning(f'Cannot measure {self.id}: tracks not archived')
+            return dict(), dict()
+
+        Threshold = Config.getAudioSilenceThreshold()
+        Gains, Silences = analysis.analyzeTracks(
+            [ (int(Track.Number), Track.getExtents()) for Track in Tracks ],
+            Config.getAudioAnalysisJobs(),
+            Threshold
+        )
+        for Number, Gain in sorted(Gains.items()):
+            print(f'Track {Number}: {Gain}, {Silences[Number]}')
+
+        for Number in analysis.findLeadingGaps(Silences):
+            Seconds = Silences[Number].Leading / analysis.SampleRate
+            logging.warning(f'Track {Number} starts with {Seconds:.2f}s of '
+                            'silence that may belong to the track before it')
+
+        Hidden = self.getHiddenTrackExtents()
+        if Hidden is not None:
+            Silence = analysis.scanSilence(Hidden, Threshold)
+            if not Silence.IsSilent:
+                print(f'Found a hidden track of '
+                      f'{Silence.Audible[1] / analysis.SampleRate:.2f}s '
+                      'before the first track')
+        elif self.getTrackOffsets()[0] > LeadInSectors:
+            Gap = self.getTrackOffsets()[0] - LeadInSectors
+            logging.info(f'The {Gap} sector gap before the first track was not '
+                         'read and may hold a hidden track')
+
+        return Gains, Silences
+
+    def getHiddenTrackExtents(self) -> Optional[List[cue.Extent]]:
+        """Return where the audio before the first track is, or None if it was
+        not read.  cdparanoia rips from the first track's index 01."""
+        return None
+
+    def _getTrackSamples(
+            self,
+            Track: disc.AudioTrack,
+            Stack: contextlib.ExitStack
+    ) -> Union[Path, np.ndarray]:
+        """Return what verify.verifyDisc needs for a track: the track's WAV
+        file, or the samples of an image track read in place from the image,
+        which stays mapped until Stack is closed."""
+        if not isinstance(Track, disc.ImageTrack):
+            return Track.RippedPath
+
+        Image = Stack.enter_context(cue.CueImage(cue.CueSheet(Track.CuePath)))
+        Views = Image.getTrackViews(int(Track.Number))
+        if Views is None:
+            raise cue.CueSheetError(Track.CuePath, f'no track {Track.Number}')
+        if len(Views) == 1:
+            return np.frombuffer(Views[0], dtype='<u4')
+        return np.frombuffer(b''.join(Views), dtype='<u4')
+
+    def _indexTracks(
+            self,
+            Index: index.ArchiveIndex,
+            Tracks: Sequence[disc.AudioTrack]
+    ):
+        """Add the disc to the index once all of its audio tracks have been
+        archived."""
+        if not Tracks or any(Track.RippedPath is None for Track in Tracks):
+            # Nothing was archived, as when streaming without an archive.
+            return
+
+        # A disc with tracks that failed to rip is not skipped next time.
+        Missing = (set(self.getAudioTrackNumbers()) -
+                   { int(Track.Number) for Track in Tracks })
+        if Missing:
+            logging.warning(f'Not indexing {self.id}: tracks '
+                            f'{", ".join(map(str, sorted(Missing)))} '
+                            'were not archived')
+            return
+
+        Info = self.getDiscInfo()
+        # The tags are kept so that a retranscode tags the same way.
+        Index.addDisc(self.id, Info.ID, Info.Title,
+                      Info.Artists[0] if Info.Artists else None, Tracks,
+                      { int(Track.Number):
+                        tagging.getTrackTags(Track, Info, self.id)
+                        for Track in Tracks })
+
+    def ripTracks(self, Config: config.Config) -> Iterator[disc.AudioTrack]:
+        Ripper = self.createRipper(Config)
+        return Ripper.ripTracks(self)
@@ -20,10 +20,12 @@
 
 import ast
 import logging
+import os
 from pathlib import Path
 import sh
 import tomli_w
 import tomllib
+from typing import Optional
 
 import dartt.utils as utils
 
@@ -240,6 +242,77 @@ class Config:
         """
         return Path('video') / 'tv'
 
+    @property
+    def defaultMusicBrainzCachePath(self):
+        """Return the default path of the MusicBrainz lookup cache.
+
+        :returns: The default MusicBrainz cache path
+
+        """
+        CacheHome = os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')
+        return Path(CacheHome) / 'dartt' / 'musicbrainz.sqlite'
+
+    @property
+    def defaultMusicBrainzCacheTTLDays(self):
+        """Return the default number of days a cached MusicBrainz lookup is
+        considered fresh.
+
+        :returns: The default cache time-to-live in days
+
+        """
+        return 30
+
+    @property
+    def defaultMusicBrainzCacheMaxEntries(self):
+        """Return the default maximum number of cached MusicBrainz lookups.
+
+        :returns: The default cache size
+
+        """
+        return 10000
+
+    @property
+    def defaultAccurateRipURL(self):
+        """Return the default AccurateRip database URL.
+
+        :returns: The default AccurateRip URL
+
+        """
+        return 'http://www.accuraterip.com/accuraterip'
+
+    @property
+    def defaultArchiveIndexPath(self):
+        """Return the default path of the archive index.
+
+        :returns: The default archive index path
+
+        """
+        DataHome = os.environ.get('XDG_DATA_HOME',
+                                  Path.home() / '.local' / 'share')
+        return Path(DataHome) / 'dartt' / 'archive.sqlite'
+
+    @property
+    def defaultDriveCapabilitiesPath(self):
+        """Return the default path of the drive capability store.
+
+        :returns: The default drive capability store path
+
+        """
+        DataHome = os.environ.get('XDG_DATA_HOME',
+                                  Path.home() / '.local' / 'share')
+        return Path(DataHome) / 'dartt' / 'drives.toml'
+
+    @property
+    def defaultRetranscodeCheckpointPath(self):
+        """Return the default path of the retranscode checkpoint.
+
+        :returns: The default retranscode checkpoint path
+
+        """
+        DataHome = os.environ.get('XDG_DATA_HOME',
+                                  Path.home() / '.local' / 'share')
+        return Path(DataHome) / 'dartt' / 'retranscode.log'
+
     def __init__(self):
         """Construct a Config object.  This reads config items from a hierarchy
         of files, with later reads overwriting values from earlier reads.  The
@@ -254,6 +327,7 @@ class Config:
         """
 
         self._items = dict()
+        self._options = dict()
 
         if not any(Config.exists() for Config in self.configSearchPaths):
             if utils.yesno('No configuration found, create one'):
@@ -294,6 +368,89 @@ class Config:
     def getAudioArchiveDir(self) -> str:
         return self._items['audio']['archive_output_dir']
 
+    def getAudioTranscodeDir(self) -> str:
+        return self._items['audio']['transcode_output_dir']
+
+    def getAudioQuality(self) -> str:
+        return self._items['audio']['quality'] or self.defaultQuality
+
+    def getAudioStreaming(self) -> bool:
+        """Return whether to pipe the ripper straight into the transcoder
+        instead of archiving WAV files and transcoding those."""
+        return self._items['audio'].get('streaming', False)
+
+    def getAudioStreamArchive(self) -> bool:
+        """Return whether to also archive WAV files when streaming."""
+        return self._items['audio'].get('stream_archive', False)
+
+    def getAudioTranscodeJobs(self) -> int:
+        """Return the maximum number of concurrent audio transcodes."""
+        return self._items['audio'].get('transcode_jobs', os.cpu_count() or 1)
+
+    def getAudioArchiveFormat(self) -> str:
+        """Return the format of archived tracks: 'wav', 'flac' or
+        'wavpack'."""
+        return self._items['audio'].get('archive_format', 'wav')
+
+    def getAudioArchiveLayout(self) -> str:
+        """Return 'tracks' to archive a WAV file per track, or 'image' to
+        archive a WAV image of each disc with a CUE sheet."""
+        return self._items['audio'].get('archive_layout', 'tracks')
+
+    def getAudioArchiveEncoder(self) -> Optional[str]:
+        """Return the command that compresses archived tracks, or None for the
+        format's usual command."""
+        return self._items['audio'].get('archive_encoder', None)
+
+    def getAudioArchiveDecoder(self) -> Optional[str]:
+        """Return the command that decompresses archived tracks, or None for
+        the format's usual command."""
+        return self._items['audio'].get('archive_decoder', None)
+
+    def getAudioRipMode(self) -> str:
+        """Return 'paranoia' to read every track with full paranoia, or
+        'adaptive' to burst read and use paranoia only where needed."""
+        return self._items['audio'].get('rip_mode', 'paranoia')
+
+    def getAudioVerify(self) -> bool:
+        """Return whether to check rips against AccurateRip."""
+        return self._items['audio'].get('verify', False)
+
+    def getAudioAnalyze(self) -> bool:
+        """Return whether to measure the loudness of rips for ReplayGain."""
+        return self._items['audio'].get('analyze', False)
+
+    def getAudioAnalysisJobs(self) -> int:
+        """Return the maximum number of processes measuring loudness."""
+        return self._items['audio'].get('analysis_jobs', os.cpu_count() or 1)
+
+    def getAudioSilenceThreshold(self) -> float:
+        """Return the RMS level in dBFS below which audio is silent."""
+        return float(self._items['audio'].get('silence_threshold', -60.0))
+
+    def getAudioTrimSilence(self) -> bool:
+        """Return whether to leave the silence at the ends of tracks out of
+        transcodes.  Archived tracks are never trimmed."""
+        return self._items['audio'].get('trim_silence', False)
+
+    def getAudioSkipSilentTracks(self) -> bool:
+        """Return whether to not transcode tracks that are entirely
+        silent."""
+        return self._items['audio'].get('skip_silent_tracks', False)
+
+    def getAudioTag(self) -> bool:
+        """Return whether to tag transcoded tracks."""
+        return self._items['audio'].get('tag', True)
+
+    def getAudioTagPadding(self) -> int:
+        """Return the padding to leave after tags so that they can be
+        rewritten in place, in bytes."""
+        return int(self._items['audio'].get('tag_padding', 16384))
+
+    def getAccurateRipURL(self) -> str:
+        return self._items['audio'].get('accuraterip_url',
+                                        self.defaultAccurateRipURL)
+
     def getVideoRipperType(self) -> str:
         return Path(self._items['video']['ripper']).name
 
@@ -309,6 +466,56 @@ class Config:
     def getVideoArchiveDir(self) -> str:
         return self._items['video']['archive_output_dir']
 
+    def getMusicBrainzCachePath(self) -> str:
+        return self._items['musicbrainz'].get(
+            'cache_file',
+            str(self.defaultMusicBrainzCachePath)
+        )
+
+    def getMusicBrainzCacheTTL(self) -> int:
+        """Return the time a cached MusicBrainz lookup is fresh, in seconds."""
+        return 86400 * self._items['musicbrainz'].get(
+            'cache_ttl_days',
+            self.defaultMusicBrainzCacheTTLDays
+        )
+
+    def getMusicBrainzCacheMaxEntries(self) -> int:
+        return self._items['musicbrainz'].get(
+            'cache_max_entries',
+            self.defaultMusicBrainzCacheMaxEntries
+        )
+
+    def getArchiveIndexPath(self) -> str:
+        return self._items.get('index_file', str(self.defaultArchiveIndexPath))
+
+    def getRetranscodeCheckpointPath(self) -> str:
+        return self._items.get('retranscode_checkpoint_file',
+                               str(self.defaultRetranscodeCheckpointPath))
+
+    def getDriveCapabilitiesPath(self) -> str:
+        return self._items.get('drives_file',
+                               str(self.defaultDriveCapabilitiesPath))
+
+    def setOption(self, Name: str, Value):
+        """Set a command-line option.  Options are not written to config files.
+
+        :param Name: The option name
+        :param Value: The option value
+        :returns: Nothing
+
+        """
+        self._options[Name] = Value
+
+    def getOption(self, Name: str, Default = None):
+        """Get a command-line option.
+
+        :param Name: The option name
+        :param Default: The value to return if the option was not given
+        :returns: The option value
+
+        """
+        return self._options.get(Name, Default)
+
     def _update(self, ConfigPath):
         """Update the config file in the user's home directory.
 
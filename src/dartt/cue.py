@@ -0,0 +1,516 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Read CUE sheets and lay out the tracks of the disc images they describe.
+"""
+
+import mmap
+from pathlib import Path
+import re
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Bytes per sector of each CUE track mode.
+SectorSizes = {
+    'AUDIO': 2352,
+    'CDG': 2448,
+    'MODE1/2048': 2048,
+    'MODE1/2352': 2352,
+    'MODE2/2048': 2048,
+    'MODE2/2324': 2324,
+    'MODE2/2336': 2336,
+    'MODE2/2352': 2352,
+    'CDI/2336': 2336,
+    'CDI/2352': 2352,
+}
+
+FramesPerSecond = 75
+
+class CueSheetError(RuntimeError):
+    def __init__(self, CuePath: Path, Msg: str):
+        super().__init__(f'{CuePath}: {Msg}')
+
+def getWavHeader(
+        Size: int
+) -> bytes:
+    """Return the header of a CD audio WAV file.
+
+    :param Size: The number of bytes of audio that follow it
+    :returns: The header
+
+    """
+    return (b'RIFF' + struct.pack('<I', Size + 36) + b'WAVEfmt ' +
+            struct.pack('<IHHIIHH', 16, 1, 2, 44100, 176400, 4, 16) +
+            b'data' + struct.pack('<I', Size))
+
+def getWavDataRange(
+        WavPath: Path
+) -> Tuple[int, int]:
+    """Find the audio in a WAV file.
+
+    :param WavPath: The WAV file
+    :returns: The offset and size of its data chunk
+
+    """
+    with open(WavPath, 'rb') as File:
+        Riff, _, Wave = struct.unpack('<4sI4s', File.read(12))
+        if Riff != b'RIFF' or Wave != b'WAVE':
+            raise ValueError(f'{WavPath} is not a WAV file')
+        while True:
+            Header = File.read(8)
+            if len(Header) < 8:
+                raise ValueError(f'{WavPath} has no data chunk')
+            Name, Size = struct.unpack('<4sI', Header)
+            if Name == b'data':
+                return File.tell(), Size
+            File.seek(Size + (Size & 1), 1)
+
+def formatMSF(
+        Frames: int
+) -> str:
+    """Convert frames to an MM:SS:FF time.
+
+    :param Frames: The number of frames
+    :returns: The time
+
+    """
+    Seconds, Frames = divmod(Frames, FramesPerSecond)
+    return f'{Seconds // 60:02}:{Seconds % 60:02}:{Frames:02}'
+
+# A word of a CUE sheet line: a double quoted string, which may be left
+# unterminated, or a run of anything but white space.
+_CueWord = re.compile(r'"([^"]*)"?|(\S+)')
+
+def splitCueLine(
+        Line: str
+) -> List[str]:
+    """Split a line of a CUE sheet into words.  Only double quotes group words,
+    and there are no escapes, so apostrophes and backslashes in titles and
+    file names are kept as they are.
+
+    :param Line: The line
+    :returns: The words of the line
+
+    """
+    return [ Word or Quoted for Quoted, Word in _CueWord.findall(Line) ]
+
+def parseMSF(
+        Text: str
+) -> int:
+    """Convert an MM:SS:FF time to frames.
+
+    :param Text: The time
+    :returns: The number of frames
+
+    """
+    Minutes, Seconds, Frames = (int(Part) for Part in Text.split(':'))
+    return (Minutes * 60 + Seconds) * FramesPerSecond + Frames
+
+class CueTrack:
+    """A track of a CUE sheet.  Indices are in frames from the start of the
+    track's file."""
+    def __init__(
+            self,
+            Number: int,
+            Mode: str,
+            FilePath: Path
+    ):
+        self._Number = Number
+        self._Mode = Mode
+        self._Path = FilePath
+        self._Indices: Dict[int, int] = dict()
+        self._Pregap = 0
+        self._Start = 0
+
+    @property
+    def Number(self) -> int:
+        return self._Number
+
+    @property
+    def Mode(self) -> str:
+        return self._Mode
+
+    @property
+    def path(self) -> Path:
+        return self._Path
+
+    @property
+    def Indices(self) -> Dict[int, int]:
+        return self._Indices
+
+    @property
+    def Pregap(self) -> int:
+        """Frames of silence before the track that are not in its file."""
+        return self._Pregap
+
+    @property
+    def Start(self) -> int:
+        """The address of the track on the disc, once laid out."""
+        return self._Start
+
+    @property
+    def SectorSize(self) -> int:
+        return SectorSizes[self._Mode]
+
+    @property
+    def IsAudio(self) -> bool:
+        return self._Mode == 'AUDIO'
+
+    def __repr__(self) -> str:
+        return f'{self._Number}: {self._Mode} {self._Path.name} {self._Indices}'
+
+# A byte range of an image file, or of silence when the path is None.
+Extent = Tuple[Optional[Path], int, int]
+
+class CueSheet:
+    """A parsed CUE sheet.  Image files may be raw binary, as disc imaging tools
+    write, or CD audio WAV files, as rippers write."""
+    def __init__(
+            self,
+            CuePath: Path
+    ):
+        """Construct a CueSheet, reading the sheet and sizing its files.
+
+        :param CuePath: The CUE sheet
+        :returns: A CueSheet
+
+        """
+        self._Path = Path(CuePath)
+        # The offset and size of the audio or data in each file.
+        self._Files: Dict[Path, Tuple[int, int]] = dict()
+        self._Tracks = self._parse(self._Path.read_text(errors='replace'))
+        if not self._Tracks:
+            raise CueSheetError(self._Path, 'no tracks')
+        self._LeadOut = self._layOut()
+
+    def _parse(
+            self,
+            Text: str
+    ) -> List[CueTrack]:
+        Tracks = []
+        FilePath = None
+        for Line in Text.splitlines():
+            Words = splitCueLine(Line)
+            if not Words:
+                continue
+            Command = Words[0].upper()
+            try:
+                if Command == 'FILE':
+                    if len(Words) < 3 or Words[2].upper() not in ('BINARY',
+                                                                  'WAVE'):
+                        raise CueSheetError(self._Path,
+                                            f'unsupported file: {Line.strip()}')
+                    FilePath = self._Path.parent / Words[1]
+                    self._Files[FilePath] = self._getFileRange(FilePath,
+                                                               Words[2].upper())
+                elif Command == 'TRACK':
+                    if FilePath is None:
+                        raise CueSheetError(self._Path, 'TRACK before FILE')
+                    Mode = Words[2].upper()
+                    if Mode not in SectorSizes:
+                        raise CueSheetError(self._Path,
+                                            f'unknown track mode {Mode}')
+                    Tracks.append(CueTrack(int(Words[1]), Mode, FilePath))
+                elif Command == 'INDEX':
+                    if not Tracks or Tracks[-1].path != FilePath:
+                        # Sheets that split a track's indices across files are
+                        # not supported.
+                        raise CueSheetError(self._Path, 'INDEX outside a track')
+                    Tracks[-1]._Indices[int(Words[1])] = parseMSF(Words[2])
+                elif Command == 'PREGAP' and Tracks:
+                    Tracks[-1]._Pregap = parseMSF(Words[1])
+            except (IndexError, ValueError):
+                raise CueSheetError(self._Path,
+                                    f'malformed line: {Line.strip()}') from None
+
+        for Track in Tracks:
+            if 1 not in Track.Indices:
+                raise CueSheetError(self._Path,
+                                    f'track {Track.Number} has no INDEX 01')
+        return Tracks
+
+    def _layOut(self) -> int:
+        """Give each track its address on the disc.  Files follow each other
+        on the disc in the order the sheet names them.
+
+        :returns: The address of the lead-out
+
+        """
+        FileStart = 0
+        Shift = 0
+        for Position, Track in enumerate(self._Tracks):
+            if Position > 0 and Track.path != self._Tracks[Position - 1].path:
+                FileStart += self._getFileSectors(Position - 1)
+            Shift += Track.Pregap
+            Track._Start = FileStart + Shift + Track.Indices[1]
+        return FileStart + Shift + self._getFileSectors(len(self._Tracks) - 1)
+
+    def _getFileRange(
+            self,
+            FilePath: Path,
+            Type: str
+    ) -> Tuple[int, int]:
+        try:
+            if Type == 'WAVE':
+                return getWavDataRange(FilePath)
+            return 0, FilePath.stat().st_size
+        except FileNotFoundError:
+            raise CueSheetError(self._Path, f'missing {FilePath}') from None
+        except (ValueError, struct.error) as Error:
+            raise CueSheetError(self._Path, f'{Error}') from None
+
+    def _getFileSectors(
+            self,
+            Position: int
+    ) -> int:
+        Track = self._Tracks[Position]
+        return self._Files[Track.path][1] // Track.SectorSize
+
+    @property
+    def path(self) -> Path:
+        return self._Path
+
+    @property
+    def Tracks(self) -> List[CueTrack]:
+        return self._Tracks
+
+    @property
+    def FirstTrack(self) -> int:
+        return self._Tracks[0].Number
+
+    @property
+    def LastTrack(self) -> int:
+        return self._Tracks[-1].Number
+
+    @property
+    def Offsets(self) -> List[int]:
+        """The address of each track, as in a TOC."""
+        return [ Track.Start for Track in self._Tracks ]
+
+    @property
+    def LeadOut(self) -> int:
+        return self._LeadOut
+
+    def getTrack(
+            self,
+            Number: int
+    ) -> Optional[CueTrack]:
+        for Track in self._Tracks:
+            if Track.Number == Number:
+                return Track
+        return None
+
+    def getExtents(
+            self,
+            Number: int
+    ) -> Optional[List[Extent]]:
+        """Return where the audio of a track is in the image.  As on a CD,
+        the track runs from its index 01 to the next track's index 01, so the
+        gap before a track belongs to the track before it.
+
+        :param Number: The track number
+        :returns: The byte ranges of the track in order, or None if it is not
+                  an audio track
+
+        """
+        Track = self.getTrack(Number)
+        if Track is None or not Track.IsAudio:
+            return None
+
+        Position = self._Tracks.index(Track)
+        Next = (self._Tracks[Position + 1]
+                if Position + 1 < len(self._Tracks) else None)
+        Size = Track.SectorSize
+        Base, Length = self._Files[Track.path]
+        Start = Base + Track.Indices[1] * Size
+        if Next is not None and Next.path == Track.path:
+            End = Base + min(Next.Indices.values()) * Size
+        else:
+            End = Base + Length // Size * Size
+        Extents: List[Extent] = [ (Track.path, Start, End - Start) ]
+        if Next is None:
+            return Extents
+
+        if Next.Pregap:
+            Extents.append((None, 0, Next.Pregap * Size))
+        Gap = min(Next.Indices.values())
+        if Gap < Next.Indices[1]:
+            Extents.append((Next.path,
+                            self._Files[Next.path][0] + Gap * Next.SectorSize,
+                            (Next.Indices[1] - Gap) * Next.SectorSize))
+
+        return mergeExtents(Extents)
+
+    def getHiddenExtents(self) -> Optional[List[Extent]]:
+        """Return where the audio before the first track's index 01 is in the
+        image.  A hidden track before the first track lives there.
+
+        :returns: The byte range of the audio, or None if there is none
+
+        """
+        Track = self._Tracks[0]
+        if not Track.IsAudio or Track.Indices[1] == 0:
+            return None
+        Base, _ = self._Files[Track.path]
+        return [ (Track.path, Base, Track.Indices[1] * Track.SectorSize) ]
+
+def mergeExtents(
+        Extents: Sequence[Extent]
+) -> List[Extent]:
+    """Join extents that follow each other in the same file."""
+    Merged = [ Extents[0] ]
+    for FilePath, Offset, Length in Extents[1:]:
+        Last = Merged[-1]
+        if (FilePath is not None and FilePath == Last[0] and
+            Offset == Last[1] + Last[2]):
+            Merged[-1] = (FilePath, Last[1], Last[2] + Length)
+        else:
+            Merged.append((FilePath, Offset, Length))
+    return Merged
+
+def sliceExtents(
+        Extents: Sequence[Extent],
+        Start: int,
+        Length: int
+) -> List[Extent]:
+    """Return part of the audio in some extents.
+
+    :param Extents: The byte ranges of the audio
+    :param Start: The first byte of the part, counted through the extents
+    :param Length: The number of bytes in the part
+    :returns: The byte ranges of the part
+
+    """
+    Sliced = []
+    for FilePath, Offset, Size in Extents:
+        Skip = min(Start, Size)
+        Take = min(Size - Skip, Length)
+        if Take > 0:
+            Sliced.append((FilePath,
+                           Offset + Skip if FilePath is not None else 0, Take))
+        Start -= Skip
+        Length -= Take
+    return Sliced
+
+class CueImage:
+    """The audio of each track of a disc image, served as views of the memory
+    mapped image files so that no track is ever copied.  Without a sheet, it
+    serves any extents of WAV or BIN files.  Views must be released before the
+    image is closed, or the maps stay open until the last view is freed."""
+    def __init__(
+            self,
+            Sheet: Optional[CueSheet] = None
+    ):
+        self._Sheet = Sheet
+        self._Maps: Dict[Path, mmap.mmap] = dict()
+
+    def __enter__(self) -> 'CueImage':
+        return self
+
+    def __exit__(self, *Args):
+        self.close()
+
+    def _getMap(
+            self,
+            FilePath: Path
+    ) -> mmap.mmap:
+        Map = self._Maps.get(FilePath, None)
+        if Map is None:
+            with open(FilePath, 'rb') as File:
+                Map = mmap.mmap(File.fileno(), 0, access=mmap.ACCESS_READ)
+            self._Maps[FilePath] = Map
+        return Map
+
+    def getTrackViews(
+            self,
+            Number: int
+    ) -> Optional[List[memoryview]]:
+        """Return the audio of a track.
+
+        :param Number: The track number
+        :returns: Views of the track's audio in order, or None if it is not an
+                  audio track
+
+        """
+        if self._Sheet is None:
+            raise RuntimeError('an image without a CUE sheet has no tracks')
+        Extents = self._Sheet.getExtents(Number)
+        if Extents is None:
+            return None
+        return self.getViews(Extents)
+
+    def getViews(
+            self,
+            Extents: Sequence[Extent]
+    ) -> List[memoryview]:
+        """Return the audio in some extents of the image's files.
+
+        :param Extents: The byte ranges of the audio
+        :returns: Views of the audio in order
+
+        """
+        return [ memoryview(bytes(Length)) if FilePath is None
+                 else memoryview(self._getMap(FilePath))[Offset:Offset + Length]
+                 for FilePath, Offset, Length in Extents ]
+
+    def close(self):
+        for Map in self._Maps.values():
+            try:
+                Map.close()
+            except BufferError:
+                # A view is still in use.  The map closes when it is freed.
+                pass
+        self._Maps.clear()
+
+def writeCueSheet(
+        CuePath: Path,
+        ImagePath: Path,
+        Tracks: Sequence[Tuple[int, int, str, str]],
+        Title: str,
+        Performer: str
+):
+    """Write a CUE sheet for a WAV image of a whole disc.
+
+    :param CuePath: The CUE sheet to write
+    :param ImagePath: The image, which must be beside the sheet
+    :param Tracks: The number, start in sectors from the start of the image,
+                   title and performer of each track
+    :param Title: The title of the disc
+    :param Performer: The performer of the disc
+    :returns: Nothing
+
+    """
+    def quote(Text: str) -> str:
+        # CUE sheets have no escapes.
+        return '"' + f'{Text}'.replace('"', "'") + '"'
+
+    Lines = [ f'PERFORMER {quote(Performer)}',
+              f'TITLE {quote(Title)}',
+              f'FILE {quote(Path(ImagePath).name)} WAVE' ]
+    for Number, Start, TrackTitle, TrackPerformer in Tracks:
+        Lines += [ f'  TRACK {Number:02} AUDIO',
+                   f'    TITLE {quote(TrackTitle)}',
+                   f'    PERFORMER {quote(TrackPerformer)}',
+                   f'    INDEX 01 {formatMSF(Start)}' ]
+
+    Temp = Path(CuePath).with_suffix('.tmp')
+    Temp.write_text('\n'.join(Lines) + '\n')
+    Temp.replace(CuePath)
@@ -26,6 +26,7 @@ import sh
 from typing import Iterable
 
 import dartt.config as config
+from dartt.drives import DriveCapabilities
 
 class DeviceNotReadyError(RuntimeError):
     def __init__(self, DevPath: str):
@@ -39,6 +40,15 @@ class Device(ABC):
     def id(self):
         pass
 
+    @property
+    def path(self) -> str:
+        """The device node, or an empty string if there is none."""
+        return ''
+
     @abstractmethod
     def open(self):
         pass
+
+    @property
+    def Capabilities(self) -> DriveCapabilities:
+        return DriveCapabilities()
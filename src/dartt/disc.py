@@ -22,13 +22,16 @@ from abc import ABC, abstractmethod
 import discid
 from pathlib import Path
 import logging
+from typing import Dict, List, Optional
 
+import dartt.analysis as analysis
 import dartt.config as config
+import dartt.cue as cue
 import dartt.musicbrainz as mb
 import dartt.device as device
 
 class Track:
-    def __init__(self, Archive: Path):
+    def __init__(self, Archive: Optional[Path]):
         self._Archive = Archive
 
     @property
@@ -36,9 +39,47 @@ class Track:
         return self._Archive
 
 class AudioTrack(Track):
-    def __init__(self, ArchivePath: str, TrackInfo: mb.TrackInfo):
+    def __init__(
+            self,
+            ArchivePath: Optional[Path],
+            TrackInfo: mb.TrackInfo,
+            Checksums: Optional[Dict[str, str]] = None
+    ):
         super().__init__(ArchivePath)
         self._TrackInfo = TrackInfo
+        self._Checksums = Checksums if Checksums is not None else dict()
+        self._ReplayGain: Optional[analysis.ReplayGain] = None
+        self._Silence: Optional[analysis.TrackSilence] = None
+
+    @property
+    def TrackInfo(self) -> mb.TrackInfo:
+        return self._TrackInfo
+
+    @property
+    def Checksums(self) -> Dict[str, str]:
+        """The checksums of the archived track, by algorithm."""
+        return self._Checksums
+
+    @property
+    def ReplayGain(self) -> Optional[analysis.ReplayGain]:
+        """The loudness of the track, if it was measured."""
+        return self._ReplayGain
+
+    def setReplayGain(self, Gain: Optional[analysis.ReplayGain]):
+        self._ReplayGain = Gain
+
+    @property
+    def Silence(self) -> Optional[analysis.TrackSilence]:
+        """Where the track is silent, if it was scanned."""
+        return self._Silence
+
+    def setSilence(self, Silence: Optional[analysis.TrackSilence]):
+        self._Silence = Silence
+
+    def getExtents(self) -> List[cue.Extent]:
+        """Return where the audio of the archived track is."""
+        Offset, Size = cue.getWavDataRange(self.RippedPath)
+        return [ (Path(self.RippedPath), Offset, Size) ]
 
     @property
     def Number(self):
@@ -55,6 +96,38 @@ class AudioTrack(Track):
     def __repr__(self) -> str:
         return f'{self._Archive}: {self.Number}. {self.Title} - {self.Artist}'
 
+class ImageTrack(AudioTrack):
+    """A track archived as part of a WAV image of the whole disc, found through
+    the image's CUE sheet."""
+    def __init__(
+            self,
+            ImagePath: Path,
+            CuePath: Path,
+            TrackInfo: mb.TrackInfo,
+            Checksums: Optional[Dict[str, str]] = None
+    ):
+        super().__init__(ImagePath, TrackInfo, Checksums)
+        self._CuePath = CuePath
+
+    @property
+    def CuePath(self) -> Path:
+        return self._CuePath
+
+    @property
+    def Name(self) -> str:
+        """The name the track would have as a file of its own."""
+        return f'{self.Number:>02}. {self.Title}'
+
+    def getExtents(self) -> List[cue.Extent]:
+        Extents = cue.CueSheet(self._CuePath).getExtents(int(self.Number))
+        if Extents is None:
+            raise cue.CueSheetError(self._CuePath, f'no track {self.Number}')
+        return Extents
+
+    def __repr__(self) -> str:
+        return (f'{self._Archive} ({self._CuePath.name}): {self.Number}. '
+                f'{self.Title} - {self.Artist}')
+
 class VideoTrack(Track):
     def __init__(self, Config):
         pass
@@ -63,6 +136,14 @@ class Disc(ABC):
     def __init__(self, Dev: device.Device):
         self._Device = Dev
 
+    @property
+    def id(self) -> str:
+        return self._Device.id
+
+    @property
+    def device(self) -> device.Device:
+        return self._Device
+
     def rip(self, Config):
         return []
 
@@ -82,6 +163,23 @@ class AudioDisc(Disc):
     def getTrackInfo(self):
         pass
 
+    @abstractmethod
+    def getTrackNumbers(self):
+        pass
+
+    @abstractmethod
+    def getAccurateRipID(self):
+        pass
+
+    @abstractmethod
+    def getTrackOffsets(self):
+        pass
+
+    def getTrackExtents(self, Number: int) -> Optional[List[cue.Extent]]:
+        """Return where the audio of a track is in an image of the disc, or
+        None if the disc is not an image."""
+        return None
+
 class VideoDisc(Disc):
     def __init__(self, Dev: device.Device):
         super().__init__(Dev)
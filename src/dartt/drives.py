@@ -0,0 +1,181 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+What is known about each model of optical drive.
+"""
+
+import logging
+import os
+from pathlib import Path
+import threading
+import tomllib
+import weakref
+from typing import Dict, Optional
+
+import tomli_w
+
+import dartt.config as config
+
+class DriveCapabilities:
+    """The properties of a drive model that affect ripping."""
+    def __init__(
+            self,
+            ReadOffset: int = 0,
+            C2: bool = False,
+            ReadSpeed: Optional[int] = None
+    ):
+        """Construct a DriveCapabilities.
+
+        :param ReadOffset: The samples to add to every read so that the audio
+                           lines up with other drives
+        :param C2: Whether the drive reports C2 error pointers
+        :param ReadSpeed: The fastest speed the drive reads audio accurately at,
+                          or None to let the drive choose
+        :returns: A DriveCapabilities
+
+        """
+        self._ReadOffset = ReadOffset
+        self._C2 = C2
+        self._ReadSpeed = ReadSpeed
+
+    @property
+    def ReadOffset(self) -> int:
+        return self._ReadOffset
+
+    @property
+    def C2(self) -> bool:
+        return self._C2
+
+    @property
+    def ReadSpeed(self) -> Optional[int]:
+        return self._ReadSpeed
+
+    def toDict(self) -> dict:
+        Entry = { 'read_offset': self._ReadOffset, 'c2': self._C2 }
+        if self._ReadSpeed is not None:
+            Entry['read_speed'] = self._ReadSpeed
+        return Entry
+
+    @classmethod
+    def fromDict(cls, Entry: dict):
+        return cls(Entry.get('read_offset', 0), Entry.get('c2', False),
+                   Entry.get('read_speed', None))
+
+    def __eq__(self, Other) -> bool:
+        return (isinstance(Other, DriveCapabilities) and
+                self.toDict() == Other.toDict())
+
+    def __repr__(self) -> str:
+        return (f'read offset {self.ReadOffset:+d}, '
+                f'C2 {"yes" if self.C2 else "no"}, '
+                f'read speed {self.ReadSpeed or "auto"}')
+
+def getModelKey(Vendor: str, Model: str) -> str:
+    """Return the key for a drive model.  udev replaces spaces with
+    underscores, so this does the same for names from elsewhere."""
+    return f'{Vendor.strip()} {Model.strip()}'.strip().replace(' ', '_')
+
+class DriveCapabilityStore:
+    """Keep the capabilities of each drive model in a TOML file, one table per
+    model keyed by the udev ID_VENDOR and ID_MODEL."""
+    def __init__(
+            self,
+            StorePath: Path
+    ):
+        """Construct a DriveCapabilityStore, loading the file if it exists.
+
+        :param StorePath: The path to the TOML file
+        :returns: A DriveCapabilityStore
+
+        """
+        self._Path = Path(StorePath)
+        self._Lock = threading.Lock()
+        self._Models: Dict[str, dict] = dict()
+        try:
+            with open(self._Path, 'rb') as File:
+                self._Models = tomllib.load(File)
+        except FileNotFoundError:
+            pass
+        except tomllib.TOMLDecodeError as Error:
+            logging.warning(f'Ignoring unreadable drive file {self._Path}: '
+                            f'{Error}')
+
+    def get(
+            self,
+            Vendor: str,
+            Model: str
+    ) -> DriveCapabilities:
+        """Return the capabilities of a drive model.
+
+        :param Vendor: The udev ID_VENDOR of the drive
+        :param Model: The udev ID_MODEL of the drive
+        :returns: The capabilities, or the defaults for an unknown model
+
+        """
+        with self._Lock:
+            Entry = self._Models.get(getModelKey(Vendor, Model), None)
+        if Entry is None:
+            return DriveCapabilities()
+        return DriveCapabilities.fromDict(Entry)
+
+    def set(
+            self,
+            Vendor: str,
+            Model: str,
+            Capabilities: DriveCapabilities
+    ):
+        """Record the capabilities of a drive model.
+
+        :param Vendor: The udev ID_VENDOR of the drive
+        :param Model: The udev ID_MODEL of the drive
+        :param Capabilities: The capabilities to record
+        :returns: Nothing
+
+        """
+        with self._Lock:
+            self._Models[getModelKey(Vendor, Model)] = Capabilities.toDict()
+            self._Path.parent.mkdir(parents=True, exist_ok=True)
+            Temp = self._Path.with_suffix('.tmp')
+            with open(Temp, 'wb') as File:
+                tomli_w.dump(self._Models, File)
+            os.replace(Temp, self._Path)
+
+_Stores: 'weakref.WeakKeyDictionary[config.Config, DriveCapabilityStore]' = (
+    weakref.WeakKeyDictionary()
+)
+_StoresLock = threading.Lock()
+
+def getDriveCapabilityStore(Config: config.Config) -> DriveCapabilityStore:
+    """Return the drive capability store shared by everything using Config,
+    loading it on first use.
+
+    :param Config: The dartt config
+    :returns: The shared DriveCapabilityStore
+
+    """
+    with _StoresLock:
+        Store = _Stores.get(Config, None)
+        if Store is None:
+            Store = DriveCapabilityStore(
+                Path(Config.getDriveCapabilitiesPath())
+            )
+            _Stores[Config] = Store
+        return Store
@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Disc images as devices, so that images go through the same pipeline as discs.
+"""
+
+import discid
+from pathlib import Path
+import struct
+from typing import List, Optional, Set
+
+import dartt.config as config
+import dartt.cue as cue
+from dartt.audiocd import AudioCD, LeadInSectors
+from dartt.device import Device, DeviceNotReadyError
+from dartt.disc import Disc
+import dartt.ripper as ripper
+
+# The size of a data sector in an ISO image.
+ISOSectorSize = 2048
+
+def getISORootNames(
+        ImagePath: Path
+) -> Set[str]:
+    """Return the names in the root directory of an ISO 9660 image.
+
+    :param ImagePath: The image
+    :returns: The names, or an empty set if the image has no ISO 9660
+              filesystem
+
+    """
+    with open(ImagePath, 'rb') as Image:
+        Image.seek(16 * ISOSectorSize)
+        Descriptor = Image.read(ISOSectorSize)
+        if len(Descriptor) < 190 or Descriptor[0:6] != b'\x01CD001':
+            return set()
+
+        Root = Descriptor[156:190]
+        Extent, = struct.unpack_from('<I', Root, 2)
+        Size, = struct.unpack_from('<I', Root, 10)
+        Image.seek(Extent * ISOSectorSize)
+        Directory = Image.read(Size)
+
+    Names = set()
+    Position = 0
+    while Position < len(Directory):
+        Length = Directory[Position]
+        if Length == 0:
+            # Records do not cross sectors; the rest of this one is padding.
+            Position = (Position // ISOSectorSize + 1) * ISOSectorSize
+            continue
+        NameLength = Directory[Position + 32]
+        Name = Directory[Position + 33:Position + 33 + NameLength]
+        if Name not in (b'\x00', b'\x01'):
+            Names.add(Name.decode('ascii', 'replace').split(';')[0].upper())
+        Position += Length
+    return Names
+
+class ImageDevice(Device):
+    """A BIN/CUE or ISO image standing in for a drive with a disc in it."""
+    def __init__(self, ImagePath: Path, Config: config.Config):
+        import dartt.musicbrainz as mb
+        self._Path = Path(ImagePath)
+        self._Config = Config
+        self._Musicbrainz = mb.getMusicBrainz(Config)
+
+    def __repr__(self) -> str:
+        return f'{self._Path.name}'
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    @property
+    def id(self) -> str:
+        return f'{self._Path}'
+
+    @property
+    def path(self) -> str:
+        return f'{self._Path}'
+
+    @property
+    def hasMedia(self) -> bool:
+        return self._Path.exists()
+
+    def open(self) -> Disc:
+        if not self.hasMedia:
+            raise DeviceNotReadyError(self.path)
+
+        Suffix = self._Path.suffix.lower()
+        if Suffix == '.cue':
+            return ImageAudioCD(self, self._Musicbrainz)
+        if Suffix == '.iso':
+            Names = getISORootNames(self._Path)
+            if 'VIDEO_TS' in Names:
+                from dartt.dvd import DVD
+                return DVD(self)
+            if 'BDMV' in Names:
+                from dartt.bluray import BluRay
+                return BluRay(self)
+
+        raise DeviceNotReadyError(self.path)
+
+class ImageAudioCD(AudioCD):
+    """An audio CD read from a BIN/CUE image.  The disc ID comes from the CUE
+    sheet's TOC and the tracks are copied out of the BIN files."""
+    def __init__(self, Dev: ImageDevice, Musicbrainz):
+        self._CueSheet = cue.CueSheet(Path(Dev.path))
+        super().__init__(Dev, Musicbrainz)
+
+    @property
+    def CueSheet(self) -> cue.CueSheet:
+        return self._CueSheet
+
+    def readDiscID(self) -> discid.Disc:
+        Sheet = self._CueSheet
+        return discid.put(Sheet.FirstTrack, Sheet.LastTrack,
+                          Sheet.LeadOut + LeadInSectors,
+                          [ Offset + LeadInSectors
+                            for Offset in Sheet.Offsets ])
+
+    def createRipper(self, Config: config.Config) -> ripper.AudioRipper:
+        return ripper.ImageRipper(Config)
+
+    def getTrackExtents(self, Number: int) -> Optional[List[cue.Extent]]:
+        """Return where the audio of a track is in the image, or None if it is
+        not an audio track."""
+        return self._CueSheet.getExtents(Number)
+
+    def getAudioTrackNumbers(self) -> List[int]:
+        return [ Number for Number in self.getTrackNumbers()
+                 if self.getTrackExtents(Number) is not None ]
+
+    def getHiddenTrackExtents(self) -> Optional[List[cue.Extent]]:
+        return self._CueSheet.getHiddenExtents()
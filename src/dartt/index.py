@@ -0,0 +1,355 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+An index of the discs in the archive.
+"""
+
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import dartt.config as config
+from dartt.disc import AudioTrack
+from dartt.transcoder import TranscodedTrack
+
+class ArchiveIndex:
+    """Record every archived disc in an SQLite database, keyed by disc ID, with
+    its MusicBrainz release and the path, content hashes and tags of each
+    track.  This answers whether a disc has been archived, and which releases are, without
+    touching the disc or walking the archive."""
+    def __init__(
+            self,
+            IndexPath: Path
+    ):
+        """Construct an ArchiveIndex, creating the database if needed.
+
+        :param IndexPath: The path to the SQLite database
+        :returns: An ArchiveIndex
+
+        """
+        self._Lock = threading.Lock()
+
+        IndexPath = Path(IndexPath)
+        IndexPath.parent.mkdir(parents=True, exist_ok=True)
+
+        # Drive workers share the connection, serialized by _Lock.
+        self._Connection = sqlite3.connect(IndexPath, check_same_thread=False)
+        with self._Connection:
+            self._Connection.execute(
+                'CREATE TABLE IF NOT EXISTS discs ('
+                'disc_id TEXT PRIMARY KEY, '
+                'release_id TEXT, '
+                'title TEXT, '
+                'artist TEXT, '
+                'archived REAL NOT NULL)'
+            )
+            self._Connection.execute(
+                'CREATE INDEX IF NOT EXISTS discs_release_id '
+                'ON discs (release_id)'
+            )
+            self._Connection.execute(
+                'CREATE TABLE IF NOT EXISTS tracks ('
+                'disc_id TEXT NOT NULL, '
+                'number INTEGER NOT NULL, '
+                'title TEXT, '
+                'path TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'sha256 TEXT, '
+                'tags TEXT, '
+                'PRIMARY KEY (disc_id, number))'
+            )
+            self._Connection.execute(
+                'CREATE INDEX IF NOT EXISTS tracks_sha256 ON tracks (sha256)'
+            )
+            # The path is NULL when the track was skipped rather than
+            # transcoded.
+            self._Connection.execute(
+                'CREATE TABLE IF NOT EXISTS transcodes ('
+                'disc_id TEXT NOT NULL, '
+                'number INTEGER NOT NULL, '
+                'path TEXT, '
+                'fingerprint TEXT NOT NULL, '
+                'PRIMARY KEY (disc_id, number))'
+            )
+
+    def isArchived(
+            self,
+            DiscID: str
+    ) -> bool:
+        """Check whether a disc has been archived and its tracks are still in
+        the archive.
+
+        :param DiscID: The MusicBrainz disc ID
+        :returns: True if every archived track of the disc is present
+
+        """
+        with self._Lock:
+            Disc = self._Connection.execute(
+                'SELECT 1 FROM discs WHERE disc_id = ?', (DiscID,)
+            ).fetchone()
+            if Disc is None:
+                return False
+            Tracks = self._Connection.execute(
+                'SELECT path, size FROM tracks WHERE disc_id = ?', (DiscID,)
+            ).fetchall()
+
+        for TrackPath, Size in Tracks:
+            try:
+                if Path(TrackPath).stat().st_size != Size:
+                    logging.info(f'{TrackPath} has changed since it was '
+                                 'archived')
+                    return False
+            except FileNotFoundError:
+                logging.info(f'{TrackPath} is missing from the archive')
+                return False
+        return True
+
+    def addDisc(
+            self,
+            DiscID: str,
+            ReleaseID: Optional[str],
+            Title: Optional[str],
+            Artist: Optional[str],
+            Tracks: Iterable[AudioTrack],
+            Tags: Optional[Dict[int, Dict[str, str]]] = None
+    ):
+        """Record an archived disc, replacing any earlier record of it.  The
+        fingerprints of transcoded tracks are recorded too.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param ReleaseID: The MusicBrainz release ID, if known
+        :param Title: The release title
+        :param Artist: The release artist
+        :param Tracks: The archived tracks
+        :param Tags: The tags of each track, by number, to tag later transcodes
+                     with
+        :returns: Nothing
+
+        """
+        Tracks = list(Tracks)
+        Tags = Tags or dict()
+        Rows = [ (DiscID, int(Track.Number), Track.Title, str(Track.RippedPath),
+                  Path(Track.RippedPath).stat().st_size,
+                  Track.Checksums.get('sha256', None),
+                  (json.dumps(Tags[int(Track.Number)])
+                   if int(Track.Number) in Tags else None))
+                 for Track in Tracks ]
+        Transcodes = [ (DiscID, int(Track.Number),
+                        (str(Track.TranscodedPath)
+                         if Track.TranscodedPath is not None else None),
+                        Track.Fingerprint)
+                       for Track in Tracks
+                       if isinstance(Track, TranscodedTrack) and
+                       Track.Fingerprint is not None ]
+
+        with self._Lock, self._Connection:
+            self._Connection.execute(
+                'DELETE FROM tracks WHERE disc_id = ?', (DiscID,)
+            )
+            self._Connection.execute(
+                'DELETE FROM transcodes WHERE disc_id = ?', (DiscID,)
+            )
+            self._Connection.execute(
+                'DELETE FROM discs WHERE disc_id = ?', (DiscID,)
+            )
+            self._Connection.execute(
+                'INSERT INTO discs VALUES (?, ?, ?, ?, ?)',
+                (DiscID, ReleaseID, Title, Artist, time.time())
+            )
+            self._Connection.executemany(
+                'INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)', Rows
+            )
+            self._Connection.executemany(
+                'INSERT INTO transcodes VALUES (?, ?, ?, ?)', Transcodes
+            )
+
+    def getTracks(
+            self,
+            DiscID: str
+    ) -> List[Tuple[int, str, Path, Optional[str]]]:
+        """Return the archived tracks of a disc.
+
+        :param DiscID: The MusicBrainz disc ID
+        :returns: A list of track number, title, path and SHA-256 tuples
+
+        """
+        with self._Lock:
+            Rows = self._Connection.execute(
+                'SELECT number, title, path, sha256 FROM tracks '
+                'WHERE disc_id = ? ORDER BY number', (DiscID,)
+            ).fetchall()
+        return [ (Number, Title, Path(TrackPath), SHA256)
+                 for Number, Title, TrackPath, SHA256 in Rows ]
+
+    def getTrackTags(
+            self,
+            DiscID: str
+    ) -> Dict[int, Dict[str, str]]:
+        """Return the tags recorded for the tracks of a disc.
+
+        :param DiscID: The MusicBrainz disc ID
+        :returns: The tags of each track, by number, for the tracks that have
+                  them
+
+        """
+        with self._Lock:
+            Rows = self._Connection.execute(
+                'SELECT number, tags FROM tracks '
+                'WHERE disc_id = ? AND tags IS NOT NULL', (DiscID,)
+            ).fetchall()
+        return { Number: json.loads(Tags) for Number, Tags in Rows }
+
+    def setTrackHash(
+            self,
+            DiscID: str,
+            Number: int,
+            SHA256: str
+    ):
+        """Record the SHA-256 of a track that was archived without one.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Number: The track number
+        :param SHA256: The SHA-256 of the track's audio
+        :returns: Nothing
+
+        """
+        with self._Lock, self._Connection:
+            self._Connection.execute(
+                'UPDATE tracks SET sha256 = ? WHERE disc_id = ? AND number = ?',
+                (SHA256, DiscID, Number)
+            )
+
+    def getDiscs(self) -> List[Tuple[str, Optional[str], Optional[str],
+                                     Optional[str]]]:
+        """Return every archived disc.
+
+        :returns: A list of disc ID, release ID, title and artist tuples,
+                  sorted by disc ID
+
+        """
+        with self._Lock:
+            return self._Connection.execute(
+                'SELECT disc_id, release_id, title, artist FROM discs '
+                'ORDER BY disc_id'
+            ).fetchall()
+
+    def getTranscode(
+            self,
+            DiscID: str,
+            Number: int
+    ) -> Optional[Tuple[Optional[Path], str]]:
+        """Return what the current transcode of a track was produced from.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Number: The track number
+        :returns: The path and fingerprint of the transcode, or None if it was
+                  not recorded.  The path is None if the track was skipped.
+
+        """
+        with self._Lock:
+            Row = self._Connection.execute(
+                'SELECT path, fingerprint FROM transcodes '
+                'WHERE disc_id = ? AND number = ?', (DiscID, Number)
+            ).fetchone()
+        if Row is None:
+            return None
+        TranscodePath, Fingerprint = Row
+        return (Path(TranscodePath) if TranscodePath is not None else None,
+                Fingerprint)
+
+    def setTranscode(
+            self,
+            DiscID: str,
+            Number: int,
+            TranscodePath: Optional[Path],
+            Fingerprint: str
+    ):
+        """Record what the transcode of a track was produced from.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Number: The track number
+        :param TranscodePath: The transcoded file, or None if the track was
+                              skipped
+        :param Fingerprint: The fingerprint of the transcode
+        :returns: Nothing
+
+        """
+        with self._Lock, self._Connection:
+            self._Connection.execute(
+                'INSERT OR REPLACE INTO transcodes VALUES (?, ?, ?, ?)',
+                (DiscID, Number,
+                 str(TranscodePath) if TranscodePath is not None else None,
+                 Fingerprint)
+            )
+
+    def getReleases(self) -> List[Tuple[str, str, str]]:
+        """Return every archived release.
+
+        :returns: A list of release ID, artist and title tuples, sorted by
+                  artist and title
+
+        """
+        with self._Lock:
+            return self._Connection.execute(
+                'SELECT DISTINCT release_id, artist, title FROM discs '
+                'WHERE release_id IS NOT NULL ORDER BY artist, title'
+            ).fetchall()
+
+    def findTrack(
+            self,
+            SHA256: str
+    ) -> List[Tuple[str, int]]:
+        """Find archived tracks by content.
+
+        :param SHA256: The SHA-256 of the track
+        :returns: A list of disc ID and track number tuples
+
+        """
+        with self._Lock:
+            return self._Connection.execute(
+                'SELECT disc_id, number FROM tracks WHERE sha256 = ?',
+                (SHA256,)
+            ).fetchall()
+
+_Indexes: 'weakref.WeakKeyDictionary[config.Config, ArchiveIndex]' = (
+    weakref.WeakKeyDictionary()
+)
+_IndexesLock = threading.Lock()
+
+def getArchiveIndex(Config: config.Config) -> ArchiveIndex:
+    """Return the archive index shared by everything using Config, opening it on
+    first use.
+
+    :param Config: The dartt config
+    :returns: The shared ArchiveIndex
+
+    """
+    with _IndexesLock:
+        Index = _Indexes.get(Config, None)
+        if Index is None:
+            Index = ArchiveIndex(Path(Config.getArchiveIndexPath()))
+            _Indexes[Config] = Index
+        return Index
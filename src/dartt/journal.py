@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A journal of rip progress so that interrupted rips can be resumed.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Dict, Optional, Tuple
+
+class RipJournal:
+    """Record the tracks of a disc that have been ripped and how far the current
+    track got.  The journal lives in the disc's staging directory, next to the
+    partial rip, and is rewritten atomically on every update so that it
+    survives a crash or a reboot."""
+    def __init__(
+            self,
+            JournalPath: Path,
+            DiscID: str
+    ):
+        """Construct a RipJournal, loading any existing journal for the disc.
+
+        :param JournalPath: The path to the journal file
+        :param DiscID: The disc being ripped
+        :returns: A RipJournal
+
+        """
+        self._Path = Path(JournalPath)
+        self._DiscID = DiscID
+        self._Tracks: Dict[str, dict] = dict()
+        self._Partial: Optional[dict] = None
+        self._Lock = threading.Lock()
+
+        try:
+            Journal = json.loads(self._Path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as Error:
+            logging.warning(f'Ignoring unreadable rip journal {self._Path}: '
+                            f'{Error}')
+            return
+
+        if Journal.get('disc_id') != DiscID:
+            logging.warning(f'Ignoring rip journal {self._Path} for disc '
+                            f'{Journal.get("disc_id")}')
+            return
+
+        self._Tracks = Journal.get('tracks', dict())
+        self._Partial = Journal.get('partial', None)
+
+    @property
+    def path(self) -> Path:
+        return self._Path
+
+    def getCompleted(
+            self,
+            Number: int
+    ) -> Optional[dict]:
+        """Return the record of a completed track.
+
+        :param Number: The track number
+        :returns: The path, size and checksums of the track, or None
+
+        """
+        with self._Lock:
+            return self._Tracks.get(f'{Number}', None)
+
+    def getPartial(
+            self,
+            Number: int
+    ) -> Optional[Tuple[int, int]]:
+        """Return how far an interrupted rip of a track got.
+
+        :param Number: The track number
+        :returns: The first sector of the track and the last sector written, or
+                  None
+
+        """
+        with self._Lock:
+            if self._Partial is None or self._Partial['track'] != Number:
+                return None
+            return self._Partial['first'], self._Partial['sector']
+
+    def checkpoint(
+            self,
+            Number: int,
+            FirstSector: int,
+            Sector: int
+    ):
+        """Record the last sector of a track that cdparanoia has written.
+
+        :param Number: The track number
+        :param FirstSector: The first sector of the track
+        :param Sector: The last sector written
+        :returns: Nothing
+
+        """
+        with self._Lock:
+            self._Partial = { 'track': Number, 'first': FirstSector,
+                              'sector': Sector }
+            self._save()
+
+    def complete(
+            self,
+            Number: int,
+            TrackPath: Path,
+            **Checksums: str
+    ):
+        """Record a track that has been ripped and archived.
+
+        :param Number: The track number
+        :param TrackPath: Where the track was archived
+        :param Checksums: The checksums of the track, by algorithm
+        :returns: Nothing
+
+        """
+        with self._Lock:
+            self._Tracks[f'{Number}'] = dict(
+                path=str(TrackPath),
+                size=Path(TrackPath).stat().st_size,
+                **Checksums
+            )
+            if self._Partial is not None and self._Partial['track'] == Number:
+                self._Partial = None
+            self._save()
+
+    def _save(self):
+        Temp = self._Path.with_suffix('.tmp')
+        with open(Temp, 'w') as File:
+            json.dump({ 'disc_id': self._DiscID, 'tracks': self._Tracks,
+                        'partial': self._Partial }, File)
+            File.flush()
+            os.fsync(File.fileno())
+        os.replace(Temp, self._Path)
@@ -21,9 +21,11 @@
 import argparse
 from collections.abc import Iterable
 from enum import Enum
+import itertools
 import logging
 from pathlib import Path
 import sys
+from typing import Optional
 
 def parseArgs(
         Args: Iterable
@@ -44,11 +46,76 @@ def parseArgs(
         action='store_true'
     )
 
+    Parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Use only cached MusicBrainz lookups and never touch the network'
+    )
+
+    Parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Rip discs even if they are already in the archive'
+    )
+
+    # These choose what to do with the drives, or replace them with images.
+    Action = Parser.add_mutually_exclusive_group()
+
+    Action.add_argument(
+        '--read-offset',
+        type=int,
+        metavar='SAMPLES',
+        help="Record the read offset of a drive's model and exit"
+    )
+
+    Parser.add_argument(
+        '--device',
+        metavar='DEVICE',
+        help='The drive to record the read offset of, such as sr0 or '
+        '/dev/sr0; needed with --read-offset when there are several drives'
+    )
+
+    Action.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Keep running and rip each disc as soon as it is inserted'
+    )
+
+    Action.add_argument(
+        '--image',
+        action='append',
+        metavar='PATH',
+        help='Rip a BIN/CUE or ISO image instead of the drives; may be given '
+        'more than once'
+    )
+
+    Commands = Parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    Commands.add_parser(
+        'retranscode',
+        help='Transcode again every archived track whose transcode is missing '
+        'or was made from other audio or with another encoder, encoder '
+        'version or quality, resuming an interrupted retranscode'
+    )
+
     return Parser.parse_args(Args)
 
 def main():
     class ExitCode(Enum):
         DeviceNotReady = 1
+        RipFailed = 2
+        RetranscodeFailed = 3
+        AmbiguousDrive = 4
+
+    def getExitCode(Summary) -> Optional[int]:
+        if Summary.Results:
+            print(str(Summary))
+
+        if any(not Result.NotReady for Result in Summary.Failed):
+            return ExitCode.RipFailed.value
+        if Summary.NotReady:
+            return ExitCode.DeviceNotReady.value
+        return None
 
     ParsedArgs = parseArgs(sys.argv[1:])
 
@@ -63,17 +130,75 @@ def main():
     if ParsedArgs.config:
         Config.reconfig()
 
+    if ParsedArgs.offline:
+        Config.setOption('offline', True)
+
+    if ParsedArgs.force:
+        Config.setOption('force', True)
+
+    if ParsedArgs.command == 'retranscode':
+        from dartt.retranscode import retranscode
+        Summary = retranscode(Config)
+        print(str(Summary))
+        if Summary.Failed:
+            return ExitCode.RetranscodeFailed.value
+        return
+
+    if sys.stdout.isatty():
+        from dartt.progress import ProgressRenderer, addProgressConsumer
+        addProgressConsumer(ProgressRenderer())
+
+    from dartt.scheduler import DriveScheduler
+    # A daemon may run for months, so it only counts what it has ripped.
+    Scheduler = DriveScheduler(Config, Retain=not ParsedArgs.daemon)
+
+    if ParsedArgs.image:
+        from dartt.image import ImageDevice
+        # serve bounds the number of images ripped at once.
+        Summary = Scheduler.serve(ImageDevice(Path(Image), Config)
+                                  for Image in ParsedArgs.image)
+        return getExitCode(Summary)
+
     from dartt.optical import detectOpticalDrives
     OpticalDrives = detectOpticalDrives(Config)
 
-    from dartt.optical import DeviceNotReadyError
-
-    for Drive in OpticalDrives:
+    if ParsedArgs.read_offset is not None:
+        # Drives of different models rarely share a read offset, so the
+        # offset is only ever recorded for one drive.
+        if ParsedArgs.device is not None:
+            OpticalDrives = [ Drive for Drive in OpticalDrives
+                              if ParsedArgs.device in (Drive.id, Drive.path) ]
+        if len(OpticalDrives) != 1:
+            logging.error(f'--read-offset needs exactly one drive, but '
+                          f'{len(OpticalDrives)} match; choose one with '
+                          '--device')
+            return ExitCode.AmbiguousDrive.value
+
+        from dartt.drives import DriveCapabilities, getDriveCapabilityStore
+        Store = getDriveCapabilityStore(Config)
+        for Drive in OpticalDrives:
+            Capabilities = Drive.Capabilities
+            Store.set(Drive.Vendor, Drive.Model,
+                      DriveCapabilities(ParsedArgs.read_offset,
+                                        Capabilities.C2,
+                                        Capabilities.ReadSpeed))
+            print(f'{Drive}: {Drive.Vendor} {Drive.Model}: '
+                  f'{Drive.Capabilities}')
+        return
+
+    if ParsedArgs.daemon:
+        from dartt.optical import monitorOpticalDrives
+        # Rip whatever is already loaded, then wait for new discs.
+        Drives = itertools.chain(
+            (Drive for Drive in OpticalDrives if Drive.hasMedia),
+            monitorOpticalDrives(Config)
+        )
         try:
-            Media = Drive.open()
-        except DeviceNotReadyError as RE:
-            print(str(RE))
-            return ExitCode.DeviceNotReady.value
-
-        Tracks = Media.rip(Config)
-        logging.debug(f'Ripped tracks: {Tracks}')
+            Scheduler.serve(Drives)
+        except KeyboardInterrupt:
+            logging.info('Stopping')
+        logging.info(str(Scheduler.Summary))
+        return
+
+    Summary = Scheduler.run(OpticalDrives)
+    return getExitCode(Summary)
@@ -0,0 +1,215 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Hash ripped audio as it is written and record the hashes in a manifest.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import BinaryIO, Dict, List, Optional, Sequence, Union
+import zlib
+
+class PCMHasher:
+    """Hash the PCM payload of a WAV stream as it goes by, skipping the header.
+    CRC32 is cheap enough to check on every read; SHA-256 identifies the audio
+    for the archive index."""
+    def __init__(
+            self,
+            HeaderSize: int = 44
+    ):
+        """Construct a PCMHasher.
+
+        :param HeaderSize: The number of bytes before the PCM payload
+        :returns: A PCMHasher
+
+        """
+        self._Skip = HeaderSize
+        self._CRC32 = 0
+        self._SHA256 = hashlib.sha256()
+        self._Size = 0
+
+    def update(self, Data: Union[bytes, bytearray, memoryview]):
+        View = memoryview(Data)
+        if self._Skip:
+            Skipped = min(self._Skip, len(View))
+            View = View[Skipped:]
+            self._Skip -= Skipped
+        self._CRC32 = zlib.crc32(View, self._CRC32)
+        self._SHA256.update(View)
+        self._Size += len(View)
+
+    def write(self, Data: bytes) -> int:
+        """Hash Data, so that a hasher can take a command's output."""
+        self.update(Data)
+        return len(Data)
+
+    @property
+    def Size(self) -> int:
+        """The number of PCM bytes hashed."""
+        return self._Size
+
+    @property
+    def Checksums(self) -> Dict[str, str]:
+        return { 'crc32': f'{self._CRC32:08x}',
+                 'sha256': self._SHA256.hexdigest() }
+
+class SplitPCMHasher(PCMHasher):
+    """Hash a PCM stream as a whole and, in the same pass, each of the
+    consecutive parts it is made of, such as the tracks of a disc image."""
+    def __init__(
+            self,
+            Sizes: Sequence[int],
+            HeaderSize: int = 44
+    ):
+        """Construct a SplitPCMHasher.
+
+        :param Sizes: The size in bytes of every part but the last, which runs
+                      to the end of the stream
+        :param HeaderSize: The number of bytes before the PCM payload
+        :returns: A SplitPCMHasher
+
+        """
+        super().__init__(HeaderSize)
+        self._Sizes = list(Sizes)
+        self._Parts = [ PCMHasher(0) for _ in range(len(self._Sizes) + 1) ]
+        self._Part = 0
+        self._Left = self._Sizes[0] if self._Sizes else None
+
+    def update(self, Data: Union[bytes, bytearray, memoryview]):
+        View = memoryview(Data)[min(self._Skip, len(Data)):]
+        super().update(Data)
+        while len(View) > 0:
+            Take = (len(View) if self._Left is None
+                    else min(len(View), self._Left))
+            self._Parts[self._Part].update(View[:Take])
+            View = View[Take:]
+            if self._Left is None:
+                continue
+            self._Left -= Take
+            if self._Left == 0:
+                self._Part += 1
+                self._Left = (self._Sizes[self._Part]
+                              if self._Part < len(self._Sizes) else None)
+
+    @property
+    def Parts(self) -> List[PCMHasher]:
+        """The hashers of the parts, in order."""
+        return self._Parts
+
+class HashingWriter:
+    """A file-like object that writes to a file and hashes what it writes."""
+    def __init__(
+            self,
+            File: BinaryIO,
+            Hasher: PCMHasher
+    ):
+        self._File = File
+        self._Hasher = Hasher
+
+    def write(self, Data: bytes) -> int:
+        self._Hasher.update(Data)
+        return self._File.write(Data)
+
+    def flush(self):
+        self._File.flush()
+
+class AlbumManifest:
+    """The checksums of the archived tracks of an album, kept in manifest.json
+    in the album's archive directory."""
+
+    FileName = 'manifest.json'
+
+    # Several drives may archive into the same album directory.
+    _Lock = threading.Lock()
+
+    def __init__(
+            self,
+            AlbumPath: Path
+    ):
+        """Construct an AlbumManifest.
+
+        :param AlbumPath: The archive directory of the album
+        :returns: An AlbumManifest
+
+        """
+        self._Path = Path(AlbumPath) / self.FileName
+
+    @property
+    def path(self) -> Path:
+        return self._Path
+
+    def read(self) -> Dict[str, dict]:
+        """Return the manifest entries by track file name."""
+        try:
+            return json.loads(self._Path.read_text()).get('tracks', dict())
+        except FileNotFoundError:
+            return dict()
+
+    def _write(self, Tracks: Dict[str, dict]):
+        Temp = self._Path.with_suffix('.tmp')
+        Temp.write_text(json.dumps({ 'tracks': Tracks }, indent=2,
+                                   sort_keys=True))
+        os.replace(Temp, self._Path)
+
+    def get(self, TrackPath: Path) -> Optional[dict]:
+        return self.read().get(Path(TrackPath).name, None)
+
+    def add(
+            self,
+            TrackPath: Path,
+            Hasher: PCMHasher
+    ):
+        """Record the checksums of an archived track.
+
+        :param TrackPath: The archived track
+        :param Hasher: The hasher that saw the track's audio
+        :returns: Nothing
+
+        """
+        with self._Lock:
+            Tracks = self.read()
+            Tracks[Path(TrackPath).name] = dict(pcm_bytes=Hasher.Size,
+                                                **Hasher.Checksums)
+            self._write(Tracks)
+
+    def rename(
+            self,
+            OldPath: Path,
+            NewPath: Path
+    ):
+        """Move the entry of a track that was stored under a new name, as when
+        it is compressed.  The audio, and so the checksums, must not change.
+
+        :param OldPath: The track's old path
+        :param NewPath: The track's new path
+        :returns: Nothing
+
+        """
+        with self._Lock:
+            Tracks = self.read()
+            Entry = Tracks.pop(Path(OldPath).name, None)
+            if Entry is None:
+                return
+            Tracks[Path(NewPath).name] = Entry
+            self._write(Tracks)
@@ -0,0 +1,138 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A persistent cache of MusicBrainz disc lookups.
+"""
+
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+class MusicBrainzCache:
+    """Store raw MusicBrainz disc ID lookup results in an SQLite database, keyed
+    by disc ID and TOC.  Entries older than the time-to-live are still returned
+    but marked stale so that the caller can revalidate them.  The least-recently
+    used entries are evicted once the cache holds more than MaxEntries."""
+    def __init__(
+            self,
+            CachePath: Path,
+            TTL: float,
+            MaxEntries: int
+    ):
+        """Construct a MusicBrainzCache, creating the database if needed.
+
+        :param CachePath: The path to the SQLite database
+        :param TTL: The number of seconds an entry is considered fresh
+        :param MaxEntries: The maximum number of entries to keep
+        :returns: A MusicBrainzCache
+
+        """
+        self._TTL = TTL
+        self._MaxEntries = MaxEntries
+        self._Lock = threading.Lock()
+
+        CachePath = Path(CachePath)
+        CachePath.parent.mkdir(parents=True, exist_ok=True)
+
+        # Drive workers share the connection, serialized by _Lock.
+        self._Connection = sqlite3.connect(CachePath, check_same_thread=False)
+        with self._Connection:
+            self._Connection.execute(
+                'CREATE TABLE IF NOT EXISTS lookups ('
+                'disc_id TEXT NOT NULL, '
+                'toc TEXT NOT NULL, '
+                'result TEXT NOT NULL, '
+                'fetched REAL NOT NULL, '
+                'accessed REAL NOT NULL, '
+                'PRIMARY KEY (disc_id, toc))'
+            )
+            self._Connection.execute(
+                'CREATE INDEX IF NOT EXISTS lookups_accessed '
+                'ON lookups (accessed)'
+            )
+
+    def get(
+            self,
+            DiscID: str,
+            TOC: str
+    ) -> Optional[Tuple[dict, bool]]:
+        """Look up a cached result.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param TOC: The disc TOC string
+        :returns: A tuple of the raw lookup result and whether it is still
+        fresh, or None if the disc is not cached
+
+        """
+        Now = time.time()
+        with self._Lock, self._Connection:
+            Row = self._Connection.execute(
+                'SELECT result, fetched FROM lookups '
+                'WHERE disc_id = ? AND toc = ?',
+                (DiscID, TOC)
+            ).fetchone()
+            if Row is None:
+                return None
+            self._Connection.execute(
+                'UPDATE lookups SET accessed = ? WHERE disc_id = ? AND toc = ?',
+                (Now, DiscID, TOC)
+            )
+
+        Result, Fetched = Row
+        logging.debug(f'MusicBrainz cache hit for {DiscID}')
+        return json.loads(Result), Now - Fetched < self._TTL
+
+    def put(
+            self,
+            DiscID: str,
+            TOC: str,
+            Result: dict
+    ):
+        """Store a lookup result, evicting old entries if the cache is full.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param TOC: The disc TOC string
+        :param Result: The raw lookup result
+        :returns: Nothing
+
+        """
+        Now = time.time()
+        with self._Lock, self._Connection:
+            self._Connection.execute(
+                'INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)',
+                (DiscID, TOC, json.dumps(Result), Now, Now)
+            )
+            self._Connection.execute(
+                'DELETE FROM lookups WHERE rowid IN ('
+                'SELECT rowid FROM lookups ORDER BY accessed DESC '
+                'LIMIT -1 OFFSET ?)',
+                (self._MaxEntries,)
+            )
+
+    def __len__(self) -> int:
+        with self._Lock:
+            return self._Connection.execute(
+                'SELECT COUNT(*) FROM lookups'
+            ).fetchone()[0]
@@ -18,13 +18,20 @@
 # You should have received a copy of the GNU Affero General Public License along
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
+from concurrent.futures import Future, ThreadPoolExecutor
 import discid
 import logging
 import musicbrainzngs as mb
+from pathlib import Path
+import random
 import sh
-from typing import List
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import weakref
 
 import dartt.config as config
+from dartt.mbcache import MusicBrainzCache
 
 class TrackInfo:
     def __init__(
@@ -136,6 +143,10 @@ class DiscInfo:
     def Barcode(self):
         return self._Barcode
 
+    @property
+    def Date(self) -> Optional[str]:
+        return self._Date
+
     @property
     def Artists(self) -> List[str]:
         return self._Artists
@@ -148,33 +159,280 @@ class DiscInfo:
         return (f'Disc ID: {self.ID} Title: {self.Title} '
                 f'Barcode: {self.Barcode} - {self.Artists} - {self.Tracks}')
 
+class MusicBrainzUnavailableError(RuntimeError):
+    def __init__(self, Reason: str):
+        super().__init__(f'MusicBrainz is unavailable: {Reason}')
+
+class TokenBucket:
+    """Limit the rate of requests.  Tokens accumulate at Rate per second up to
+    Capacity and each request consumes one, blocking until one is available."""
+    def __init__(
+            self,
+            Rate: float,
+            Capacity: float = 1.0
+    ):
+        self._Rate = Rate
+        self._Capacity = Capacity
+        self._Tokens = Capacity
+        self._Last = time.monotonic()
+        self._Lock = threading.Lock()
+
+    def acquire(self):
+        with self._Lock:
+            Now = time.monotonic()
+            self._Tokens = min(self._Capacity,
+                               self._Tokens + (Now - self._Last) * self._Rate)
+            self._Last = Now
+            # Claim the token now, even if it has not accumulated yet, so that
+            # waiters are served in order.
+            self._Tokens -= 1
+            Wait = -self._Tokens / self._Rate if self._Tokens < 0 else 0
+
+        if Wait > 0:
+            time.sleep(Wait)
+
+class CircuitBreaker:
+    """Stop sending requests to a service that keeps failing.  After Threshold
+    consecutive failures the circuit opens and requests fail immediately.  Once
+    ResetTimeout seconds have passed a single trial request is let through; if
+    it succeeds the circuit closes again."""
+    def __init__(
+            self,
+            Threshold: int,
+            ResetTimeout: float
+    ):
+        self._Threshold = Threshold
+        self._ResetTimeout = ResetTimeout
+        self._Failures = 0
+        self._OpenedAt = None
+        self._Trial = False
+        self._Lock = threading.Lock()
+
+    @property
+    def isOpen(self) -> bool:
+        with self._Lock:
+            return self._OpenedAt is not None
+
+    def allow(self) -> bool:
+        with self._Lock:
+            if self._OpenedAt is None:
+                return True
+            if self._Trial:
+                return False
+            if time.monotonic() - self._OpenedAt < self._ResetTimeout:
+                return False
+            self._Trial = True
+            return True
+
+    def recordSuccess(self):
+        with self._Lock:
+            self._Failures = 0
+            self._OpenedAt = None
+            self._Trial = False
+
+    def recordFailure(self):
+        with self._Lock:
+            self._Failures += 1
+            if self._Trial or self._Failures >= self._Threshold:
+                self._OpenedAt = time.monotonic()
+            self._Trial = False
+
+def _isTransient(Error: mb.WebServiceError) -> bool:
+    if isinstance(Error, mb.NetworkError):
+        return True
+    Code = getattr(Error.cause, 'code', None)
+    return Code is not None and Code >= 500
+
+def _isNotFound(Error: mb.WebServiceError) -> bool:
+    return getattr(Error.cause, 'code', None) == 404
+
+class RequestScheduler:
+    """Send all MusicBrainz web service requests for the process.  Requests are
+    rate limited with a token bucket, identical in-flight disc lookups share a
+    single request, transient failures are retried with exponential backoff
+    and a circuit breaker stops hammering the service when it is down.
+
+    musicbrainzngs paces its own calls and retries 5xx responses for a while
+    before raising, so a transient failure that reaches the scheduler has
+    already been retried; the scheduler's backoff rides out longer outages."""
+    def __init__(
+            self,
+            Rate: float = 1.0,
+            MaxRetries: int = 2,
+            BackoffBase: float = 1.0,
+            BackoffMax: float = 60.0,
+            FailureThreshold: int = 5,
+            ResetTimeout: float = 300.0
+    ):
+        """Construct a RequestScheduler.
+
+        :param Rate: Requests per second
+        :param MaxRetries: Retries of a transient failure before giving up
+        :param BackoffBase: Delay before the first retry, in seconds
+        :param BackoffMax: Maximum delay between retries, in seconds
+        :param FailureThreshold: Consecutive failures that open the circuit
+        :param ResetTimeout: Seconds before an open circuit is retried
+        :returns: A RequestScheduler
+
+        """
+        self._Bucket = TokenBucket(Rate)
+        self._Breaker = CircuitBreaker(FailureThreshold, ResetTimeout)
+        self._MaxRetries = MaxRetries
+        self._BackoffBase = BackoffBase
+        self._BackoffMax = BackoffMax
+        self._InFlight: Dict[Tuple, Future] = dict()
+        self._Lock = threading.Lock()
+
+        mb.set_useragent('dartt', '0.0.1', 'dag@obbligato.org')
+
+    def _send(
+            self,
+            Request: Callable[[], dict]
+    ) -> Optional[dict]:
+        Attempt = 0
+        while True:
+            if not self._Breaker.allow():
+                raise MusicBrainzUnavailableError('too many failed requests')
+
+            self._Bucket.acquire()
+            try:
+                Result = Request()
+            except mb.WebServiceError as Error:
+                if _isNotFound(Error):
+                    self._Breaker.recordSuccess()
+                    return None
+                if not _isTransient(Error):
+                    raise
+                self._Breaker.recordFailure()
+                if Attempt >= self._MaxRetries:
+                    raise MusicBrainzUnavailableError(str(Error)) from Error
+                Delay = min(self._BackoffMax, self._BackoffBase * 2 ** Attempt)
+                Delay *= random.uniform(0.5, 1.0)
+                logging.info(f'MusicBrainz error: {Error}, retrying in '
+                             f'{Delay:.1f}s')
+                time.sleep(Delay)
+                Attempt += 1
+                continue
+
+            self._Breaker.recordSuccess()
+            return Result
+
+    def request(
+            self,
+            Key: Tuple,
+            Request: Callable[[], dict]
+    ) -> Optional[dict]:
+        """Send a request, sharing the result with any identical request already
+        in flight.
+
+        :param Key: Identifies the request for coalescing
+        :param Request: Performs the request
+        :returns: The result, or None if MusicBrainz has no such entity
+
+        """
+        with self._Lock:
+            Pending = self._InFlight.get(Key, None)
+            if Pending is None:
+                Owner: Future = Future()
+                self._InFlight[Key] = Owner
+
+        if Pending is not None:
+            logging.debug(f'Waiting on in-flight request {Key}')
+            return Pending.result()
+
+        try:
+            Owner.set_result(self._send(Request))
+        except BaseException as Error:
+            Owner.set_exception(Error)
+        finally:
+            with self._Lock:
+                del self._InFlight[Key]
+
+        return Owner.result()
+
+    def lookupDisc(
+            self,
+            DiscID: str,
+            TOC: str
+    ) -> Optional[dict]:
+        """Look up releases by disc ID.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param TOC: The disc TOC string
+        :returns: The raw lookup result, or None if the disc is unknown
+
+        """
+        return self.request(
+            ('discid', DiscID, TOC),
+            lambda: mb.get_releases_by_discid(
+                DiscID,
+                toc=TOC,
+                includes=['artist-credits', 'recordings']
+            )
+        )
+
+_Scheduler: Optional[RequestScheduler] = None
+_SchedulerLock = threading.Lock()
+
+def getRequestScheduler() -> RequestScheduler:
+    """Return the request scheduler shared by every MusicBrainz client, so that
+    the rate limit and circuit breaker hold for the whole process.
+
+    :returns: The shared RequestScheduler
+
+    """
+    global _Scheduler
+    with _SchedulerLock:
+        if _Scheduler is None:
+            _Scheduler = RequestScheduler()
+        return _Scheduler
+
 class MusicBrainz:
     def __init__(
             self,
             Config: config.Config
     ):
         self._Config = Config['musicbrainz']
+        self._Offline = Config.getOption('offline', False)
+        self._Cache = MusicBrainzCache(
+            Path(Config.getMusicBrainzCachePath()),
+            Config.getMusicBrainzCacheTTL(),
+            Config.getMusicBrainzCacheMaxEntries()
+        )
+        self._Scheduler = getRequestScheduler()
+        self._Executor = ThreadPoolExecutor(
+            thread_name_prefix='dartt-musicbrainz'
+        )
         self._Authenticated = False
-        self.authenticate()
-        mb.set_useragent('dartt', '0.0.1', 'dag@obbligato.org')
+        self._AuthLock = threading.Lock()
+        if not self._Offline:
+            self.authenticate()
 
     def authenticate(
             self
     ):
-        User= self._Config.get('user', None)
+        with self._AuthLock:
+            if self._Authenticated:
+                return
 
-        if User:
-            PassCmd = self._Config['password_cmd']
+            User= self._Config.get('user', None)
 
-            Cmd = sh.Command(
-                PassCmd[0]
-            )
+            if User:
+                PassCmd = self._Config['password_cmd']
 
-            Password = Cmd(
-                *PassCmd[1:]
-            )
+                Cmd = sh.Command(
+                    PassCmd[0]
+                )
+
+                Password = Cmd(
+                    *PassCmd[1:]
+                )
+
+                # musicbrainzngs keeps the credentials for the life of the
+                # process.
+                mb.auth(User, Password)
 
-            mb.auth(User, Password)
+            self._Authenticated = True
 
     def getDiscInfo(
             self,
@@ -182,13 +440,62 @@ class MusicBrainz:
     ) -> DiscInfo:
         logging.debug(f'discid: {Disc.id}')
 
+        Cached = self._Cache.get(Disc.id, Disc.toc_string)
+        if Cached:
+            Stored, Fresh = Cached
+            if Fresh or self._Offline:
+                return DiscInfo(Stored)
+
+        if self._Offline:
+            logging.warning(f'{Disc.id} is not cached and dartt is offline')
+            return DiscInfo(dict())
+
         try:
-            Releases = mb.get_releases_by_discid(
-                Disc.id,
-                toc=Disc.toc_string,
-                includes=['artist-credits', 'recordings']
-            )
-            return DiscInfo(Releases)
-        except mb.WebServiceError as Error:
-            logging.error(f'Musicbainz error: {Error}')
+            Releases = self._Scheduler.lookupDisc(Disc.id, Disc.toc_string)
+        except (MusicBrainzUnavailableError, mb.WebServiceError) as Error:
+            # A disc can be ripped without its info, just not named.
+            if Cached:
+                logging.warning(f'{Error}, using stale cached disc info')
+                return DiscInfo(Cached[0])
+            logging.warning(f'Cannot look up {Disc.id}: {Error}')
             return DiscInfo(dict())
+
+        if Releases is None:
+            logging.warning(f'{Disc.id} is not known to MusicBrainz')
+            return DiscInfo(dict())
+
+        self._Cache.put(Disc.id, Disc.toc_string, Releases)
+        return DiscInfo(Releases)
+
+    def getDiscInfoAsync(
+            self,
+            Disc: discid.Disc
+    ) -> 'Future[DiscInfo]':
+        """Look up disc info in the background.
+
+        :param Disc: The disc to look up
+        :returns: A future for the DiscInfo
+
+        """
+        return self._Executor.submit(self.getDiscInfo, Disc)
+
+_Clients: 'weakref.WeakKeyDictionary[config.Config, MusicBrainz]' = (
+    weakref.WeakKeyDictionary()
+)
+_ClientsLock = threading.Lock()
+
+def getMusicBrainz(Config: config.Config) -> MusicBrainz:
+    """Return the MusicBrainz client shared by everything using Config, creating
+    and authenticating it on first use.  This is safe to call from concurrent
+    drive workers.
+
+    :param Config: The dartt config
+    :returns: The shared MusicBrainz client
+
+    """
+    with _ClientsLock:
+        Client = _Clients.get(Config, None)
+        if Client is None:
+            Client = MusicBrainz(Config)
+            _Clients[Config] = Client
+        return Client
@@ -23,16 +23,24 @@ import logging
 from pathlib import Path
 import pyudev
 import sh
-from typing import Iterable
+from typing import Iterable, Iterator, Optional
 
 import dartt.config as config
+import dartt.drives as drives
 from dartt.device import Device, DeviceNotReadyError
 
+MediaProperties = [ 'ID_CDROM_MEDIA_CD', 'ID_CDROM_MEDIA_DVD',
+                    'ID_CDROM_MEDIA_BD' ]
+
+def hasMedia(Dev: pyudev.Device) -> bool:
+    return any(Property in Dev.keys() for Property in MediaProperties)
+
 class OpticalDrive(Device):
     def __init__(self, Dev: pyudev.Device, Config: config.Config):
         import dartt.musicbrainz as mb
         self._Device = Dev
-        self._Musicbrainz = mb.MusicBrainz(Config)
+        self._Config = Config
+        self._Musicbrainz = mb.getMusicBrainz(Config)
 
     def __repr__(self) -> str:
         return f'{self._Device.sys_name}'
@@ -48,6 +56,23 @@ class OpticalDrive(Device):
     def path(self) -> str:
         return self._Device.device_node
 
+    @property
+    def hasMedia(self) -> bool:
+        return hasMedia(self._Device)
+
+    @property
+    def Vendor(self) -> str:
+        return self._Device.properties.get('ID_VENDOR', '')
+
+    @property
+    def Model(self) -> str:
+        return self._Device.properties.get('ID_MODEL', '')
+
+    @property
+    def Capabilities(self) -> drives.DriveCapabilities:
+        return drives.getDriveCapabilityStore(self._Config).get(self.Vendor,
+                                                                self.Model)
+
     from dartt.disc import Disc
     def open(self) -> Disc:
         if 'ID_CDROM_MEDIA_CD' in self._Device.keys():
@@ -68,3 +93,32 @@ def detectOpticalDrives(Config: config.Config) -> Iterable[OpticalDrive]:
 
     return [OpticalDrive(Device, Config) for Device in Devices.match(ID_CDROM=1)
             if 'ID_CDROM' in Device.keys()]
+
+def monitorOpticalDrives(
+        Config: config.Config,
+        Events: Optional[Iterable[pyudev.Device]] = None
+) -> Iterator[OpticalDrive]:
+    """Wait for media to be inserted into optical drives, yielding each drive as
+    soon as it has a disc.  This runs until the event source is exhausted, which
+    for the udev monitor is never.
+
+    :param Config: The dartt config
+    :param Events: Source of udev device events; defaults to a udev monitor on
+    the block subsystem
+    :returns: An iterator over drives with newly-inserted media
+
+    """
+    if Events is None:
+        Context = pyudev.Context()
+        Monitor = pyudev.Monitor.from_netlink(Context)
+        Monitor.filter_by('block', device_type='disk')
+        Events = iter(Monitor.poll, None)
+
+    for Dev in Events:
+        logging.debug(f'udev event: {Dev.action} {Dev.sys_name}')
+        if Dev.action != 'change' or 'ID_CDROM' not in Dev.keys():
+            continue
+        if not hasMedia(Dev):
+            # Media was ejected.
+            continue
+        yield OpticalDrive(Dev, Config)
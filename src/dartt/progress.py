@@ -0,0 +1,310 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Structured progress reporting for rippers.
+"""
+
+import logging
+import re
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, TextIO
+
+# cdparanoia reports positions in 16-bit words.
+WordsPerSector = 1176
+
+# Sectors per second read at 1x.
+SectorsPerSecond = 75
+
+# The --stderr-progress function codes, offset by 2.
+CDParanoiaEvents = [ 'wrote', 'finished', 'read', 'verify', 'jitter',
+                     'correction', 'scratch', 'scratch repair', 'skip', 'drift',
+                     'backoff', 'overlap', 'dropped', 'duped',
+                     'transport error', 'cache error' ]
+
+# Events that mean the drive returned bad data.
+ErrorEvents = { 'jitter', 'correction', 'scratch', 'scratch repair', 'drift',
+                'dropped', 'duped', 'transport error', 'cache error' }
+
+class ProgressEvent:
+    """A single progress report from a ripper."""
+    def __init__(
+            self,
+            Drive: str,
+            Track: int,
+            Kind: str,
+            Sector: int
+    ):
+        """Construct a ProgressEvent.
+
+        :param Drive: The drive being ripped
+        :param Track: The track being ripped
+        :param Kind: What happened, such as 'read', 'wrote' or 'skip'
+        :param Sector: The absolute sector it happened at
+        :returns: A ProgressEvent
+
+        """
+        self._Drive = Drive
+        self._Track = Track
+        self._Kind = Kind
+        self._Sector = Sector
+
+    @property
+    def Drive(self) -> str:
+        return self._Drive
+
+    @property
+    def Track(self) -> int:
+        return self._Track
+
+    @property
+    def Kind(self) -> str:
+        return self._Kind
+
+    @property
+    def Sector(self) -> int:
+        return self._Sector
+
+    def __repr__(self) -> str:
+        return (f'{self.Drive} track {self.Track}: {self.Kind} @ '
+                f'{self.Sector}')
+
+class TrackProgress:
+    """The accumulated progress of ripping one track."""
+    def __init__(
+            self,
+            Drive: str,
+            Track: int
+    ):
+        self._Drive = Drive
+        self._Track = Track
+        self._FirstSector: Optional[int] = None
+        self._LastSector: Optional[int] = None
+        self._Sector: Optional[int] = None
+        self._Counts: Dict[str, int] = dict()
+        self._BadSectors: Set[int] = set()
+        self._Start = time.monotonic()
+        self._StartSector: Optional[int] = None
+
+    @property
+    def Drive(self) -> str:
+        return self._Drive
+
+    @property
+    def Track(self) -> int:
+        return self._Track
+
+    @property
+    def FirstSector(self) -> Optional[int]:
+        return self._FirstSector
+
+    @property
+    def LastSector(self) -> Optional[int]:
+        return self._LastSector
+
+    @property
+    def Sector(self) -> Optional[int]:
+        """The last sector written."""
+        return self._Sector
+
+    @property
+    def Counts(self) -> Dict[str, int]:
+        return dict(self._Counts)
+
+    @property
+    def Errors(self) -> int:
+        return sum(Count for Kind, Count in self._Counts.items()
+                   if Kind in ErrorEvents)
+
+    @property
+    def Skips(self) -> int:
+        return self._Counts.get('skip', 0)
+
+    @property
+    def BadSectors(self) -> Set[int]:
+        """The sectors that had errors or were skipped."""
+        return set(self._BadSectors)
+
+    @property
+    def Fraction(self) -> Optional[float]:
+        if (self._Sector is None or self._FirstSector is None or
+            self._LastSector is None):
+            return None
+        Total = self._LastSector - self._FirstSector + 1
+        return min(1.0, (self._Sector - self._FirstSector + 1) / Total)
+
+    @property
+    def Speed(self) -> Optional[float]:
+        """The read speed as a multiple of 1x."""
+        if self._Sector is None or self._StartSector is None:
+            return None
+        Elapsed = time.monotonic() - self._Start
+        if Elapsed <= 0:
+            return None
+        return (self._Sector - self._StartSector) / Elapsed / SectorsPerSecond
+
+    def setSpan(self, FirstSector: int, LastSector: int):
+        self._FirstSector = FirstSector
+        self._LastSector = LastSector
+
+    def update(self, Event: ProgressEvent):
+        self._Counts[Event.Kind] = self._Counts.get(Event.Kind, 0) + 1
+        if Event.Kind in ErrorEvents or Event.Kind == 'skip':
+            self._BadSectors.add(Event.Sector)
+        if Event.Kind == 'wrote':
+            if self._StartSector is None:
+                self._StartSector = Event.Sector
+                self._Start = time.monotonic()
+            self._Sector = Event.Sector
+
+    def __repr__(self) -> str:
+        Fraction = self.Fraction
+        Speed = self.Speed
+        return (f'{self.Drive} track {self.Track:>02}'
+                f'{f" {Fraction:4.0%}" if Fraction is not None else ""}'
+                f'{f" {Speed:.1f}x" if Speed is not None else ""}'
+                f' errors {self.Errors} skips {self.Skips}')
+
+_Consumers: List[Callable[[ProgressEvent], None]] = []
+_ConsumersLock = threading.Lock()
+
+def addProgressConsumer(Consumer: Callable[[ProgressEvent], None]):
+    """Send every ProgressEvent to Consumer.  Consumers are called from ripping
+    threads and must be thread-safe.
+
+    :param Consumer: Called with each ProgressEvent
+    :returns: Nothing
+
+    """
+    with _ConsumersLock:
+        _Consumers.append(Consumer)
+
+def removeProgressConsumer(Consumer: Callable[[ProgressEvent], None]):
+    with _ConsumersLock:
+        _Consumers.remove(Consumer)
+
+def publish(Event: ProgressEvent):
+    with _ConsumersLock:
+        Consumers = list(_Consumers)
+    for Consumer in Consumers:
+        Consumer(Event)
+
+class CDParanoiaProgressParser:
+    """Parse cdparanoia --stderr-progress output into ProgressEvents."""
+
+    ProgressPattern = re.compile(r'##: (-?\d+) \[([^\]]*)\] @ (-?\d+)')
+    FromPattern = re.compile(r'Ripping from sector\s+(\d+)')
+    ToPattern = re.compile(r'to sector\s+(\d+)')
+
+    def __init__(
+            self,
+            Drive: str,
+            Track: int
+    ):
+        """Construct a CDParanoiaProgressParser.
+
+        :param Drive: The drive being ripped
+        :param Track: The track being ripped
+        :returns: A CDParanoiaProgressParser
+
+        """
+        self._Progress = TrackProgress(Drive, Track)
+        self._Partial = ''
+        self._First: Optional[int] = None
+
+    @property
+    def Progress(self) -> TrackProgress:
+        return self._Progress
+
+    def feed(self, Data: str):
+        """Parse a chunk of cdparanoia stderr output.  Chunks need not end on a
+        line boundary.
+
+        :param Data: The output to parse
+        :returns: Nothing
+
+        """
+        Lines = (self._Partial + Data).split('\n')
+        self._Partial = Lines.pop()
+        for Line in Lines:
+            self.parseLine(Line)
+
+    def parseLine(self, Line: str):
+        Match = self.ProgressPattern.search(Line)
+        if Match:
+            Function = int(Match.group(1))
+            Kind = (CDParanoiaEvents[Function + 2]
+                    if -2 <= Function < len(CDParanoiaEvents) - 2
+                    else Match.group(2))
+            Sector = int(Match.group(3)) // WordsPerSector
+            Event = ProgressEvent(self._Progress.Drive, self._Progress.Track,
+                                  Kind, Sector)
+            self._Progress.update(Event)
+            publish(Event)
+            return
+
+        Match = self.FromPattern.search(Line)
+        if Match:
+            self._First = int(Match.group(1))
+            return
+
+        Match = self.ToPattern.search(Line)
+        if Match and self._First is not None:
+            self._Progress.setSpan(self._First, int(Match.group(1)))
+            return
+
+        if Line.strip():
+            logging.debug(f'cdparanoia: {Line.strip()}')
+
+class ProgressRenderer:
+    """Show the progress of all drives on a single status line, redrawn at most
+    once per Interval seconds."""
+    def __init__(
+            self,
+            Interval: float = 0.25,
+            Output: TextIO = sys.stdout
+    ):
+        self._Interval = Interval
+        self._Output = Output
+        self._Tracks: Dict[str, TrackProgress] = dict()
+        self._Last: Optional[float] = None
+        self._Width = 0
+        self._Lock = threading.Lock()
+
+    def __call__(self, Event: ProgressEvent):
+        with self._Lock:
+            Progress = self._Tracks.get(Event.Drive, None)
+            if Progress is None or Progress.Track != Event.Track:
+                Progress = TrackProgress(Event.Drive, Event.Track)
+                self._Tracks[Event.Drive] = Progress
+            Progress.update(Event)
+
+            Now = time.monotonic()
+            if self._Last is not None and Now - self._Last < self._Interval:
+                return
+            self._Last = Now
+
+            Line = ' | '.join(str(self._Tracks[Drive])
+                              for Drive in sorted(self._Tracks))
+            self._Output.write(f'\r{Line:<{self._Width}}')
+            self._Output.flush()
+            self._Width = len(Line)
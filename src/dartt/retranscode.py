@@ -0,0 +1,523 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Bring the transcodes of the whole archive up to date with the configured
+encoder.
+"""
+
+from collections import Counter, deque
+from concurrent.futures import Executor, Future
+import json
+import logging
+import os
+from pathlib import Path
+import sh
+import subprocess
+from tempfile import TemporaryDirectory
+import threading
+from typing import Deque, Dict, List, Optional, Set, TextIO, Tuple
+
+import dartt.archive as archive
+import dartt.config as config
+import dartt.cue as cue
+from dartt.disc import AudioTrack, ImageTrack
+import dartt.index as index
+import dartt.manifest as manifest
+import dartt.musicbrainz as mb
+import dartt.tagging as tagging
+import dartt.transcoder as transcoder
+import dartt.utils as utils
+
+class RetranscodeCheckpoint:
+    """Record the discs whose transcodes are up to date, so that an interrupted
+    retranscode resumes where it stopped.  The checkpoint is a log with the
+    transcoder settings on its first line and a disc ID on each following
+    line, appended and synced as each disc finishes.  A checkpoint written
+    with other settings is discarded."""
+    def __init__(
+            self,
+            CheckpointPath: Path,
+            Settings: dict
+    ):
+        """Construct a RetranscodeCheckpoint, loading any existing checkpoint
+        written with the same settings.
+
+        :param CheckpointPath: The path to the checkpoint file
+        :param Settings: The transcoder settings
+        :returns: A RetranscodeCheckpoint
+
+        """
+        self._Path = Path(CheckpointPath)
+        self._Settings = json.dumps(Settings, sort_keys=True)
+        self._Done: Set[str] = set()
+        self._File: Optional[TextIO] = None
+        self._Lock = threading.Lock()
+
+        try:
+            Lines = self._Path.read_text().split('\n')
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as Error:
+            logging.warning(f'Ignoring unreadable retranscode checkpoint '
+                            f'{self._Path}: {Error}')
+            return
+
+        if Lines[0] != self._Settings:
+            logging.warning(f'Ignoring retranscode checkpoint {self._Path} '
+                            'written with other transcoder settings')
+            return
+
+        # The last line is empty, or a disc ID cut short by a crash.
+        self._Done = set(Lines[1:-1])
+
+    @property
+    def path(self) -> Path:
+        return self._Path
+
+    def __len__(self) -> int:
+        with self._Lock:
+            return len(self._Done)
+
+    def isDone(
+            self,
+            DiscID: str
+    ) -> bool:
+        """Check whether a disc's transcodes were brought up to date.
+
+        :param DiscID: The MusicBrainz disc ID
+        :returns: True if the disc is done
+
+        """
+        with self._Lock:
+            return DiscID in self._Done
+
+    def complete(
+            self,
+            DiscID: str
+    ):
+        """Record that a disc's transcodes are up to date.
+
+        :param DiscID: The MusicBrainz disc ID
+        :returns: Nothing
+
+        """
+        with self._Lock:
+            if self._File is None:
+                self._File = self._open()
+            self._Done.add(DiscID)
+            self._File.write(f'{DiscID}\n')
+            self._File.flush()
+            os.fsync(self._File.fileno())
+
+    def remove(self):
+        """Remove the checkpoint once the whole archive is up to date."""
+        with self._Lock:
+            if self._File is not None:
+                self._File.close()
+                self._File = None
+            self._Path.unlink(missing_ok=True)
+            self._Done.clear()
+
+    def close(self):
+        with self._Lock:
+            if self._File is not None:
+                self._File.close()
+                self._File = None
+
+    def _open(self) -> TextIO:
+        """Rewrite the checkpoint with what is done so far, dropping any line
+        cut short, and open it for appending."""
+        self._Path.parent.mkdir(parents=True, exist_ok=True)
+        Temp = self._Path.with_suffix('.tmp')
+        with open(Temp, 'w') as File:
+            File.write(f'{self._Settings}\n')
+            File.writelines(f'{DiscID}\n' for DiscID in sorted(self._Done))
+            File.flush()
+            os.fsync(File.fileno())
+        os.replace(Temp, self._Path)
+        return open(self._Path, 'a')
+
+def getIndexedTrackTags(
+        Track: AudioTrack,
+        DiscID: str,
+        ReleaseID: Optional[str],
+        Title: Optional[str],
+        Artist: Optional[str],
+        TrackTotal: int
+) -> Dict[str, str]:
+    """Return the tags of a track of a disc that was indexed without its tags,
+    from what the archive index knows of the disc.
+
+    :param Track: The track
+    :param DiscID: The MusicBrainz disc ID
+    :param ReleaseID: The MusicBrainz release ID, if known
+    :param Title: The release title
+    :param Artist: The release artist
+    :param TrackTotal: The number of tracks on the disc
+    :returns: The tags that have values, named as Vorbis comments
+
+    """
+    Tags = {
+        'title': Track.Title,
+        'artist': Artist,
+        'album': Title,
+        'albumartist': Artist,
+        'tracknumber': f'{Track.Number}',
+        'tracktotal': f'{TrackTotal}',
+        'musicbrainz_albumid': ReleaseID,
+        'musicbrainz_discid': DiscID,
+    }
+    return { Name: f'{Value}' for Name, Value in Tags.items()
+             if Value is not None }
+
+# The tracks of a disc and their transcodes, None for tracks that could not be
+# checked.
+DiscJobs = List[Tuple[AudioTrack, Optional[Future]]]
+
+class RetranscodeSummary:
+    """What a retranscode of the archive did."""
+    def __init__(self):
+        self.Discs = 0
+        self.Resumed = 0
+        self.Tracks = 0
+        self.Retranscoded = 0
+        self.Skipped = 0
+        self.Failed = 0
+
+    def __str__(self) -> str:
+        return (f'{self.Discs} discs ({self.Resumed} done before resuming), '
+                f'{self.Tracks} tracks checked, {self.Retranscoded} '
+                f'retranscoded, {self.Skipped} skipped, {self.Failed} failed')
+
+class Retranscoder:
+    """Walk the archive index and transcode again every track whose transcode
+    is missing or was not produced from the archived audio by the configured
+    encoder, encoder version and quality.  Tracks are fingerprinted as in
+    AudioTranscoder.getFingerprint and compared with the fingerprints the
+    index recorded for the current transcodes."""
+    def __init__(
+            self,
+            Config: config.Config
+    ):
+        """Construct a Retranscoder.
+
+        :param Config: The dartt config
+        :returns: A Retranscoder
+
+        """
+        self._Config = Config
+        Transcoder = transcoder.createAudioTranscoder(Config)
+        if Transcoder is None:
+            raise RuntimeError('No audio transcoder is configured')
+        self._Transcoder = Transcoder
+        self._Index = index.getArchiveIndex(Config)
+        self._Jobs = Config.getAudioTranscodeJobs()
+        self._Tag = Config.getAudioTag()
+        self._Padding = Config.getAudioTagPadding()
+        self._Checkpoint = RetranscodeCheckpoint(
+            Path(Config.getRetranscodeCheckpointPath()),
+            self._Transcoder.Settings
+        )
+
+    @property
+    def Checkpoint(self) -> RetranscodeCheckpoint:
+        return self._Checkpoint
+
+    def getTracks(
+            self,
+            DiscID: str,
+            Artist: Optional[str]
+    ) -> List[AudioTrack]:
+        """Return the archived tracks of a disc as the index records them.
+        Tracks that share a WAV file with a CUE sheet are tracks of a disc
+        image.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Artist: The release artist
+        :returns: The archived tracks
+
+        """
+        Rows = self._Index.getTracks(DiscID)
+        Files = Counter(TrackPath for _, _, TrackPath, _ in Rows)
+        Tracks: List[AudioTrack] = []
+        for Number, Title, TrackPath, SHA256 in Rows:
+            Info = mb.TrackInfo({ 'number': Number,
+                                  'recording': { 'title': Title,
+                                                 'artist-credit-phrase':
+                                                 Artist } })
+            Checksums = { 'sha256': SHA256 } if SHA256 else dict()
+            CuePath = TrackPath.with_suffix('.cue')
+            if TrackPath.suffix == '.wav' and (Files[TrackPath] > 1 or
+                                               CuePath.exists()):
+                Tracks.append(ImageTrack(TrackPath, CuePath, Info, Checksums))
+            else:
+                Tracks.append(AudioTrack(TrackPath, Info, Checksums))
+        return Tracks
+
+    def hashTrack(
+            self,
+            Track: AudioTrack
+    ) -> str:
+        """Hash the audio of an archived track that the index has no hash for.
+
+        :param Track: The archived track
+        :returns: The SHA-256 of its audio
+
+        """
+        Compressor = archive.findArchiveCompressor(Track.RippedPath,
+                                                   self._Config)
+        if Compressor is not None:
+            return Compressor.decode(Track.RippedPath).Checksums['sha256']
+
+        Hasher = manifest.PCMHasher(0)
+        with cue.CueImage() as Image:
+            for View in Image.getViews(Track.getExtents()):
+                with View:
+                    Hasher.update(View)
+        return Hasher.Checksums['sha256']
+
+    def isStale(
+            self,
+            DiscID: str,
+            Track: AudioTrack
+    ) -> bool:
+        """Check whether a track's transcode is missing or out of date.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Track: The archived track, with its SHA-256
+        :returns: True if the track must be transcoded again
+
+        """
+        Recorded = self._Index.getTranscode(DiscID, int(Track.Number))
+        if Recorded is None:
+            return True
+        TranscodePath, Fingerprint = Recorded
+        if Fingerprint != self._Transcoder.getFingerprint(Track):
+            return True
+        if TranscodePath is None:
+            # The track was skipped, as it would be again.
+            return False
+        return (TranscodePath != self._Transcoder.outputPath(Track) or
+                not TranscodePath.exists())
+
+    def retranscodeTrack(
+            self,
+            DiscID: str,
+            Track: AudioTrack,
+            Tags: Dict[str, str]
+    ) -> transcoder.TranscodedTrack:
+        """Transcode a track again, tag it and record its fingerprint.  A
+        compressed track is decoded to a temporary WAV file first, and must
+        decode to the audio that was archived.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Track: The archived track, with its SHA-256
+        :param Tags: The tags of the track
+        :returns: The transcoded track
+
+        """
+        Output = self._Transcoder.outputPath(Track)
+        Output.parent.mkdir(parents=True, exist_ok=True)
+
+        Compressor = archive.findArchiveCompressor(Track.RippedPath,
+                                                   self._Config)
+        if Compressor is None:
+            Transcoded = self._Transcoder.transcodeTrack(Track, Output)
+        else:
+            with TemporaryDirectory(dir=Output.parent,
+                                    prefix='.dartt-staging-') as Staging:
+                WavPath = Path(Staging) / Track.RippedPath.with_suffix(
+                    '.wav'
+                ).name
+                Hasher = Compressor.decodeToWav(Track.RippedPath, WavPath)
+                if Hasher.Checksums['sha256'] != Track.Checksums['sha256']:
+                    raise archive.ArchiveVerifyError(Track.RippedPath)
+                Transcoded = self._Transcoder.transcodeTrack(
+                    AudioTrack(WavPath, Track.TrackInfo, Track.Checksums),
+                    Output
+                )
+
+        if Transcoded.TranscodedPath is None:
+            # Silent tracks that are now skipped lose their old transcode.
+            Output.unlink(missing_ok=True)
+        elif self._Tag:
+            tagging.tagFile(Output, Tags, self._Padding)
+
+        # The track was hashed, so its transcode has a fingerprint.
+        assert Transcoded.Fingerprint is not None
+        self._Index.setTranscode(DiscID, int(Track.Number),
+                                 Transcoded.TranscodedPath,
+                                 Transcoded.Fingerprint)
+        return Transcoded
+
+    def updateTrack(
+            self,
+            DiscID: str,
+            Track: AudioTrack,
+            Tags: Dict[str, str]
+    ) -> Optional[transcoder.TranscodedTrack]:
+        """Hash a track that the index has no hash for, record the hash, and
+        transcode the track again if its transcode is stale.
+
+        :param DiscID: The MusicBrainz disc ID
+        :param Track: The archived track
+        :param Tags: The tags of the track
+        :returns: The transcoded track, or None if it was up to date
+
+        """
+        Track.Checksums['sha256'] = self.hashTrack(Track)
+        self._Index.setTrackHash(DiscID, int(Track.Number),
+                                 Track.Checksums['sha256'])
+        if not self.isStale(DiscID, Track):
+            return None
+        return self.retranscodeTrack(DiscID, Track, Tags)
+
+    def _submitDisc(
+            self,
+            Pool: Executor,
+            DiscID: str,
+            ReleaseID: Optional[str],
+            Title: Optional[str],
+            Artist: Optional[str],
+            Summary: RetranscodeSummary
+    ) -> DiscJobs:
+        """Check each track of a disc and start transcoding the stale ones.
+        Tracks without a hash must be read in full to be checked, so they are
+        hashed on the pool."""
+        Tracks = self.getTracks(DiscID, Artist)
+        # The tags the disc was tagged with when it was ripped, with its
+        # ReplayGain.
+        Recorded = self._Index.getTrackTags(DiscID)
+        Jobs: DiscJobs = []
+        for Track in Tracks:
+            Summary.Tracks += 1
+            Tags = Recorded.get(int(Track.Number), None)
+            if Tags is None:
+                Tags = getIndexedTrackTags(Track, DiscID, ReleaseID, Title,
+                                           Artist, len(Tracks))
+            if 'sha256' not in Track.Checksums:
+                Jobs.append((Track, Pool.submit(self.updateTrack, DiscID,
+                                                Track, Tags)))
+                continue
+
+            try:
+                if not self.isStale(DiscID, Track):
+                    continue
+            except (OSError, cue.CueSheetError) as Error:
+                logging.error(f'Cannot check {Track.RippedPath}: {Error}')
+                Summary.Failed += 1
+                Jobs.append((Track, None))
+                continue
+
+            Jobs.append((Track, Pool.submit(self.retranscodeTrack, DiscID,
+                                            Track, Tags)))
+        return Jobs
+
+    def _finishDisc(
+            self,
+            DiscID: str,
+            Jobs: DiscJobs,
+            Summary: RetranscodeSummary
+    ):
+        """Wait for a disc's transcodes, and checkpoint the disc if they all
+        succeeded."""
+        Failed = False
+        for Track, Job in Jobs:
+            if Job is None:
+                Failed = True
+                continue
+            try:
+                Transcoded = Job.result()
+            except (OSError, sh.ErrorReturnCode, subprocess.CalledProcessError,
+                    archive.ArchiveVerifyError, cue.CueSheetError) as Error:
+                logging.error(f'Could not retranscode {Track.RippedPath}: '
+                              f'{Error}')
+                Summary.Failed += 1
+                Failed = True
+                continue
+
+            if Transcoded is None:
+                continue
+            if Transcoded.TranscodedPath is None:
+                Summary.Skipped += 1
+            else:
+                Summary.Retranscoded += 1
+
+        if not Failed:
+            self._Checkpoint.complete(DiscID)
+
+    def run(self) -> RetranscodeSummary:
+        """Bring the transcodes of every archived disc up to date.  Tracks of
+        several discs are transcoded at once, but only a few discs are checked
+        ahead of the transcodes so that the checkpoint stays close to what has
+        been done.  The checkpoint is removed once every disc is done.
+
+        :returns: What was done
+
+        """
+        Summary = RetranscodeSummary()
+        # Each worker waits on a decoder or encoder process, so Jobs bounds the
+        # number of encoders running at once.
+        Pool = utils.getPool('retranscode', self._Jobs)
+        Pending: Deque[Tuple[str, DiscJobs]] = deque()
+        Outstanding = 0
+
+        try:
+            for DiscID, ReleaseID, Title, Artist in self._Index.getDiscs():
+                Summary.Discs += 1
+                if self._Checkpoint.isDone(DiscID):
+                    Summary.Resumed += 1
+                    continue
+
+                Jobs = self._submitDisc(Pool, DiscID, ReleaseID, Title, Artist,
+                                        Summary)
+                Pending.append((DiscID, Jobs))
+                Outstanding += len(Jobs)
+
+                # Keep every encoder busy, and no more.
+                while Pending and Outstanding > 2 * self._Jobs:
+                    Finished, FinishedJobs = Pending.popleft()
+                    self._finishDisc(Finished, FinishedJobs, Summary)
+                    Outstanding -= len(FinishedJobs)
+
+            while Pending:
+                Finished, FinishedJobs = Pending.popleft()
+                self._finishDisc(Finished, FinishedJobs, Summary)
+        finally:
+            self._Checkpoint.close()
+
+        if Summary.Failed:
+            logging.warning(f'Keeping {self._Checkpoint.path} so that a '
+                            'retranscode resumes with the failed discs')
+        else:
+            self._Checkpoint.remove()
+        logging.info(f'Retranscode: {Summary}')
+        return Summary
+
+def retranscode(Config: config.Config) -> RetranscodeSummary:
+    """Bring the transcodes of the archive up to date with the configured
+    encoder, resuming any interrupted retranscode.
+
+    :param Config: The dartt config
+    :returns: What was done
+
+    """
+    return Retranscoder(Config).run()
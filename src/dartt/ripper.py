@@ -20,16 +20,38 @@
 
 from abc import ABC, abstractmethod
 from collections.abc import Iterable
-from contextlib import chdir
+import io
 import logging
+import numpy as np
+import os
 from pathlib import Path
 import sh
+import shutil
+import subprocess
+import threading
 from tempfile import  TemporaryDirectory
-from typing import List
+import time
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
 
 import dartt.config as config
-from dartt.disc import AudioDisc, AudioTrack
+import dartt.cue as cue
+from dartt.disc import AudioDisc, AudioTrack, ImageTrack
+import dartt.journal as journal
+import dartt.manifest as manifest
+import dartt.musicbrainz as mb
+import dartt.progress as progress
+from dartt.transcoder import AudioTranscoder, TranscodedTrack
 import dartt.utils as utils
+import dartt.verify as verify
+
+# The size of the header cdparanoia writes to WAV files.
+WavHeaderSize = 44
+
+# The number of bytes of audio in a CD sector.
+SectorSize = 2352
+
+# The archive directory of discs MusicBrainz has no artist for.
+UnknownArtist = 'Unknown Artist'
 
 class Ripper(ABC):
     def __init__(
@@ -50,9 +72,111 @@ class AudioRipper(Ripper):
         super().__init__(Config)
         self._ArchivePath = Path(Config.getAudioArchiveDir())
 
-    def rip(self, Disc:  AudioDisc) -> List[AudioTrack]:
+    def rip(self, Disc: AudioDisc) -> List[AudioTrack]:
+        return list(self.ripTracks(Disc))
+
+    @abstractmethod
+    def ripTracks(self, Disc: AudioDisc) -> Iterator[AudioTrack]:
+        """Rip a disc, yielding each track as soon as it is archived so that
+        later stages can start on it while the rest of the disc is read."""
         pass
 
+    def streamTracks(
+            self,
+            Disc: AudioDisc,
+            Transcoder: AudioTranscoder,
+            Archive: bool
+    ) -> Iterator[TranscodedTrack]:
+        """Rip a disc and transcode it.  Rippers that cannot stream straight
+        into the transcoder archive the tracks and transcode those."""
+        return iter(Transcoder.transcode(self.ripTracks(Disc)))
+
+    def ripImage(self, Disc: AudioDisc) -> List[ImageTrack]:
+        """Rip a disc into a single WAV image with a CUE sheet."""
+        raise RuntimeError(f'{type(self).__name__} cannot rip disc images')
+
+    def getTrackInfo(
+            self,
+            Disc: AudioDisc,
+            Number: int
+    ) -> mb.TrackInfo:
+        """Return the info for a track, waiting for the disc info lookup.  A
+        track the lookup knows nothing of is still archived, under a name
+        made up from its number."""
+        for TrackInfo in Disc.getTrackInfo():
+            if f'{TrackInfo.Number}' == f'{Number}':
+                return TrackInfo
+
+        logging.warning(f'No track info for track {Number}')
+        return mb.TrackInfo({
+            'number': Number,
+            'recording': {
+                'title': f'Track {Number:>02}',
+                'artist-credit-phrase': UnknownArtist,
+            },
+        })
+
+    def getArtist(
+            self,
+            Disc: AudioDisc
+    ) -> str:
+        """Return the artist a disc is archived under."""
+        Artists = Disc.getArtists()
+        return Artists[0] if Artists else UnknownArtist
+
+    def getTitle(
+            self,
+            Disc: AudioDisc
+    ) -> str:
+        """Return the title a disc is archived under.  Discs MusicBrainz has
+        no title for are told apart by their disc ID."""
+        return Disc.getTitle() or Disc.id
+
+    def getArchiveTrackPath(
+            self,
+            Disc: AudioDisc,
+            TrackInfo: mb.TrackInfo
+    ) -> Path:
+        # TODO: Make this configurable.
+        return (self._ArchivePath / f'{self.getArtist(Disc)}' /
+                f'{self.getTitle(Disc)}' /
+                f'{TrackInfo.Number:>02}. {TrackInfo.Title}.wav')
+
+    def getArchiveImagePath(
+            self,
+            Disc: AudioDisc
+    ) -> Path:
+        # TODO: Make this configurable.
+        return (self._ArchivePath / f'{self.getArtist(Disc)}' /
+                f'{self.getTitle(Disc)}' / f'{self.getTitle(Disc)}.wav')
+
+    def writeImageCueSheet(
+            self,
+            Disc: AudioDisc,
+            ImagePath: Path,
+            Numbers: List[int],
+            Offsets: List[int]
+    ) -> Tuple[Path, List[mb.TrackInfo]]:
+        """Write the CUE sheet of an archived disc image.
+
+        :param Disc: The disc the image was ripped from
+        :param ImagePath: The WAV image
+        :param Numbers: The numbers of the tracks in the image
+        :param Offsets: The start of each track in the image, in sectors
+        :returns: The CUE sheet and the info of each track
+
+        """
+        TrackInfos = [ self.getTrackInfo(Disc, Number) for Number in Numbers ]
+        CuePath = ImagePath.with_suffix('.cue')
+        cue.writeCueSheet(
+            CuePath, ImagePath,
+            [ (Number, Offset, TrackInfo.Title, TrackInfo.Artist)
+              for Number, Offset, TrackInfo
+              in zip(Numbers, Offsets, TrackInfos) ],
+            self.getTitle(Disc), self.getArtist(Disc)
+        )
+        return CuePath, TrackInfos
+
 class VideoRipper(Ripper):
     def __init__(
             self,
@@ -71,47 +195,659 @@ class CDParanoiaRipper(AudioRipper):
         self.ArchivePath = Path(Config.getAudioArchiveDir())
         self.Args = [ '--batch', '--stderr-progress' ]
 
-    def rip(self, Disc: AudioDisc) -> List[AudioTrack]:
-        # TODO: Make this configurable.
-        ArchivePath = (self.ArchivePath / f'{Disc.getArtists()[0]}' /
-                       f'{Disc.getTitle()}')
-
-        ArchivePath.mkdir(parents=True, exist_ok=True)
-
-        with TemporaryDirectory() as TempDir:
-            with chdir(TempDir):
-                print(f'Ripping audio disc "{Disc.getTitle()}"')
-                for TrackInfo in Disc.getTrackInfo():
-                    print(f'Track {TrackInfo.Number:>02}: {TrackInfo.Title}')
-
-                cmd = sh.Command(self.CDParanoia)
-                running = cmd(self.Args, _bg=True, _out=utils.printOutputCallback,
-                              _out_bufsize=0, _err=utils.printOutputCallback,
-                              _err_bufsize=0)
-                running.wait()
-
-            Tracks = []
-            for TrackInfo in Disc.getTrackInfo():
-                # TODO: Make this configurable.
-                RippedPath = (Path(TempDir) /
-                              f'track{TrackInfo.Number:>02}.cdda.wav')
-                TrackPath = (ArchivePath /
-                             f'{TrackInfo.Number:>02}. {TrackInfo.Title}.wav')
-
-                logging.debug(
-                    f'RippedPath: {RippedPath} Exists: {RippedPath.exists()}'
-                )
-
-                if RippedPath.exists():
-                    RippedPath.rename(TrackPath)
-                    logging.debug(
-                        f'TrackPath: {TrackPath} Exists: {TrackPath.exists()}'
+        Mode = Config.getAudioRipMode()
+        if Mode not in ('paranoia', 'adaptive'):
+            raise RuntimeError(f'Unknown rip mode {Mode}')
+        self.Adaptive = Mode == 'adaptive'
+        self.AccurateRip = (verify.createAccurateRipClient(Config)
+                            if self.Adaptive else None)
+
+    # How often to record rip progress in the journal, in seconds.
+    CheckpointInterval = 1.0
+
+    def getDriveArgs(self, Disc: AudioDisc) -> List[str]:
+        """Return the cdparanoia options that select and tune the drive the
+        disc is in.  The read offset is corrected as cdparanoia reads, so the
+        rip lines up with other drives without rewriting any files."""
+        Drive = Disc.device
+        Capabilities = Drive.Capabilities
+        Args = [ '--force-cdrom-device', Drive.path ] if Drive.path else []
+        if Capabilities.ReadOffset:
+            Args += [ '--sample-offset', f'{Capabilities.ReadOffset}' ]
+        if Capabilities.ReadSpeed:
+            Args += [ '--force-read-speed', f'{Capabilities.ReadSpeed}' ]
+        return Args
+
+    def getStagingPath(self, Disc: AudioDisc) -> Path:
+        """Return the staging directory for a disc.  It is named for the disc
+        so that an interrupted rip finds it again."""
+        return self.ArchivePath / f'.dartt-staging-{Disc.id}'
+
+    def ripTracks(self, Disc: AudioDisc) -> Iterator[AudioTrack]:
+        # Stage the rip on the archive's filesystem so that archiving a track
+        # is a rename rather than a copy.
+        StagingPath = self.getStagingPath(Disc)
+        StagingPath.mkdir(parents=True, exist_ok=True)
+        Journal = journal.RipJournal(StagingPath / 'journal.json', Disc.id)
+        print(f'Ripping audio disc {Disc.id}')
+
+        Known = self._lookupAccurateRip(Disc) if self.Adaptive else None
+
+        for Number in Disc.getTrackNumbers():
+            Completed = Journal.getCompleted(Number)
+            if Completed is not None:
+                TrackPath = Path(Completed['path'])
+                if (TrackPath.exists() and
+                    TrackPath.stat().st_size == Completed['size']):
+                    print(f'Already ripped {TrackPath}')
+                    yield AudioTrack(TrackPath,
+                                     self.getTrackInfo(Disc, Number),
+                                     { Name: Completed[Name]
+                                       for Name in ('crc32', 'sha256')
+                                       if Name in Completed })
+                    continue
+
+            # TODO: Make this configurable.
+            RippedPath = StagingPath / f'track{Number:>02}.cdda.wav'
+
+            try:
+                if self.Adaptive:
+                    Parser, Hasher = self._ripTrackAdaptive(
+                        Disc, Number, RippedPath, Journal, Known
                     )
-                    print(f'Ripped {TrackPath}')
-                    Tracks.append(AudioTrack(TrackPath, TrackInfo))
+                else:
+                    Parser, Hasher = self._ripTrack(Disc, Number, RippedPath,
+                                                    Journal)
+            except sh.ErrorReturnCode as Error:
+                # Most likely a data track.
+                logging.warning(f'Could not rip track {Number}: {Error}')
+                continue
+            logging.info(f'Ripped {Parser.Progress}')
+
+            logging.debug(
+                f'RippedPath: {RippedPath} Exists: {RippedPath.exists()}'
+            )
+
+            if not RippedPath.exists():
+                continue
+
+            # The disc info lookup runs while the first track is read.  Naming
+            # the track is the first thing that needs it.
+            TrackInfo = self.getTrackInfo(Disc, Number)
+            TrackPath = self.getArchiveTrackPath(Disc, TrackInfo)
+            TrackPath.parent.mkdir(parents=True, exist_ok=True)
+
+            utils.moveFile(RippedPath, TrackPath)
+            manifest.AlbumManifest(TrackPath.parent).add(TrackPath, Hasher)
+            Journal.complete(Number, TrackPath, **Hasher.Checksums)
+            logging.debug(
+                f'TrackPath: {TrackPath} Exists: {TrackPath.exists()}'
+            )
+            print(f'Ripped {TrackPath}')
+            yield AudioTrack(TrackPath, TrackInfo, Hasher.Checksums)
+
+        # Only a finished disc gives up its journal.
+        shutil.rmtree(StagingPath)
+
+    def ripImage(self, Disc: AudioDisc) -> List[ImageTrack]:
+        """Rip a disc in one read into a WAV image and write a CUE sheet for
+        it from the disc's TOC.  The gaps between tracks are kept, there is
+        one file to write per disc, and the tracks are served from the image
+        rather than copied out of it.
 
+        :param Disc: The disc to rip
+        :returns: An ImageTrack for each track
+
+        """
+        StagingPath = self.getStagingPath(Disc)
+        StagingPath.mkdir(parents=True, exist_ok=True)
+        Journal = journal.RipJournal(StagingPath / 'journal.json', Disc.id)
+        print(f'Ripping audio disc {Disc.id} as an image')
+
+        Numbers = Disc.getTrackNumbers()
+        First, Last = Numbers[0], Numbers[-1]
+        Offsets = Disc.getTrackOffsets()
+
+        # The whole image is journaled as the first track.
+        Completed = Journal.getCompleted(First)
+        if (Completed is not None and Path(Completed['path']).exists() and
+            Path(Completed['path']).stat().st_size == Completed['size']):
+            ImagePath = Path(Completed['path'])
+            Parts: Optional[List[Optional[manifest.PCMHasher]]] = None
+            print(f'Already ripped {ImagePath}')
+        else:
+            RippedPath = StagingPath / 'disc.cdda.wav'
+            # Each track runs to the start of the next, as in the CUE sheet,
+            # and is hashed on its own as the image is read.
+            Hasher = manifest.SplitPCMHasher(
+                [ (Next - Offset) * SectorSize
+                  for Offset, Next in zip(Offsets, Offsets[1:]) ],
+                WavHeaderSize
+            )
+            Parser, _ = self._ripTrack(Disc, First, RippedPath, Journal,
+                                       Last=Last, Hasher=Hasher)
+            Parts = list(Hasher.Parts)
+            logging.info(f'Ripped {Parser.Progress}')
+
+            ImagePath = self.getArchiveImagePath(Disc)
+            ImagePath.parent.mkdir(parents=True, exist_ok=True)
+            utils.moveFile(RippedPath, ImagePath)
+            manifest.AlbumManifest(ImagePath.parent).add(ImagePath, Hasher)
+            Journal.complete(First, ImagePath, **Hasher.Checksums)
+            print(f'Ripped {ImagePath}')
+
+        CuePath, TrackInfos = self.writeImageCueSheet(
+            Disc, ImagePath, Numbers,
+            [ Offset - Offsets[0] for Offset in Offsets ]
+        )
+
+        # Each track's checksums cover only its own audio, as they would for
+        # a file of its own.  An image ripped before a restart is read again
+        # to hash them.
+        if Parts is None:
+            Parts = []
+            with cue.CueImage(cue.CueSheet(CuePath)) as Image:
+                for Number in Numbers:
+                    Views = Image.getTrackViews(Number)
+                    if Views is None:
+                        Parts.append(None)
+                        continue
+                    TrackHasher = manifest.PCMHasher(0)
+                    for View in Views:
+                        TrackHasher.update(View)
+                        View.release()
+                    Parts.append(TrackHasher)
+
+        Tracks = [ ImageTrack(ImagePath, CuePath, TrackInfo,
+                              TrackHasher.Checksums)
+                   for TrackInfo, TrackHasher in zip(TrackInfos, Parts)
+                   if TrackHasher is not None ]
+
+        # Only a finished disc gives up its journal.
+        shutil.rmtree(StagingPath)
         return Tracks
 
+    def _ripTrack(
+            self,
+            Disc: AudioDisc,
+            Number: int,
+            RippedPath: Path,
+            Journal: Optional[journal.RipJournal],
+            Paranoia: bool = True,
+            Last: Optional[int] = None,
+            Hasher: Optional[manifest.PCMHasher] = None
+    ) -> Tuple[progress.CDParanoiaProgressParser, manifest.PCMHasher]:
+        """Rip a track into RippedPath.  If the journal shows that an earlier
+        rip of the track was interrupted, keep the sectors it wrote and rip
+        only the rest of the track.  Without a journal the rip is neither
+        resumed nor checkpointed.  If Last is given, the rip runs on through
+        the end of track Last as one read.  The WAV file is hashed with Hasher
+        if it is given."""
+        End = Last if Last is not None else Number
+        Span = f'{Number}' if End == Number else f'{Number}-{End}'
+        Parser = progress.CDParanoiaProgressParser(Disc.id, Number)
+        Mode = [] if Paranoia else [ '--disable-paranoia' ]
+
+        First: Optional[int] = None
+        Verified = 0
+        Partial = Journal.getPartial(Number) if Journal else None
+        if Partial is not None and RippedPath.exists():
+            First, Sector = Partial
+            # Trust only what both the journal and the file agree on.
+            Verified = max(0, min(Sector - First + 1,
+                                  (RippedPath.stat().st_size - WavHeaderSize) //
+                                  SectorSize))
+
+        if Hasher is None:
+            Hasher = manifest.PCMHasher(WavHeaderSize)
+        if First is not None and Verified > 0:
+            logging.info(f'Resuming track {Number} at sector '
+                         f'{First + Verified}')
+            Output: BinaryIO = open(RippedPath, 'r+b')
+            Output.truncate(WavHeaderSize + Verified * SectorSize)
+            # The kept sectors have to be hashed again, but only those.
+            while Chunk := Output.read(1 << 20):
+                Hasher.update(Chunk)
+            # cdparanoia already wrote the WAV header, so rip the rest of the
+            # track as raw samples, in the WAV file's byte order rather than
+            # the host's.
+            Args = self.Args + self.getDriveArgs(Disc) + Mode + [
+                '--output-raw-little-endian', '--',
+                f'{Number}[.{Verified}]-{End}', '-'
+            ]
+        else:
+            Output = open(RippedPath, 'wb')
+            Args = self.Args + self.getDriveArgs(Disc) + Mode + [
+                '--', Span, '-'
+            ]
+
+        LastCheckpoint = time.monotonic()
+
+        def feed(Data: str):
+            nonlocal LastCheckpoint
+            Parser.feed(Data)
+            Progress = Parser.Progress
+            Start = First if First is not None else Progress.FirstSector
+            Now = time.monotonic()
+            if (Journal is None or Start is None or Progress.Sector is None or
+                Now - LastCheckpoint < self.CheckpointInterval):
+                return
+            LastCheckpoint = Now
+            Journal.checkpoint(Number, Start, Progress.Sector)
+
+        # cdparanoia writes the track to stdout, so each sample is hashed on
+        # its way to the file rather than read back afterward.
+        with Output:
+            cmd = sh.Command(self.CDParanoia)
+            # Run in the staging directory without changing the directory of
+            # the whole process, which every drive's thread shares.
+            running = cmd(Args, _bg=True, _cwd=RippedPath.parent,
+                          _out=manifest.HashingWriter(Output, Hasher),
+                          _out_bufsize=1 << 16,
+                          _err=feed, _err_bufsize=1)
+            running.wait()
+
+        return Parser, Hasher
+
+    def _ripTrackAdaptive(
+            self,
+            Disc: AudioDisc,
+            Number: int,
+            RippedPath: Path,
+            Journal: journal.RipJournal,
+            Known: Optional[List[Dict[int, int]]]
+    ) -> Tuple[progress.CDParanoiaProgressParser, manifest.PCMHasher]:
+        """Rip a track with a burst read and use paranoia only where the burst
+        read cannot be shown to be right.  A clean burst read that matches
+        AccurateRip, or a second burst read, is kept.  Otherwise the sectors
+        with errors or differences are re-read with paranoia, or the whole
+        track if there are too many of them."""
+        if Journal.getPartial(Number) is not None:
+            # An interrupted paranoia read.  Finish it the same way.
+            return self._ripTrack(Disc, Number, RippedPath, Journal)
+
+        Parser, Hasher = self._ripTrack(Disc, Number, RippedPath, None,
+                                        Paranoia=False)
+        Bad = self._getBadSectors(Parser)
+        if not Bad:
+            if self._isAccurate(Disc, Number, RippedPath, Known):
+                logging.info(f'Track {Number} matches AccurateRip')
+                return Parser, Hasher
+
+            CheckPath = RippedPath.with_suffix('.check')
+            try:
+                CheckParser, _ = self._ripTrack(Disc, Number, CheckPath, None,
+                                                Paranoia=False)
+                Bad = (self._getBadSectors(CheckParser) |
+                       self._compareSectors(RippedPath, CheckPath))
+            finally:
+                CheckPath.unlink(missing_ok=True)
+            if not Bad:
+                logging.info(f'Track {Number} read the same twice')
+                return Parser, Hasher
+
+        Sectors = (RippedPath.stat().st_size - WavHeaderSize) // SectorSize
+        if (len(Bad) > Sectors // 2 or
+            not self._repairSectors(Disc, Number, RippedPath, Bad)):
+            logging.info(f'Re-reading track {Number} with paranoia')
+            RippedPath.unlink()
+            return self._ripTrack(Disc, Number, RippedPath, Journal)
+
+        # The repaired sectors changed the audio, so hash it again.
+        Hasher = manifest.PCMHasher(WavHeaderSize)
+        with open(RippedPath, 'rb') as File:
+            while Chunk := File.read(1 << 20):
+                Hasher.update(Chunk)
+        return Parser, Hasher
+
+    def _getBadSectors(
+            self,
+            Parser: progress.CDParanoiaProgressParser
+    ) -> Set[int]:
+        """Return the sectors of a track that cdparanoia reported trouble
+        with, counting from the start of the track."""
+        First = Parser.Progress.FirstSector
+        if First is None:
+            return set()
+        return { Sector - First for Sector in Parser.Progress.BadSectors }
+
+    def _compareSectors(
+            self,
+            Path1: Path,
+            Path2: Path
+    ) -> Set[int]:
+        """Return the sectors that differ between two reads of a track."""
+        def readSectors(WavPath: Path) -> np.ndarray:
+            Count = (WavPath.stat().st_size - WavHeaderSize) // SectorSize
+            if Count <= 0:
+                return np.zeros((0, SectorSize), dtype=np.uint8)
+            return np.memmap(WavPath, dtype=np.uint8, mode='r',
+                             offset=WavHeaderSize, shape=(Count, SectorSize))
+
+        Sectors1 = readSectors(Path1)
+        Sectors2 = readSectors(Path2)
+        Common = min(len(Sectors1), len(Sectors2))
+        Different = np.flatnonzero(
+            (Sectors1[:Common] != Sectors2[:Common]).any(axis=1)
+        )
+        # Sectors only one read got are suspect too.
+        return (set(Different.tolist()) |
+                set(range(Common, max(len(Sectors1), len(Sectors2)))))
+
+    def _repairSectors(
+            self,
+            Disc: AudioDisc,
+            Number: int,
+            RippedPath: Path,
+            Bad: Set[int]
+    ) -> bool:
+        """Re-read sectors of a track with paranoia and write them over the
+        burst read.
+
+        :returns: False if a range could not be re-read exactly
+
+        """
+        Ranges: List[List[int]] = []
+        for Sector in sorted(Bad):
+            if Ranges and Sector == Ranges[-1][1] + 1:
+                Ranges[-1][1] = Sector
+            else:
+                Ranges.append([ Sector, Sector ])
+
+        cmd = sh.Command(self.CDParanoia)
+        with open(RippedPath, 'r+b') as File:
+            for Start, End in Ranges:
+                logging.info(f'Re-reading sectors {Start}-{End} of track '
+                             f'{Number} with paranoia')
+                Parser = progress.CDParanoiaProgressParser(Disc.id, Number)
+                Data = io.BytesIO()
+                try:
+                    # The WAV file is little-endian, whatever the host is.
+                    cmd(self.Args + self.getDriveArgs(Disc) + [
+                        '--output-raw-little-endian', '--',
+                        f'{Number}[.{Start}]-{Number}[.{End}]', '-'
+                    ], _out=Data, _err=Parser.feed, _err_bufsize=1)
+                except sh.ErrorReturnCode as Error:
+                    logging.warning(f'Could not re-read track {Number}: '
+                                    f'{Error}')
+                    return False
+                if len(Data.getbuffer()) != (End - Start + 1) * SectorSize:
+                    return False
+                os.pwrite(File.fileno(), Data.getbuffer(),
+                          WavHeaderSize + Start * SectorSize)
+        return True
+
+    def _isAccurate(
+            self,
+            Disc: AudioDisc,
+            Number: int,
+            RippedPath: Path,
+            Known: Optional[List[Dict[int, int]]]
+    ) -> bool:
+        if Known is None:
+            return False
+        Index = Disc.getTrackNumbers().index(Number)
+        if Index >= len(Known):
+            return False
+        CRCs = verify.accurateRipCRCs([ verify.readSamples(RippedPath) ],
+                                      Index == 0, Index == len(Known) - 1)
+        return any(Known[Index].get(CRC, 0) for CRC in CRCs)
+
+    def _lookupAccurateRip(
+            self,
+            Disc: AudioDisc
+    ) -> Optional[List[Dict[int, int]]]:
+        if self.AccurateRip is None:
+            return None
+        try:
+            return self.AccurateRip.lookup(Disc.getAccurateRipID())
+        except Exception as Error:
+            # Burst reads are still checked against a second read.
+            logging.warning(f'AccurateRip lookup failed: {Error}')
+            return None
+
+    def streamTracks(
+            self,
+            Disc: AudioDisc,
+            Transcoder: AudioTranscoder,
+            Archive: bool
+    ) -> Iterator[TranscodedTrack]:
+        """Rip a disc straight into the transcoder, without writing WAV files
+        unless Archive is set.  cdparanoia writes each track to a pipe that
+        feeds the encoder, through tee to archive the WAV as well.  The
+        encoder's audio never passes through Python; only the copy that tee
+        writes for the manifest checksums is read here.
+
+        :param Disc: The disc to rip
+        :param Transcoder: The transcoder to feed
+        :param Archive: Whether to also archive the WAV files
+        :returns: An iterator over the transcoded tracks
+
+        """
+        if not Transcoder.StreamInput:
+            logging.info(f'{Transcoder.Extension} encoder cannot stream, '
+                         'archiving first')
+            yield from super().streamTracks(Disc, Transcoder, Archive)
+            return
+
+        self.ArchivePath.mkdir(parents=True, exist_ok=True)
+        Transcoder.TranscodePath.mkdir(parents=True, exist_ok=True)
+        with (TemporaryDirectory(dir=self.ArchivePath,
+                                 prefix='.dartt-staging-') as ArchiveDir,
+              TemporaryDirectory(dir=Transcoder.TranscodePath,
+                                 prefix='.dartt-staging-') as TranscodeDir):
+            print(f'Streaming audio disc {Disc.id}')
+
+            for Number in Disc.getTrackNumbers():
+                RippedPath = (Path(ArchiveDir) / f'track{Number:>02}.cdda.wav'
+                              if Archive else None)
+                EncodedPath = (Path(TranscodeDir) /
+                               f'track{Number:>02}.{Transcoder.Extension}')
+
+                Start = time.monotonic()
+                Parser = progress.CDParanoiaProgressParser(Disc.id, Number)
+                try:
+                    Hasher = self._streamTrack(Disc, Number, Transcoder,
+                                               RippedPath, EncodedPath, Parser)
+                except subprocess.CalledProcessError as Error:
+                    # Most likely a data track.
+                    logging.warning(f'Could not rip track {Number}: {Error}')
+                    continue
+                Elapsed = time.monotonic() - Start
+
+                TrackInfo = self.getTrackInfo(Disc, Number)
+                TrackPath = self.getArchiveTrackPath(Disc, TrackInfo)
+                Output = Transcoder.outputPath(AudioTrack(TrackPath, TrackInfo))
+                Output.parent.mkdir(parents=True, exist_ok=True)
+                utils.moveFile(EncodedPath, Output)
+
+                # RippedPath and Hasher are only set when archiving.
+                if RippedPath is not None and Hasher is not None:
+                    TrackPath.parent.mkdir(parents=True, exist_ok=True)
+                    utils.moveFile(RippedPath, TrackPath)
+                    manifest.AlbumManifest(TrackPath.parent).add(TrackPath,
+                                                                 Hasher)
+                    Archived: Optional[Path] = TrackPath
+                    Checksums = Hasher.Checksums
+                    print(f'Ripped {TrackPath}')
+                else:
+                    Archived = None
+                    Checksums = None
+
+                print(f'Transcoded {Output}')
+                yield TranscodedTrack(AudioTrack(Archived, TrackInfo,
+                                                 Checksums),
+                                      Output, Elapsed)
+
+    def _streamTrack(
+            self,
+            Disc: AudioDisc,
+            Number: int,
+            Transcoder: AudioTranscoder,
+            RippedPath: Optional[Path],
+            EncodedPath: Path,
+            Parser: progress.CDParanoiaProgressParser
+    ) -> Optional[manifest.PCMHasher]:
+        # cdparanoia writes the track to stdout when the output file is '-'.
+        Rip = subprocess.Popen(
+            [ self.CDParanoia, '--stderr-progress' ] +
+            self.getDriveArgs(Disc) + [ '--', f'{Number}', '-' ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        assert Rip.stdout is not None
+
+        Processes: Tuple[subprocess.Popen, ...]
+        if not RippedPath:
+            Encode = subprocess.Popen(
+                Transcoder.command(Path('-'), EncodedPath), stdin=Rip.stdout
+            )
+            Rip.stdout.close()
+            # Only the progress text is read here, never the audio.
+            self._readProgress(Rip, Parser)
+            Hasher = None
+            Processes = (Rip, Encode)
+        else:
+            # tee archives the WAV and feeds the encoder.  It also writes a
+            # third copy to a pipe that is read here only to be hashed.
+            HashRead, HashWrite = os.pipe()
+            Tee = subprocess.Popen(
+                [ 'tee', str(RippedPath), f'/dev/fd/{HashWrite}' ],
+                stdin=Rip.stdout,
+                stdout=subprocess.PIPE,
+                pass_fds=(HashWrite,)
+            )
+            assert Tee.stdout is not None
+            os.close(HashWrite)
+            Encode = subprocess.Popen(
+                Transcoder.command(Path('-'), EncodedPath), stdin=Tee.stdout
+            )
+            Rip.stdout.close()
+            Tee.stdout.close()
+            Reader = threading.Thread(target=self._readProgress,
+                                      args=(Rip, Parser))
+            Reader.start()
+            Hasher = manifest.PCMHasher(WavHeaderSize)
+            with open(HashRead, 'rb', buffering=0) as Hashed:
+                while Chunk := Hashed.read(1 << 16):
+                    Hasher.update(Chunk)
+            Reader.join()
+            Processes = (Rip, Tee, Encode)
+
+        for Process in Processes:
+            Process.wait()
+        for Process in Processes:
+            if Process.returncode:
+                raise subprocess.CalledProcessError(Process.returncode,
+                                                    Process.args)
+        return Hasher
+
+    def _readProgress(
+            self,
+            Rip: subprocess.Popen,
+            Parser: progress.CDParanoiaProgressParser
+    ):
+        assert Rip.stderr is not None
+        with io.TextIOWrapper(Rip.stderr, errors='replace') as Progress:
+            for Line in Progress:
+                Parser.feed(Line)
+
+class ImageRipper(AudioRipper):
+    """Extract the audio tracks of a disc image.  The image is already an exact
+    copy of the disc, so there is nothing to read twice: the image is mapped
+    and each track is hashed and written from the same pages."""
+    def ripTracks(self, Disc: AudioDisc) -> Iterator[AudioTrack]:
+        print(f'Extracting audio disc {Disc.id}')
+
+        for Number in Disc.getTrackNumbers():
+            Extents = Disc.getTrackExtents(Number)
+            if Extents is None:
+                logging.info(f'Track {Number} is not an audio track')
+                continue
+
+            TrackInfo = self.getTrackInfo(Disc, Number)
+            TrackPath = self.getArchiveTrackPath(Disc, TrackInfo)
+            TrackPath.parent.mkdir(parents=True, exist_ok=True)
+
+            # Write beside the track so that an interrupted extraction never
+            # leaves a truncated track in the archive.
+            PartialPath = TrackPath.with_name(TrackPath.name + '.part')
+            Hasher = self._extractTrack(Extents, PartialPath)
+            os.replace(PartialPath, TrackPath)
+            manifest.AlbumManifest(TrackPath.parent).add(TrackPath, Hasher)
+            print(f'Ripped {TrackPath}')
+
+            yield AudioTrack(TrackPath, TrackInfo, Hasher.Checksums)
+
+    def ripImage(self, Disc: AudioDisc) -> List[ImageTrack]:
+        """Extract the audio tracks of a disc image into a single WAV image
+        with a CUE sheet of its own, as CDParanoiaRipper.ripImage would rip
+        the disc.  Data tracks are left out.
+
+        :param Disc: The disc image to extract
+        :returns: An ImageTrack for each track
+
+        """
+        print(f'Extracting audio disc {Disc.id} as an image')
+
+        Numbers = []
+        Extents = []
+        Sizes = []
+        for Number in Disc.getTrackNumbers():
+            TrackExtents = Disc.getTrackExtents(Number)
+            if TrackExtents is None:
+                logging.info(f'Track {Number} is not an audio track')
+                continue
+            Numbers.append(Number)
+            Extents.extend(TrackExtents)
+            Sizes.append(sum(Length for _, _, Length in TrackExtents))
+        if not Numbers:
+            return []
+
+        ImagePath = self.getArchiveImagePath(Disc)
+        ImagePath.parent.mkdir(parents=True, exist_ok=True)
+        PartialPath = ImagePath.with_name(ImagePath.name + '.part')
+        Hasher = manifest.SplitPCMHasher(Sizes[:-1], WavHeaderSize)
+        self._extractTrack(Extents, PartialPath, Hasher)
+        os.replace(PartialPath, ImagePath)
+        manifest.AlbumManifest(ImagePath.parent).add(ImagePath, Hasher)
+        print(f'Ripped {ImagePath}')
+
+        Offsets = [ sum(Sizes[:Position]) // SectorSize
+                    for Position in range(len(Sizes)) ]
+        CuePath, TrackInfos = self.writeImageCueSheet(Disc, ImagePath,
+                                                      Numbers, Offsets)
+        return [ ImageTrack(ImagePath, CuePath, TrackInfo, Part.Checksums)
+                 for TrackInfo, Part in zip(TrackInfos, Hasher.Parts) ]
+
+    def _extractTrack(
+            self,
+            Extents: List[cue.Extent],
+            TrackPath: Path,
+            Hasher: Optional[manifest.PCMHasher] = None
+    ) -> manifest.PCMHasher:
+        """Write the audio in Extents to a WAV file.  Each extent is read
+        once, through a map of the image.
+
+        :param Extents: The byte ranges of the track's audio in the image
+        :param TrackPath: The WAV file to write
+        :param Hasher: What to hash the WAV file with
+        :returns: The hashes of the audio
+
+        """
+        Header = cue.getWavHeader(sum(Length for _, _, Length in Extents))
+        if Hasher is None:
+            Hasher = manifest.PCMHasher(WavHeaderSize)
+        Hasher.update(Header)
+        with open(TrackPath, 'wb') as File, cue.CueImage() as Image:
+            File.write(Header)
+            for View in Image.getViews(Extents):
+                with View:
+                    Hasher.update(View)
+                    File.write(View)
+
+        return Hasher
+
 class MakeMKVRipper(VideoRipper):
     def __init__(
             self
@@ -0,0 +1,273 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Run rips on several drives at once.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+from typing import Iterable, List, Optional, Set
+
+import dartt.config as config
+from dartt.device import Device, DeviceNotReadyError
+
+class RipResult:
+    """The outcome of ripping the media in one drive."""
+    def __init__(
+            self,
+            Drive: Device,
+            Tracks: Optional[List] = None,
+            Error: Optional[Exception] = None,
+            Elapsed: float = 0.0
+    ):
+        """Construct a RipResult.
+
+        :param Drive: The drive that was ripped
+        :param Tracks: The ripped tracks, if any
+        :param Error: The error that stopped the rip, if any
+        :param Elapsed: Wall time spent on the drive, in seconds
+        :returns: A RipResult
+
+        """
+        self._Drive = Drive
+        self._Tracks = Tracks if Tracks is not None else []
+        self._Error = Error
+        self._Elapsed = Elapsed
+
+    @property
+    def Drive(self) -> Device:
+        return self._Drive
+
+    @property
+    def Tracks(self) -> List:
+        return self._Tracks
+
+    @property
+    def Error(self) -> Optional[Exception]:
+        return self._Error
+
+    @property
+    def Elapsed(self) -> float:
+        return self._Elapsed
+
+    @property
+    def NotReady(self) -> bool:
+        return isinstance(self._Error, DeviceNotReadyError)
+
+    @property
+    def Succeeded(self) -> bool:
+        return self._Error is None
+
+    def __repr__(self) -> str:
+        if self.Succeeded:
+            return (f'{self.Drive}: ripped {len(self.Tracks)} tracks in '
+                    f'{self.Elapsed:.1f}s')
+        return f'{self.Drive}: {self.Error}'
+
+class RipSummary:
+    """The collected results of ripping a set of drives."""
+    def __init__(
+            self,
+            Retain: bool = True
+    ):
+        """Construct a RipSummary.
+
+        :param Retain: Whether to keep every result, or only count them
+        :returns: A RipSummary
+
+        """
+        self._Retain = Retain
+        self._Results: List[RipResult] = []
+        self._Count = 0
+        self._FailedCount = 0
+        self._Lock = threading.Lock()
+
+    def add(self, Result: RipResult):
+        with self._Lock:
+            self._Count += 1
+            if not Result.Succeeded:
+                self._FailedCount += 1
+            if self._Retain:
+                self._Results.append(Result)
+
+    @property
+    def Results(self) -> List[RipResult]:
+        """The results, which are empty unless they are retained."""
+        with self._Lock:
+            return list(self._Results)
+
+    @property
+    def Count(self) -> int:
+        return self._Count
+
+    @property
+    def FailedCount(self) -> int:
+        return self._FailedCount
+
+    @property
+    def Failed(self) -> List[RipResult]:
+        return [Result for Result in self.Results if not Result.Succeeded]
+
+    @property
+    def NotReady(self) -> List[RipResult]:
+        return [Result for Result in self.Results if Result.NotReady]
+
+    def __repr__(self) -> str:
+        with self._Lock:
+            Count = self._Count
+            Succeeded = Count - self._FailedCount
+            Results = list(self._Results)
+        Lines = [f'Ripped {Succeeded} of {Count} drives']
+        Lines.extend(f'  {Result}' for Result in Results)
+        return '\n'.join(Lines)
+
+class DriveScheduler:
+    """Rip a set of drives concurrently, one worker per drive."""
+    def __init__(
+            self,
+            Config: config.Config,
+            Retain: bool = True
+    ):
+        """Construct a DriveScheduler.
+
+        :param Config: The dartt config
+        :param Retain: Whether to keep the result of every rip; a scheduler
+                       that serves drives indefinitely only counts them
+        :returns: A DriveScheduler
+
+        """
+        self._Config = Config
+        self._Summary = RipSummary(Retain)
+        self._Busy: Set[str] = set()
+        self._Lock = threading.Lock()
+
+    @property
+    def Summary(self) -> RipSummary:
+        return self._Summary
+
+    def ripDrive(
+            self,
+            Drive: Device
+    ) -> RipResult:
+        """Open the media in a drive and rip it.  Errors are recorded in the
+        result rather than raised so that one drive cannot stop the others.
+
+        :param Drive: The drive to rip
+        :returns: The RipResult for the drive
+
+        """
+        Start = time.monotonic()
+        try:
+            Media = Drive.open()
+            Tracks = Media.rip(self._Config)
+            logging.debug(f'Ripped tracks: {Tracks}')
+            Result = RipResult(Drive, Tracks,
+                               Elapsed=time.monotonic() - Start)
+        except DeviceNotReadyError as Error:
+            logging.info(str(Error))
+            Result = RipResult(Drive, Error=Error,
+                               Elapsed=time.monotonic() - Start)
+        except Exception as Error:
+            logging.exception(f'Failed to rip {Drive}')
+            Result = RipResult(Drive, Error=Error,
+                               Elapsed=time.monotonic() - Start)
+
+        self._Summary.add(Result)
+        return Result
+
+    def run(
+            self,
+            Drives: Iterable[Device]
+    ) -> RipSummary:
+        """Rip all drives and wait for them to finish.
+
+        :param Drives: The drives to rip
+        :returns: The RipSummary for the run
+
+        """
+        Drives = list(Drives)
+        if not Drives:
+            return self._Summary
+
+        with ThreadPoolExecutor(
+                max_workers=len(Drives),
+                thread_name_prefix='dartt-drive'
+        ) as Executor:
+            list(Executor.map(self.ripDrive, Drives))
+
+        return self._Summary
+
+    def submit(
+            self,
+            Executor: ThreadPoolExecutor,
+            Drive: Device
+    ) -> Optional[Future]:
+        """Start ripping a drive in the background unless it is already being
+        ripped.  udev may report several media changes for a single insertion,
+        so repeated requests for a busy drive are dropped.
+
+        :param Executor: The executor to run the rip on
+        :param Drive: The drive to rip
+        :returns: A future for the RipResult, or None if the drive is busy
+
+        """
+        with self._Lock:
+            if Drive.id in self._Busy:
+                logging.debug(f'{Drive} is already ripping')
+                return None
+            self._Busy.add(Drive.id)
+
+        def ripAndRelease() -> RipResult:
+            try:
+                Result = self.ripDrive(Drive)
+            finally:
+                with self._Lock:
+                    self._Busy.discard(Drive.id)
+            logging.info(str(Result))
+            return Result
+
+        return Executor.submit(ripAndRelease)
+
+    def serve(
+            self,
+            Drives: Iterable[Device]
+    ) -> RipSummary:
+        """Rip drives as they become available.  Unlike run, Drives may be an
+        unbounded stream such as the one produced by monitorOpticalDrives.
+
+        :param Drives: The drives to rip, in the order they have media
+        :returns: The RipSummary for every drive served
+
+        """
+        Pending: Set[Future] = set()
+        with ThreadPoolExecutor(thread_name_prefix='dartt-drive') as Executor:
+            try:
+                for Drive in Drives:
+                    Pending = { Job for Job in Pending if not Job.done() }
+                    Job = self.submit(Executor, Drive)
+                    if Job:
+                        Pending.add(Job)
+            finally:
+                wait(Pending)
+
+        return self._Summary
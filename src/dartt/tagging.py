@@ -0,0 +1,357 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Write disc metadata and ReplayGain into transcoded tracks.
+"""
+
+from abc import ABC, abstractmethod
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Type
+
+import mutagen
+import mutagen.apev2
+import mutagen.flac
+import mutagen.id3
+import mutagen.mp4
+import mutagen.oggopus
+import mutagen.oggvorbis
+
+import dartt.config as config
+from dartt.disc import AudioTrack
+import dartt.musicbrainz as mb
+from dartt.transcoder import TranscodedTrack
+import dartt.utils as utils
+
+# Opus gains are relative to EBU R128's -23 LUFS rather than ReplayGain's
+# -18 LUFS.
+OpusGainOffset = -5.0
+
+def getTrackTags(
+        Track: AudioTrack,
+        Info: mb.DiscInfo,
+        DiscID: str
+) -> Dict[str, str]:
+    """Return the tags of a track, named as Vorbis comments.  Taggers for
+    other formats map the names to their own.
+
+    :param Track: The track
+    :param Info: The disc info
+    :param DiscID: The MusicBrainz disc ID
+    :returns: The tags that have values
+
+    """
+    Tags = {
+        'title': Track.Title,
+        'artist': Track.Artist,
+        'album': Info.Title,
+        'albumartist': ', '.join(Info.Artists) if Info.Artists else None,
+        'tracknumber': f'{Track.Number}',
+        'tracktotal': f'{len(Info.Tracks)}' if Info.Tracks else None,
+        'date': Info.Date,
+        'barcode': Info.Barcode,
+        'musicbrainz_albumid': Info.ID,
+        'musicbrainz_discid': DiscID,
+    }
+
+    Gain = Track.ReplayGain
+    if Gain is not None:
+        if Gain.TrackGain is not None:
+            Tags['replaygain_track_gain'] = f'{Gain.TrackGain:.2f} dB'
+        Tags['replaygain_track_peak'] = f'{Gain.TrackPeak:.6f}'
+        if Gain.AlbumGain is not None:
+            Tags['replaygain_album_gain'] = f'{Gain.AlbumGain:.2f} dB'
+        Tags['replaygain_album_peak'] = f'{Gain.AlbumPeak:.6f}'
+
+    return { Name: f'{Value}' for Name, Value in Tags.items()
+             if Value is not None }
+
+def getPadding(Reserve: int) -> Callable[[mutagen.PaddingInfo], int]:
+    """Return a mutagen padding policy.  Tags are rewritten in place while at
+    least a quarter of the reserve is left, and otherwise the reserve is
+    restored, which rewrites the file.  A fresh transcode is rewritten once,
+    when it is first tagged, and later retags need not touch the audio.
+
+    :param Reserve: The padding to leave after the tags, in bytes
+    :returns: The padding policy
+
+    """
+    def pad(Info: mutagen.PaddingInfo) -> int:
+        return Info.padding if Info.padding >= Reserve // 4 else Reserve
+
+    return pad
+
+class Tagger(ABC):
+    """Base class for tag formats.  Each writes all of a file's tags in a
+    single save."""
+    def __init__(
+            self,
+            Padding: int
+    ):
+        self._Padding = getPadding(Padding)
+
+    @abstractmethod
+    def tag(self, FilePath: Path, Tags: Dict[str, str]):
+        """Replace the tags dartt writes in a file.
+
+        :param FilePath: The file to tag
+        :param Tags: The tags, named as Vorbis comments
+        :returns: Nothing
+
+        """
+        pass
+
+class VorbisTagger(Tagger):
+    """Vorbis comments, in FLAC, Ogg Vorbis and Opus files."""
+    Formats = {
+        '.flac': mutagen.flac.FLAC,
+        '.ogg': mutagen.oggvorbis.OggVorbis,
+        '.opus': mutagen.oggopus.OggOpus,
+    }
+
+    def tag(self, FilePath: Path, Tags: Dict[str, str]):
+        File = self.Formats[FilePath.suffix](FilePath)
+        if File.tags is None:
+            File.add_tags()
+        if isinstance(File, mutagen.oggopus.OggOpus):
+            Tags = getOpusTags(Tags)
+        # Setting a comment replaces every earlier value of it.
+        for Name, Value in Tags.items():
+            File[Name] = [ Value ]
+        File.save(padding=self._Padding)
+
+def getOpusTags(Tags: Dict[str, str]) -> Dict[str, str]:
+    """Return tags for an Opus file, which carries its gains as R128 tags of
+    Q7.8 fixed point dB and no peaks."""
+    OpusTags = { Name: Value for Name, Value in Tags.items()
+                 if not Name.startswith('replaygain_') }
+    for Scope in ('track', 'album'):
+        Gain = Tags.get(f'replaygain_{Scope}_gain', None)
+        if Gain is not None:
+            Value = (float(Gain.split()[0]) + OpusGainOffset) * 256
+            OpusTags[f'r128_{Scope}_gain'] = f'{round(Value)}'
+    return OpusTags
+
+class ID3Tagger(Tagger):
+    """ID3v2.4 tags, in MP3, MP2 and TTA files."""
+    Frames = {
+        'title': mutagen.id3.TIT2,
+        'artist': mutagen.id3.TPE1,
+        'album': mutagen.id3.TALB,
+        'albumartist': mutagen.id3.TPE2,
+        'date': mutagen.id3.TDRC,
+    }
+
+    # TXXX descriptions, as MusicBrainz Picard writes them.
+    Descriptions = {
+        'barcode': 'BARCODE',
+        'musicbrainz_albumid': 'MusicBrainz Album Id',
+        'musicbrainz_discid': 'MusicBrainz Disc Id',
+        'replaygain_track_gain': 'REPLAYGAIN_TRACK_GAIN',
+        'replaygain_track_peak': 'REPLAYGAIN_TRACK_PEAK',
+        'replaygain_album_gain': 'REPLAYGAIN_ALBUM_GAIN',
+        'replaygain_album_peak': 'REPLAYGAIN_ALBUM_PEAK',
+    }
+
+    def tag(self, FilePath: Path, Tags: Dict[str, str]):
+        try:
+            File = mutagen.id3.ID3(FilePath)
+        except mutagen.id3.ID3NoHeaderError:
+            File = mutagen.id3.ID3()
+
+        for Name, Frame in self.Frames.items():
+            File.delall(Frame.__name__)
+            if Name in Tags:
+                File.add(Frame(encoding=mutagen.id3.Encoding.UTF8,
+                               text=[ Tags[Name] ]))
+
+        File.delall('TRCK')
+        if 'tracknumber' in Tags:
+            Number = Tags['tracknumber']
+            if 'tracktotal' in Tags:
+                Number = f'{Number}/{Tags["tracktotal"]}'
+            File.add(mutagen.id3.TRCK(encoding=mutagen.id3.Encoding.UTF8,
+                                      text=[ Number ]))
+
+        for Name, Description in self.Descriptions.items():
+            File.delall(f'TXXX:{Description}')
+            if Name in Tags:
+                File.add(mutagen.id3.TXXX(encoding=mutagen.id3.Encoding.UTF8,
+                                          desc=Description,
+                                          text=[ Tags[Name] ]))
+
+        File.save(FilePath, v2_version=4, padding=self._Padding)
+
+class MP4Tagger(Tagger):
+    """iTunes style MP4 atoms, in M4A files."""
+    Atoms = {
+        'title': '\xa9nam',
+        'artist': '\xa9ART',
+        'album': '\xa9alb',
+        'albumartist': 'aART',
+        'date': '\xa9day',
+    }
+
+    # Freeform atoms, as MusicBrainz Picard writes them.
+    Freeform = {
+        'barcode': 'BARCODE',
+        'musicbrainz_albumid': 'MusicBrainz Album Id',
+        'musicbrainz_discid': 'MusicBrainz Disc Id',
+        'replaygain_track_gain': 'replaygain_track_gain',
+        'replaygain_track_peak': 'replaygain_track_peak',
+        'replaygain_album_gain': 'replaygain_album_gain',
+        'replaygain_album_peak': 'replaygain_album_peak',
+    }
+
+    def tag(self, FilePath: Path, Tags: Dict[str, str]):
+        File = mutagen.mp4.MP4(FilePath)
+        if File.tags is None:
+            File.add_tags()
+
+        for Name, Atom in self.Atoms.items():
+            if Name in Tags:
+                File[Atom] = [ Tags[Name] ]
+            elif Atom in File.keys():
+                del File[Atom]
+
+        if 'tracknumber' in Tags:
+            File['trkn'] = [ (int(Tags['tracknumber']),
+                              int(Tags.get('tracktotal', 0))) ]
+        elif 'trkn' in File.keys():
+            del File['trkn']
+
+        for Name, Description in self.Freeform.items():
+            Atom = f'----:com.apple.iTunes:{Description}'
+            if Name in Tags:
+                File[Atom] = [
+                    mutagen.mp4.MP4FreeForm(Tags[Name].encode('utf-8'))
+                ]
+            elif Atom in File.keys():
+                del File[Atom]
+
+        File.save(padding=self._Padding)
+
+class APETagger(Tagger):
+    """APEv2 tags, in Monkey's Audio, Musepack and WavPack files.  They sit at
+    the end of the file, so they never need padding."""
+    Keys = {
+        'title': 'Title',
+        'artist': 'Artist',
+        'album': 'Album',
+        'albumartist': 'Album Artist',
+        'tracknumber': 'Track',
+        'date': 'Year',
+        'barcode': 'Barcode',
+        'musicbrainz_albumid': 'MUSICBRAINZ_ALBUMID',
+        'musicbrainz_discid': 'MUSICBRAINZ_DISCID',
+        'replaygain_track_gain': 'REPLAYGAIN_TRACK_GAIN',
+        'replaygain_track_peak': 'REPLAYGAIN_TRACK_PEAK',
+        'replaygain_album_gain': 'REPLAYGAIN_ALBUM_GAIN',
+        'replaygain_album_peak': 'REPLAYGAIN_ALBUM_PEAK',
+    }
+
+    def tag(self, FilePath: Path, Tags: Dict[str, str]):
+        try:
+            File = mutagen.apev2.APEv2(FilePath)
+        except mutagen.apev2.APENoHeaderError:
+            File = mutagen.apev2.APEv2()
+
+        Tags = dict(Tags)
+        if 'tracknumber' in Tags and 'tracktotal' in Tags:
+            Tags['tracknumber'] = (f'{Tags["tracknumber"]}/'
+                                   f'{Tags["tracktotal"]}')
+        for Name, Key in self.Keys.items():
+            File.pop(Key, None)
+            if Name in Tags:
+                File[Key] = Tags[Name]
+        File.save(FilePath)
+
+Taggers: Dict[str, Type[Tagger]] = {
+    '.flac': VorbisTagger,
+    '.ogg': VorbisTagger,
+    '.opus': VorbisTagger,
+    '.mp3': ID3Tagger,
+    '.mp2': ID3Tagger,
+    '.tta': ID3Tagger,
+    '.m4a': MP4Tagger,
+    '.ape': APETagger,
+    '.mpc': APETagger,
+    '.wv': APETagger,
+}
+
+def createTagger(
+        FilePath: Path,
+        Padding: int
+) -> Optional[Tagger]:
+    """Return the tagger for a file, or None if its format is not known."""
+    Type = Taggers.get(Path(FilePath).suffix.lower(), None)
+    return Type(Padding) if Type is not None else None
+
+def tagFile(
+        FilePath: Path,
+        Tags: Dict[str, str],
+        Padding: int
+) -> bool:
+    """Tag a file, logging rather than raising on failure so that a file
+    mutagen cannot read does not fail the rip.
+
+    :param FilePath: The file to tag
+    :param Tags: The tags, named as Vorbis comments
+    :param Padding: The padding to leave after the tags, in bytes
+    :returns: Whether the file was tagged
+
+    """
+    Tagger = createTagger(FilePath, Padding)
+    if Tagger is None:
+        logging.warning(f'Cannot tag {FilePath}: unknown format')
+        return False
+    try:
+        Tagger.tag(Path(FilePath), Tags)
+    except (mutagen.MutagenError, OSError) as Error:
+        logging.warning(f'Cannot tag {FilePath}: {Error}')
+        return False
+    return True
+
+def tagTracks(
+        Tracks: Iterable[AudioTrack],
+        Info: mb.DiscInfo,
+        DiscID: str,
+        Config: config.Config
+) -> int:
+    """Tag the transcodes of an album's tracks in parallel.
+
+    :param Tracks: The tracks, which are tagged if they were transcoded
+    :param Info: The disc info
+    :param DiscID: The MusicBrainz disc ID
+    :param Config: The dartt config
+    :returns: The number of files tagged
+
+    """
+    Pool = utils.getPool('tag', Config.getAudioTranscodeJobs())
+    Padding = Config.getAudioTagPadding()
+    Jobs = [ Pool.submit(tagFile, Track.TranscodedPath,
+                         getTrackTags(Track, Info, DiscID), Padding)
+             for Track in Tracks
+             if isinstance(Track, TranscodedTrack) and
+             Track.TranscodedPath is not None ]
+    Tagged = sum(Job.result() for Job in Jobs)
+    logging.info(f'Tagged {Tagged} of {len(Jobs)} tracks of {DiscID}')
+    return Tagged
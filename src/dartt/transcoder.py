@@ -0,0 +1,503 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Transcode ripped audio with the configured encoder.
+"""
+
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sh
+import shutil
+import subprocess
+from tempfile import TemporaryDirectory
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+import dartt.analysis as analysis
+import dartt.config as config
+import dartt.cue as cue
+from dartt.disc import AudioTrack, ImageTrack
+import dartt.utils as utils
+
+class TranscodedTrack(AudioTrack):
+    """An archived track along with its transcoded copy."""
+    def __init__(
+            self,
+            Track: AudioTrack,
+            TranscodedPath: Optional[Path],
+            Elapsed: float,
+            Fingerprint: Optional[str] = None
+    ):
+        """Construct a TranscodedTrack.
+
+        :param Track: The archived track that was transcoded
+        :param TranscodedPath: The path of the transcoded file, or None if the
+                               track was skipped
+        :param Elapsed: Seconds spent transcoding the track
+        :param Fingerprint: What the track was transcoded from and how, if
+                            known
+        :returns: A TranscodedTrack
+
+        """
+        super().__init__(Track.RippedPath, Track.TrackInfo, Track.Checksums)
+        self.setReplayGain(Track.ReplayGain)
+        self.setSilence(Track.Silence)
+        self._TranscodedPath = TranscodedPath
+        self._Elapsed = Elapsed
+        self._Fingerprint = Fingerprint
+
+    @property
+    def TranscodedPath(self) -> Optional[Path]:
+        return self._TranscodedPath
+
+    @property
+    def Elapsed(self) -> float:
+        return self._Elapsed
+
+    @property
+    def Fingerprint(self) -> Optional[str]:
+        """The fingerprint of the archived audio and the encoder settings that
+        produced the transcoded file."""
+        return self._Fingerprint
+
+    def __repr__(self) -> str:
+        if self._TranscodedPath is None:
+            return f'Skipped: {self.Number}. {self.Title} - {self.Artist}'
+        return (f'{self._TranscodedPath}: {self.Number}. {self.Title} - '
+                f'{self.Artist} ({self.Elapsed:.1f}s)')
+
+_Versions: Dict[Tuple[str, float], str] = dict()
+_VersionLock = threading.Lock()
+
+def getEncoderVersion(
+        Command: str,
+        Arguments: List[str]
+) -> str:
+    """Return the first line an encoder prints about its version.  Versions are
+    cached until the encoder's executable changes.
+
+    :param Command: The encoder command
+    :param Arguments: The arguments that make the encoder print its version
+    :returns: The version, or an empty string if the encoder cannot say
+
+    """
+    Executable = shutil.which(Command)
+    if Executable is None:
+        return ''
+    Key = (Executable, os.stat(Executable).st_mtime)
+
+    with _VersionLock:
+        Version = _Versions.get(Key, None)
+        if Version is not None:
+            return Version
+
+    try:
+        Result = subprocess.run([ Executable, *Arguments ],
+                                stdin=subprocess.DEVNULL,
+                                capture_output=True, timeout=10)
+        Lines = (Result.stdout + Result.stderr).decode(errors='replace')
+        Version = next((Line.strip() for Line in Lines.splitlines()
+                        if Line.strip()), '')
+    except (OSError, subprocess.TimeoutExpired) as Error:
+        logging.warning(f'Cannot get the version of {Command}: {Error}')
+        Version = ''
+
+    with _VersionLock:
+        _Versions[Key] = Version
+    return Version
+
+class AudioTranscoder(ABC):
+    """Base class for audio encoders.  Subclasses map the config qualities to
+    encoder arguments and build the encoder command line."""
+
+    Extension: str = ''
+
+    # Whether the encoder can read a WAV stream from stdin, named '-'.
+    StreamInput: bool = True
+
+    # The arguments that make the encoder print its version.
+    VersionArguments: List[str] = [ '--version' ]
+
+    Qualities: Dict[str, List[str]] = {
+        'Very High': [],
+        'High': [],
+        'Medium': [],
+        'Low': [],
+    }
+
+    def __init__(
+            self,
+            Config: config.Config
+    ):
+        self._Command = Config.getAudioTranscoderCommand()
+        self._Quality = Config.getAudioQuality()
+        self._ArchivePath = Path(Config.getAudioArchiveDir())
+        self._TranscodePath = Path(Config.getAudioTranscodeDir())
+        self._Jobs = Config.getAudioTranscodeJobs()
+        self._SilenceThreshold = Config.getAudioSilenceThreshold()
+        self._TrimSilence = Config.getAudioTrimSilence()
+        self._SkipSilent = Config.getAudioSkipSilentTracks()
+
+    @property
+    def qualityArguments(self) -> List[str]:
+        return self.Qualities[self._Quality]
+
+    @property
+    def TranscodePath(self) -> Path:
+        return self._TranscodePath
+
+    @property
+    def Version(self) -> str:
+        return getEncoderVersion(self._Command, self.VersionArguments)
+
+    @property
+    def Settings(self) -> dict:
+        """Everything besides the archived audio that determines the
+        transcoded file."""
+        return {
+            'extension': self.Extension,
+            'encoder': Path(self._Command).name,
+            'version': self.Version,
+            'quality': self.qualityArguments,
+            'trim_silence': self._TrimSilence,
+            'skip_silent_tracks': self._SkipSilent,
+            'silence_threshold': (self._SilenceThreshold
+                                  if self._TrimSilence or self._SkipSilent
+                                  else None),
+        }
+
+    def getFingerprint(self, Track: AudioTrack) -> Optional[str]:
+        """Return the fingerprint of transcoding a track with the current
+        settings.  A transcoded file whose fingerprint differs is stale.
+
+        :param Track: The archived track
+        :returns: The fingerprint, or None if the track's audio was not hashed
+
+        """
+        SHA256 = Track.Checksums.get('sha256', None)
+        if SHA256 is None:
+            return None
+        Settings = json.dumps([ SHA256, self.Settings ], sort_keys=True)
+        return hashlib.sha256(Settings.encode()).hexdigest()
+
+    @abstractmethod
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        """Return the encoder arguments to transcode Input to Output."""
+        pass
+
+    def command(self, Input: Path, Output: Path) -> List[str]:
+        """Return the full encoder command line to transcode Input to
+        Output."""
+        return [ self._Command, *self.arguments(Input, Output) ]
+
+    def outputPath(self, Track: AudioTrack) -> Path:
+        """Return where to put the transcoded track.  The transcode directory
+        mirrors the layout of the archive.  A track of a disc image is named
+        as it would be if it had been archived on its own."""
+        RippedPath = (Track.RippedPath.parent / f'{Track.Name}.wav'
+                      if isinstance(Track, ImageTrack) else Track.RippedPath)
+        Relative = RippedPath.relative_to(self._ArchivePath)
+        return (self._TranscodePath / Relative).with_suffix(
+            f'.{self.Extension}'
+        )
+
+    def transcodeTrack(
+            self,
+            Track: AudioTrack,
+            Output: Optional[Path] = None
+    ) -> TranscodedTrack:
+        """Transcode a track.
+
+        :param Track: The archived track
+        :param Output: Where to write the transcoded file, rather than
+                       outputPath
+        :returns: The transcoded track
+
+        """
+        Output = Output or self.outputPath(Track)
+        Output.parent.mkdir(parents=True, exist_ok=True)
+        Fingerprint = self.getFingerprint(Track)
+
+        Start = time.monotonic()
+        Extents: Optional[List[cue.Extent]] = None
+        if self._TrimSilence or self._SkipSilent:
+            Extents = Track.getExtents()
+            Silence = Track.Silence
+            if Silence is None:
+                Silence = analysis.scanSilence(Extents, self._SilenceThreshold)
+                Track.setSilence(Silence)
+
+            if self._SkipSilent and Silence.IsSilent:
+                print(f'Skipped silent track {Track.Number}')
+                return TranscodedTrack(Track, None, time.monotonic() - Start,
+                                       Fingerprint)
+
+            if self._TrimSilence:
+                Audible, Length = Silence.Audible
+                SampleSize = 2 * analysis.Channels
+                Extents = cue.sliceExtents(Extents, Audible * SampleSize,
+                                           Length * SampleSize)
+        elif isinstance(Track, ImageTrack):
+            Extents = Track.getExtents()
+
+        if Extents is not None:
+            self._transcodeExtents(Track, Extents, Output)
+        else:
+            Cmd = sh.Command(self._Command)
+            Cmd(*self.arguments(Track.RippedPath, Output))
+        Elapsed = time.monotonic() - Start
+
+        logging.debug(f'Transcoded {Output} in {Elapsed:.1f}s')
+        print(f'Transcoded {Output}')
+        return TranscodedTrack(Track, Output, Elapsed, Fingerprint)
+
+    def _transcodeExtents(
+            self,
+            Track: AudioTrack,
+            Extents: List[cue.Extent],
+            Output: Path
+    ):
+        """Feed part of an archived file, such as a track of a disc image or
+        a track without its silence, to the encoder straight from memory
+        mapped files.  Encoders that cannot read stdin get a temporary WAV
+        file of the part instead."""
+        with cue.CueImage() as Image:
+            Views = Image.getViews(Extents)
+            Header = cue.getWavHeader(sum(len(View) for View in Views))
+            try:
+                if self.StreamInput:
+                    Encode = subprocess.Popen(self.command(Path('-'), Output),
+                                              stdin=subprocess.PIPE)
+                    assert Encode.stdin is not None
+                    with Encode.stdin:
+                        try:
+                            Encode.stdin.write(Header)
+                            for View in Views:
+                                Encode.stdin.write(View)
+                        except BrokenPipeError:
+                            # The encoder died.  Its exit status says why.
+                            pass
+                    if Encode.wait():
+                        raise subprocess.CalledProcessError(Encode.returncode,
+                                                            Encode.args)
+                    return
+
+                with TemporaryDirectory(dir=Output.parent,
+                                        prefix='.dartt-staging-') as Staging:
+                    WavPath = Path(Staging) / Output.with_suffix('.wav').name
+                    with open(WavPath, 'wb') as File:
+                        File.write(Header)
+                        for View in Views:
+                            File.write(View)
+                    Cmd = sh.Command(self._Command)
+                    Cmd(*self.arguments(WavPath, Output))
+            finally:
+                for View in Views:
+                    View.release()
+
+    def transcode(
+            self,
+            Tracks: Iterable[AudioTrack]
+    ) -> List[TranscodedTrack]:
+        """Transcode tracks in parallel.  Tracks may be a generator such as
+        Ripper.ripTracks, in which case each track starts transcoding as soon
+        as it is ripped.
+
+        :param Tracks: The tracks to transcode
+        :returns: The transcoded tracks, in the order given
+
+        """
+        # Each worker waits on an encoder process, so Jobs bounds the number
+        # of encoders running at once.
+        Pool = utils.getPool('transcode', self._Jobs)
+        Start = time.monotonic()
+        Jobs = [ Pool.submit(self.transcodeTrack, Track) for Track in Tracks ]
+        Transcoded = [ Job.result() for Job in Jobs ]
+
+        if Transcoded:
+            logging.info(
+                f'Transcoded {len(Transcoded)} tracks in '
+                f'{time.monotonic() - Start:.1f}s '
+                f'({sum(Track.Elapsed for Track in Transcoded):.1f}s encoding)'
+            )
+        return Transcoded
+
+class FDKAACTranscoder(AudioTranscoder):
+    Extension = 'm4a'
+    Qualities = {
+        'Very High': [ '-m', '5' ],
+        'High': [ '-m', '4' ],
+        'Medium': [ '-m', '3' ],
+        'Low': [ '-m', '2' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--silent', *self.qualityArguments, '-o', str(Output),
+                 str(Input) ]
+
+class FFmpegTranscoder(AudioTranscoder):
+    Extension = 'opus'
+    VersionArguments = [ '-version' ]
+    Qualities = {
+        'Very High': [ '-b:a', '256k' ],
+        'High': [ '-b:a', '192k' ],
+        'Medium': [ '-b:a', '128k' ],
+        'Low': [ '-b:a', '96k' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '-nostdin', '-y', '-loglevel', 'error', '-i', str(Input),
+                 '-c:a', 'libopus', *self.qualityArguments, str(Output) ]
+
+class FLACTranscoder(AudioTranscoder):
+    Extension = 'flac'
+    # FLAC is lossless, so quality trades encode time for size.
+    Qualities = {
+        'Very High': [ '-8' ],
+        'High': [ '-6' ],
+        'Medium': [ '-5' ],
+        'Low': [ '-3' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--silent', '--force', *self.qualityArguments, '-o',
+                 str(Output), str(Input) ]
+
+class LAMETranscoder(AudioTranscoder):
+    Extension = 'mp3'
+    Qualities = {
+        'Very High': [ '-V0' ],
+        'High': [ '-V2' ],
+        'Medium': [ '-V4' ],
+        'Low': [ '-V6' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--quiet', *self.qualityArguments, str(Input), str(Output) ]
+
+class MACTranscoder(AudioTranscoder):
+    Extension = 'ape'
+    StreamInput = False
+    Qualities = {
+        'Very High': [ '-c4000' ],
+        'High': [ '-c3000' ],
+        'Medium': [ '-c2000' ],
+        'Low': [ '-c1000' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ str(Input), str(Output), *self.qualityArguments ]
+
+class MPCTranscoder(AudioTranscoder):
+    Extension = 'mpc'
+    Qualities = {
+        'Very High': [ '--insane' ],
+        'High': [ '--extreme' ],
+        'Medium': [ '--standard' ],
+        'Low': [ '--radio' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--silent', '--overwrite', *self.qualityArguments,
+                 str(Input), str(Output) ]
+
+class OggEncTranscoder(AudioTranscoder):
+    Extension = 'ogg'
+    Qualities = {
+        'Very High': [ '-q', '8' ],
+        'High': [ '-q', '6' ],
+        'Medium': [ '-q', '4' ],
+        'Low': [ '-q', '2' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--quiet', *self.qualityArguments, '-o', str(Output),
+                 str(Input) ]
+
+class TwoLAMETranscoder(AudioTranscoder):
+    Extension = 'mp2'
+    Qualities = {
+        'Very High': [ '-b', '384' ],
+        'High': [ '-b', '256' ],
+        'Medium': [ '-b', '192' ],
+        'Low': [ '-b', '160' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '--quiet', *self.qualityArguments, str(Input), str(Output) ]
+
+class TTATranscoder(AudioTranscoder):
+    Extension = 'tta'
+    StreamInput = False
+    # TTA has no quality settings.
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '-e', str(Input), str(Output) ]
+
+class WavPackTranscoder(AudioTranscoder):
+    Extension = 'wv'
+    Qualities = {
+        'Very High': [ '-hh' ],
+        'High': [ '-h' ],
+        'Medium': [],
+        'Low': [ '-f' ],
+    }
+
+    def arguments(self, Input: Path, Output: Path) -> List[str]:
+        return [ '-q', '-y', *self.qualityArguments, str(Input), '-o',
+                 str(Output) ]
+
+AudioTranscoders: Dict[str, Type[AudioTranscoder]] = {
+    'fdkaac': FDKAACTranscoder,
+    'ffmpeg': FFmpegTranscoder,
+    'flac': FLACTranscoder,
+    'lame': LAMETranscoder,
+    'mac': MACTranscoder,
+    'mpcenc': MPCTranscoder,
+    'oggenc': OggEncTranscoder,
+    'twolame': TwoLAMETranscoder,
+    'tta': TTATranscoder,
+    'wavpack': WavPackTranscoder,
+}
+
+def createAudioTranscoder(
+        Config: config.Config
+) -> Optional[AudioTranscoder]:
+    """Create the configured audio transcoder.
+
+    :param Config: The dartt config
+    :returns: The transcoder, or None if no transcoder is configured
+
+    """
+    Type = Config.getAudioTranscoderType()
+    if not Type:
+        return None
+
+    Transcoder = AudioTranscoders.get(Type, None)
+    if Transcoder is None:
+        raise RuntimeError(f'Unknown audio transcoder {Type}')
+
+    return Transcoder(Config)
@@ -23,6 +23,13 @@ Utility functions for common tasks.
 """
 
 from collections.abc import Mapping, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import errno
+import multiprocessing
+import os
+from pathlib import Path
+import threading
+from typing import Dict, Tuple
 
 def yesno(
         Msg: str
@@ -94,3 +101,121 @@ def menu(
 
 def printOutputCallback(data: str):
     print(data, end='', flush=True)
+
+_Pools: Dict[Tuple[str, int], Executor] = dict()
+_PoolLock = threading.Lock()
+
+def getPool(
+        Name: str,
+        Jobs: int,
+        Processes: bool = False
+) -> Executor:
+    """Return the pool of a pipeline stage, shared by all drives.  Pools are
+    created on first use and live as long as the process.  Drives rip on
+    threads of their own, so process pools are not forked from this one.
+
+    :param Name: The name of the stage, which names its worker threads
+    :param Jobs: The number of workers
+    :param Processes: Run the workers in processes rather than threads
+    :returns: The pool
+
+    """
+    with _PoolLock:
+        Pool = _Pools.get((Name, Jobs), None)
+        if Pool is None:
+            if Processes:
+                Pool = ProcessPoolExecutor(
+                    max_workers=Jobs,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+            else:
+                Pool = ThreadPoolExecutor(max_workers=Jobs,
+                                          thread_name_prefix=f'dartt-{Name}')
+            _Pools[(Name, Jobs)] = Pool
+        return Pool
+
+def copyFile(
+        Source: Path,
+        Destination: Path,
+        Append: bool = False
+):
+    """Copy a file without passing its contents through user space.
+
+    :param Source: The file to copy
+    :param Destination: Where to copy it
+    :param Append: Add Source to the end of Destination instead of replacing it
+    :returns: Nothing
+
+    """
+    if not Append:
+        open(Destination, 'wb').close()
+    copyFileRange(Source, Destination, 0, os.stat(Source).st_size)
+
+def copyFileRange(
+        Source: Path,
+        Destination: Path,
+        Offset: int,
+        Length: int
+):
+    """Copy part of a file to the end of another without passing it through
+    user space.  This uses copy_file_range, which can share extents or copy
+    within the kernel, and falls back to sendfile where copy_file_range is not
+    supported, such as across some filesystems.
+
+    :param Source: The file to copy from
+    :param Destination: The file to add the range to; it must exist
+    :param Offset: Where the range starts in Source
+    :param Length: The number of bytes to copy
+    :returns: Nothing
+
+    """
+    with open(Source, 'rb') as In, open(Destination, 'r+b') as Out:
+        # Both calls write at the output's file offset.  O_APPEND is not
+        # allowed with copy_file_range, so seek to the end instead.
+        Out.seek(0, os.SEEK_END)
+        Length = max(0, min(Length, os.fstat(In.fileno()).st_size - Offset))
+        Copied = 0
+
+        try:
+            while Copied < Length:
+                Count = os.copy_file_range(In.fileno(), Out.fileno(),
+                                           Length - Copied, Offset + Copied)
+                if Count == 0:
+                    break
+                Copied += Count
+        except (AttributeError, OSError) as Error:
+            if (isinstance(Error, OSError) and
+                Error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                    errno.EOPNOTSUPP)):
+                raise
+
+        # sendfile takes an explicit input offset, so it picks up wherever
+        # copy_file_range stopped.
+        while Copied < Length:
+            Count = os.sendfile(Out.fileno(), In.fileno(), Offset + Copied,
+                                Length - Copied)
+            if Count == 0:
+                break
+            Copied += Count
+
+def moveFile(
+        Source: Path,
+        Destination: Path
+):
+    """Move a file.  Within a filesystem this is a rename.  Across filesystems
+    the file is copied with copyFile and the source removed.
+
+    :param Source: The file to move
+    :param Destination: Where to move it
+    :returns: Nothing
+
+    """
+    try:
+        os.rename(Source, Destination)
+        return
+    except OSError as Error:
+        if Error.errno != errno.EXDEV:
+            raise
+
+    copyFile(Source, Destination)
+    os.unlink(Source)
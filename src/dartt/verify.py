@@ -0,0 +1,386 @@
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Verify rips against the AccurateRip database.
+"""
+
+from abc import ABC, abstractmethod
+import logging
+from pathlib import Path
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+import dartt.config as config
+import dartt.cue as cue
+
+# A CD frame holds 588 stereo samples.
+SamplesPerSector = 588
+
+# AccurateRip ignores the first and last five sectors of a disc, which drives
+# cannot read reliably.
+SkipSamples = 5 * SamplesPerSector
+
+# Samples processed at once, which bounds the size of the temporary arrays.
+ChunkSamples = 1 << 20
+
+def readSamples(WavPath: Path) -> np.ndarray:
+    """Memory-map the samples of a WAV file.  Each stereo sample is one
+    little-endian 32-bit word with the left channel in the low half, which is
+    how AccurateRip reads them.
+
+    :param WavPath: The WAV file
+    :returns: A read-only array of samples backed by the file
+
+    """
+    Offset, Size = cue.getWavDataRange(WavPath)
+    Count = Size // 4
+    if Count == 0:
+        return np.zeros(0, dtype='<u4')
+    return np.memmap(WavPath, dtype='<u4', mode='r', offset=Offset,
+                     shape=(Count,))
+
+def accurateRipCRCs(
+        Segments: Sequence[np.ndarray],
+        First: bool,
+        Last: bool
+) -> Tuple[int, int]:
+    """Compute the AccurateRip v1 and v2 CRCs of a track.
+
+    :param Segments: The samples of the track, in order
+    :param First: Whether this is the first track of the disc
+    :param Last: Whether this is the last track of the disc
+    :returns: The v1 and v2 CRCs
+
+    """
+    Count = sum(len(Segment) for Segment in Segments)
+    Start = SkipSamples - 1 if First else 0
+    End = Count - SkipSamples if Last else Count
+
+    V1 = 0
+    V2 = 0
+    Position = 0
+    for Segment in Segments:
+        Low = max(Start, Position)
+        High = min(End, Position + len(Segment))
+        for ChunkStart in range(Low, High, ChunkSamples):
+            ChunkEnd = min(ChunkStart + ChunkSamples, High)
+            Samples = Segment[ChunkStart - Position:
+                              ChunkEnd - Position].astype(np.uint64)
+            # Sample positions count from one.  Products fit in 57 bits.
+            Products = np.multiply(Samples,
+                                   np.arange(ChunkStart + 1, ChunkEnd + 1,
+                                             dtype=np.uint64),
+                                   dtype=np.uint64)
+            LowWords = int((Products & 0xFFFFFFFF).sum())
+            V1 += LowWords
+            V2 += LowWords + int((Products >> 32).sum())
+        Position += len(Segment)
+
+    return V1 & 0xFFFFFFFF, V2 & 0xFFFFFFFF
+
+class DiscSamples:
+    """The samples of a whole disc, made of the memory-mapped tracks.  A drive's
+    read offset shifts every track by some samples, so with the offset applied
+    a track's samples may come partly from its neighbors or, at the ends of the
+    disc, be silence."""
+    def __init__(
+            self,
+            Tracks: Sequence[np.ndarray]
+    ):
+        self._Tracks = list(Tracks)
+        self._Starts = []
+        Start = 0
+        for Track in self._Tracks:
+            self._Starts.append(Start)
+            Start += len(Track)
+        self._Count = Start
+
+    def getSegments(
+            self,
+            Index: int,
+            Offset: int = 0
+    ) -> List[np.ndarray]:
+        """Return the samples of a track with a read offset applied, as views of
+        the tracks wherever possible.
+
+        :param Index: The position of the track on the disc
+        :param Offset: The read offset in samples
+        :returns: A list of sample arrays covering the track
+
+        """
+        Start = self._Starts[Index] + Offset
+        End = Start + len(self._Tracks[Index])
+
+        Segments = []
+        if Start < 0:
+            Segments.append(np.zeros(min(-Start, End - Start), dtype='<u4'))
+            Start = min(0, End)
+        for TrackStart, Track in zip(self._Starts, self._Tracks):
+            TrackEnd = TrackStart + len(Track)
+            if TrackEnd <= Start or TrackStart >= End:
+                continue
+            Segments.append(Track[max(Start, TrackStart) - TrackStart:
+                                  min(End, TrackEnd) - TrackStart])
+        if End > self._Count:
+            Segments.append(np.zeros(End - max(Start, self._Count),
+                                     dtype='<u4'))
+        return Segments
+
+class AccurateRipDiscID:
+    """The identifiers AccurateRip files a disc under, computed from its
+    TOC."""
+    def __init__(
+            self,
+            Offsets: Sequence[int],
+            LeadOut: int
+    ):
+        """Construct an AccurateRipDiscID.
+
+        :param Offsets: The first sector of each track, counting the two second
+                        lead-in
+        :param LeadOut: The lead-out sector, counting the lead-in
+        :returns: An AccurateRipDiscID
+
+        """
+        self._TrackCount = len(Offsets)
+        self._ID1 = 0
+        self._ID2 = 0
+        for Position, Offset in enumerate(Offsets, 1):
+            self._ID1 += Offset - 150
+            self._ID2 += max(Offset - 150, 1) * Position
+        self._ID1 += LeadOut - 150
+        self._ID2 += (LeadOut - 150) * (self._TrackCount + 1)
+        self._ID1 &= 0xFFFFFFFF
+        self._ID2 &= 0xFFFFFFFF
+
+        def digitSum(Number: int) -> int:
+            return sum(int(Digit) for Digit in str(Number))
+
+        Checksum = sum(digitSum(Offset // 75) for Offset in Offsets)
+        Length = LeadOut // 75 - Offsets[0] // 75
+        self._CDDBID = ((Checksum % 0xFF) << 24 | Length << 8 |
+                        self._TrackCount)
+
+    @classmethod
+    def fromTOC(cls, TOC: str):
+        """Construct an AccurateRipDiscID from a MusicBrainz TOC string of the
+        first and last track numbers, the lead-out and the track offsets."""
+        Numbers = [ int(Field) for Field in TOC.split() ]
+        return cls(Numbers[3:], Numbers[2])
+
+    @property
+    def TrackCount(self) -> int:
+        return self._TrackCount
+
+    @property
+    def ID1(self) -> int:
+        return self._ID1
+
+    @property
+    def ID2(self) -> int:
+        return self._ID2
+
+    @property
+    def CDDBID(self) -> int:
+        return self._CDDBID
+
+    @property
+    def path(self) -> str:
+        """The path of the disc's entry relative to the database root."""
+        return (f'{self.ID1 & 0xF:x}/{self.ID1 >> 4 & 0xF:x}/'
+                f'{self.ID1 >> 8 & 0xF:x}/dBAR-{self.TrackCount:03d}-'
+                f'{self.ID1:08x}-{self.ID2:08x}-{self.CDDBID:08x}.bin')
+
+    def __repr__(self) -> str:
+        return (f'{self.TrackCount:03d}-{self.ID1:08x}-{self.ID2:08x}-'
+                f'{self.CDDBID:08x}')
+
+def parseAccurateRipResponse(
+        Data: bytes,
+        TrackCount: int
+) -> List[Dict[int, int]]:
+    """Parse a dBAR file.  It holds one block per pressing, each with a CRC and
+    a confidence for every track.
+
+    :param Data: The contents of the dBAR file
+    :param TrackCount: The number of tracks on the disc
+    :returns: For each track, the confidence of each known CRC
+
+    """
+    Tracks: List[Dict[int, int]] = [ dict() for _ in range(TrackCount) ]
+    Position = 0
+    while Position + 13 <= len(Data):
+        Count, _, _, _ = struct.unpack_from('<BIII', Data, Position)
+        Position += 13
+        for Index in range(Count):
+            if Position + 9 > len(Data):
+                break
+            Confidence, CRC, _ = struct.unpack_from('<BII', Data, Position)
+            Position += 9
+            if Index < TrackCount:
+                Tracks[Index][CRC] = Tracks[Index].get(CRC, 0) + Confidence
+    return Tracks
+
+class AccurateRipClient(ABC):
+    """Look up the CRCs other rips of a disc produced."""
+    @abstractmethod
+    def lookup(
+            self,
+            DiscID: AccurateRipDiscID
+    ) -> Optional[List[Dict[int, int]]]:
+        """Look up a disc.
+
+        :param DiscID: The disc to look up
+        :returns: For each track, the confidence of each known CRC, or None if
+                  the disc is not in the database
+
+        """
+        pass
+
+class AccurateRipURLClient(AccurateRipClient):
+    """Fetch dBAR files from an AccurateRip database by URL.  Any URL urllib
+    can open works, so a file: URL serves a local copy of the database."""
+    def __init__(
+            self,
+            BaseURL: str,
+            Timeout: float = 10.0
+    ):
+        self._BaseURL = BaseURL.rstrip('/')
+        self._Timeout = Timeout
+
+    def lookup(
+            self,
+            DiscID: AccurateRipDiscID
+    ) -> Optional[List[Dict[int, int]]]:
+        URL = f'{self._BaseURL}/{DiscID.path}'
+        logging.debug(f'Fetching {URL}')
+        try:
+            with urllib.request.urlopen(URL, timeout=self._Timeout) as Response:
+                Data = Response.read()
+        except urllib.error.HTTPError as Error:
+            if Error.code == 404:
+                return None
+            raise
+        except urllib.error.URLError as Error:
+            if isinstance(Error.reason, FileNotFoundError):
+                return None
+            raise
+        return parseAccurateRipResponse(Data, DiscID.TrackCount)
+
+class TrackVerification:
+    """The result of verifying one track."""
+    def __init__(
+            self,
+            Number: int,
+            CRCv1: int,
+            CRCv2: int,
+            Confidence: Optional[int]
+    ):
+        """Construct a TrackVerification.
+
+        :param Number: The track number
+        :param CRCv1: The AccurateRip v1 CRC of the rip
+        :param CRCv2: The AccurateRip v2 CRC of the rip
+        :param Confidence: How many rips matched, or None if the disc could not
+                           be looked up
+        :returns: A TrackVerification
+
+        """
+        self._Number = Number
+        self._CRCv1 = CRCv1
+        self._CRCv2 = CRCv2
+        self._Confidence = Confidence
+
+    @property
+    def Number(self) -> int:
+        return self._Number
+
+    @property
+    def CRCv1(self) -> int:
+        return self._CRCv1
+
+    @property
+    def CRCv2(self) -> int:
+        return self._CRCv2
+
+    @property
+    def Confidence(self) -> Optional[int]:
+        return self._Confidence
+
+    @property
+    def Accurate(self) -> bool:
+        return bool(self._Confidence)
+
+    def __repr__(self) -> str:
+        if self._Confidence is None:
+            Status = 'not in database'
+        elif self._Confidence:
+            Status = f'accurate (confidence {self._Confidence})'
+        else:
+            Status = 'no match'
+        return (f'Track {self.Number:>02}: v1 {self.CRCv1:08x} '
+                f'v2 {self.CRCv2:08x} {Status}')
+
+def verifyDisc(
+        Tracks: Sequence[Tuple[int, Union[Path, np.ndarray]]],
+        DiscID: AccurateRipDiscID,
+        Client: Optional[AccurateRipClient],
+        Offset: int = 0
+) -> List[TrackVerification]:
+    """Verify the ripped tracks of a disc.
+
+    :param Tracks: The number and WAV path, or samples, of every track on the
+                   disc, in order
+    :param DiscID: The AccurateRip ID of the disc
+    :param Client: Where to look up the disc, or None to only compute CRCs
+    :param Offset: The drive's read offset in samples, if the rip did not
+                   correct for it
+    :returns: A TrackVerification for each track
+
+    """
+    Known = Client.lookup(DiscID) if Client else None
+    if Client and Known is None:
+        logging.info(f'Disc {DiscID} is not in AccurateRip')
+
+    Samples = DiscSamples([ Track if isinstance(Track, np.ndarray)
+                            else readSamples(Track) for _, Track in Tracks ])
+    Results = []
+    for Index, (Number, _) in enumerate(Tracks):
+        CRCv1, CRCv2 = accurateRipCRCs(Samples.getSegments(Index, Offset),
+                                       Index == 0, Index == len(Tracks) - 1)
+        Confidence = None
+        if Known is not None and Index < len(Known):
+            Confidence = (Known[Index].get(CRCv1, 0) +
+                          Known[Index].get(CRCv2, 0))
+        Results.append(TrackVerification(Number, CRCv1, CRCv2, Confidence))
+    return Results
+
+def createAccurateRipClient(
+        Config: config.Config
+) -> Optional[AccurateRipClient]:
+    """Return the client to look up discs with, or None when offline."""
+    if Config.getOption('offline', False):
+        return None
+    return AccurateRipURLClient(Config.getAccurateRipURL())
@@ -20,11 +20,55 @@
 # You should have received a copy of the GNU Affero General Public License along
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Callable, Dict, Iterable, Sequence, Type
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import struct
+import sys
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Type
 import pytest
 
 from dartt.config import Config
 
+def pytest_addoption(parser):
+    Group = parser.getgroup('dartt benchmarks')
+    Group.addoption('--bench', action='store_true',
+                    help='Run the throughput benchmarks')
+    Group.addoption('--bench-drives', type=int, default=4,
+                    help='Number of drives to simulate')
+    Group.addoption('--bench-sectors', type=int, default=750,
+                    help='Sectors in each track of the simulated discs')
+    Group.addoption('--bench-speed', type=float, default=0,
+                    help='Read speed of the simulated drives as a multiple of '
+                    'CD speed, or 0 for as fast as possible')
+    Group.addoption('--bench-json', default='benchmark.json',
+                    help='Where to write the benchmark results')
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'benchmark: a throughput benchmark, run with --bench'
+    )
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--bench'):
+        return
+    Skip = pytest.mark.skip(reason='benchmarks run with --bench')
+    for Item in items:
+        if 'benchmark' in Item.keywords:
+            Item.add_marker(Skip)
+
+@pytest.fixture(autouse=True)
+def musicbrainzScheduler(
+        monkeypatch
+):
+    """ Give each test its own process-wide MusicBrainz request scheduler, so
+    that a circuit opened by one test does not fail the next.
+
+    :param monkeypatch: A monkeypatcher
+
+    """
+    monkeypatch.setattr('dartt.musicbrainz._Scheduler', None)
+
 class InputLoopCounter:
     """Provide a certain input for some number of input iterations, then change
     it."""
@@ -184,8 +228,13 @@ def configFactory(
         'musicbrainz': {
             'user': 'dartt',
             'password_cmd': ["pass", "musicbrainz.org/password"],
+            'cache_file': str(tmp_path / 'home/me/cache/musicbrainz.sqlite'),
         },
         'base_output_dir': str(tmp_path / 'home/me'),
+        'index_file': str(tmp_path / 'home/me/share/archive.sqlite'),
+        'drives_file': str(tmp_path / 'home/me/share/drives.toml'),
+        'retranscode_checkpoint_file':
+            str(tmp_path / 'home/me/share/retranscode.log'),
         'audio': {
             'quality': 'Very High',
             'ripper': '/usr/bin/cdparanoia',
@@ -346,9 +395,10 @@ def MBFactory(
     return makeMB
 
 class MockDiscID:
-    def __init__(self):
-        self._ID = 'frobnitz'
-        self._TOC = 'weevoo'
+    def __init__(self, ID: str = 'frobnitz'):
+        self._ID = ID
+        # Two 75 sector tracks, as the fake cdparanoia rips them.
+        self._TOC = '0 1 300 150 225'
 
     @property
     def id(self):
@@ -358,12 +408,20 @@ class MockDiscID:
     def toc_string(self):
         return self._TOC
 
+    @property
+    def first_track_num(self):
+        return MockMB.releaseTracks()[0]['number']
+
+    @property
+    def last_track_num(self):
+        return MockMB.releaseTracks()[-1]['number']
+
 @pytest.fixture
 def DiscIDFactory(
         request
-) -> Callable[[], MockDiscID]:
-    def makeDiscID() -> MockDiscID:
-        return MockDiscID()
+) -> Callable[..., MockDiscID]:
+    def makeDiscID(ID: str = 'frobnitz') -> MockDiscID:
+        return MockDiscID(ID)
 
     return makeDiscID
 
@@ -372,7 +430,8 @@ class MockDevice:
             self,
             Name: str,
             Node: str,
-            Type: str
+            Type: str,
+            Action: str = 'change'
     ):
         if Type == 'CD':
             self._Properties = {
@@ -381,6 +440,8 @@ class MockDevice:
                 'ID_CDROM_MEDIA_SESSION_COUNT': '1',
                 'ID_CDROM_MEDIA_TRACK_COUNT': '21',
                 'ID_CDROM_MEDIA_TRACK_COUNT_AUDIO': '21',
+                'ID_VENDOR': 'HL-DT-ST',
+                'ID_MODEL': 'DVDRAM_GH24NSD1',
             }
         elif Type == 'DVD':
             self._Properties = {
@@ -430,6 +491,7 @@ class MockDevice:
         self._Properties['ID_CDROM'] = '1'
         self._SysName = Name
         self._DeviceNode = Node
+        self._Action = Action
 
     @property
     def properties(
@@ -454,6 +516,12 @@ class MockDevice:
     ) ->str:
         return self._DeviceNode
 
+    @property
+    def action(
+            self
+    ) -> str:
+        return self._Action
+
 @pytest.fixture
 def deviceFactory(
         request
@@ -461,9 +529,10 @@ def deviceFactory(
     def makeDevice(
             Name: str,
             Node: str,
-            DiscType: str
+            DiscType: str,
+            Action: str = 'change'
     ) -> MockDevice:
-        return MockDevice(Name, Node, DiscType)
+        return MockDevice(Name, Node, DiscType, Action)
 
     return makeDevice
 
@@ -511,3 +580,415 @@ def commandFactory(
         return MockCommand
 
     return makeCommand
+
+class MockMusicBrainzServer:
+    """A local HTTP server standing in for the MusicBrainz web service."""
+    Release = (
+        b'<?xml version="1.0" encoding="UTF-8"?>'
+        b'<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+        b'<disc id="frobnitz"><sectors>132</sectors>'
+        b'<release-list count="1"><release id="release-id">'
+        b'<title>A Great Release</title><date>Yesterday</date>'
+        b'<artist-credit><name-credit><artist id="a">'
+        b'<name>A. Great Artist</name></artist></name-credit></artist-credit>'
+        b'<medium-list count="1"><medium><track-list count="1">'
+        b'<track id="t"><number>1</number><length>20</length>'
+        b'<recording id="r"><title>Track 1</title><length>20</length>'
+        b'<artist-credit><name-credit><artist id="a"><name>AGA</name></artist>'
+        b'</name-credit></artist-credit></recording></track></track-list>'
+        b'</medium></medium-list></release></release-list></disc></metadata>'
+    )
+
+    def __init__(
+            self,
+            Responses: List[int]
+    ):
+        """Construct a MockMusicBrainzServer.
+
+        :param Responses: HTTP status codes to answer requests with, in order.
+        The last status is repeated once the others are used up.  Successful
+        requests return a release.
+        :returns: A MockMusicBrainzServer
+
+        """
+        self._Responses = list(Responses)
+        self._Requests = []
+        self._Lock = threading.Lock()
+
+        Server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with Server._Lock:
+                    Server._Requests.append(self.path)
+                    Status = (Server._Responses.pop(0)
+                              if len(Server._Responses) > 1
+                              else Server._Responses[0])
+                Body = Server.Release if Status == 200 else b''
+                self.send_response(Status)
+                self.send_header('Content-Type', 'application/xml')
+                self.send_header('Content-Length', str(len(Body)))
+                self.end_headers()
+                self.wfile.write(Body)
+
+            def log_message(self, *Args):
+                pass
+
+        self._Server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._Thread = threading.Thread(target=self._Server.serve_forever,
+                                        daemon=True)
+        self._Thread.start()
+
+    @property
+    def hostname(
+            self
+    ) -> str:
+        return f'127.0.0.1:{self._Server.server_address[1]}'
+
+    @property
+    def requests(
+            self
+    ) -> List[str]:
+        with self._Lock:
+            return list(self._Requests)
+
+    def shutdown(
+            self
+    ):
+        self._Server.shutdown()
+        self._Server.server_close()
+
+@pytest.fixture
+def musicbrainzServerFactory(
+        monkeypatch,
+        request
+) -> Callable[[List[int]], MockMusicBrainzServer]:
+    """ Return a factory to create a MockMusicBrainzServer.  musicbrainzngs is
+    pointed at the most recently created server.
+
+    :param monkeypatch: A monkeypatcher
+    :param request: A pytest request object
+    :returns: A MockMusicBrainzServer factory
+
+    """
+    Servers = []
+
+    def makeServer(
+            Responses: Optional[List[int]] = None
+    ) -> MockMusicBrainzServer:
+        Server = MockMusicBrainzServer(Responses or [ 200 ])
+        Servers.append(Server)
+        monkeypatch.setattr('musicbrainzngs.musicbrainz.hostname',
+                            Server.hostname)
+        monkeypatch.setattr('musicbrainzngs.musicbrainz.https', False)
+        # Leave pacing and retries to the scheduler under test.
+        # musicbrainzngs has no public way to stop retrying.
+        monkeypatch.setattr('musicbrainzngs.musicbrainz.do_rate_limit', False)
+        monkeypatch.setattr('musicbrainzngs.musicbrainz._safe_read.__defaults__',
+                            (None, 1, 2.0))
+        return Server
+
+    yield makeServer
+
+    for Server in Servers:
+        Server.shutdown()
+
+@pytest.fixture
+def scriptFactory(
+        tmp_path
+) -> Callable[[str, str], Path]:
+    """ Return a factory to create executable Python scripts standing in for
+    external commands.
+
+    :param tmp_path: A pytest tmp_path object
+    :returns: A script factory
+
+    """
+    BinDir = tmp_path / 'bin'
+    BinDir.mkdir()
+
+    def makeScript(
+            Name: str,
+            Source: str
+    ) -> Path:
+        """ Create a script.
+
+        :param Name: The command name
+        :param Source: The Python source of the command
+        :returns: The path to the script
+
+        """
+        Script = BinDir / Name
+        Script.write_text(f'#!{sys.executable}\n{Source}')
+        Script.chmod(0o755)
+        return Script
+
+    return makeScript
+
+class FakeCDParanoia:
+    """A fake cdparanoia that writes real WAV data, either to trackNN.cdda.wav
+    in batch mode, to a named file, or to stdout."""
+    Source = """
+import os
+import re
+import struct
+import sys
+import time
+
+SECTORS = {Sectors}
+SECONDS_PER_SECTOR = {SecondsPerSector}
+FAIL_TRACKS = {FailTracks}
+BURST_ERRORS = {BurstErrors}
+
+Args = sys.argv[1:]
+Span = Args[Args.index('--') + 1]
+Output = Args[Args.index('--') + 2] if len(Args) > Args.index('--') + 2 else None
+Number = int(Span.split('[')[0].split('-')[0])
+if Number in FAIL_TRACKS:
+    sys.exit(1)
+# A span of N[.S]-N[.E] runs from S sectors into the track through sector E.
+Bounds = re.match(r'\\d+(?:\\[\\.(\\d+)\\])?(?:-(\\d+)(?:\\[\\.(\\d+)\\])?)?',
+                  Span)
+Offset = int(Bounds.group(1)) if Bounds.group(1) else 0
+Last = int(Bounds.group(2)) if Bounds.group(2) else Number
+End = int(Bounds.group(3)) + 1 if Bounds.group(3) else SECTORS
+Raw = '--output-raw-little-endian' in Args
+# Without paranoia, the sectors in BURST_ERRORS read differently every time.
+Burst = '--disable-paranoia' in Args
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'cdparanoia.log'),
+          'a') as Log:
+    Log.write(' '.join(Args) + '\\n')
+
+First = Number * SECTORS + Offset
+Count = Last * SECTORS + End - First
+Size = Count * 2352
+Header = (b'RIFF' + struct.pack('<I', Size + 36) + b'WAVEfmt ' +
+          struct.pack('<IHHIIHH', 16, 1, 2, 44100, 176400, 4, 16) +
+          b'data' + struct.pack('<I', Size))
+
+if Output == '-':
+    Out = sys.stdout.buffer
+elif Output:
+    Out = open(Output, 'wb')
+else:
+    Out = open(f'track{{Number:02}}.cdda.wav', 'wb')
+
+sys.stderr.write(f'Ripping from sector {{First:>7}} '
+                 f'(track {{Number:>2}} [0:00.00])\\n'
+                 f'\\t  to sector {{First + Count - 1:>7}} '
+                 f'(track {{Last:>2}} [0:01.00])\\n\\n')
+
+if not Raw:
+    Out.write(Header)
+Sectors = {{}}
+for Index in range(Count):
+    Track, TrackIndex = divmod(First + Index, SECTORS)
+    Position = (First + Index) * 1176
+    sys.stderr.write(f'##: 0 [read] @ {{Position}}\\n')
+    if Burst and TrackIndex in BURST_ERRORS.get(Track, ()):
+        Out.write(os.urandom(2352))
+    else:
+        if Track not in Sectors:
+            Sectors[Track] = bytes((Track * 7 + Byte) % 256
+                                   for Byte in range(2352))
+        Out.write(Sectors[Track])
+    sys.stderr.write(f'##: -2 [wrote] @ {{Position + 1175}}\\n')
+    if SECONDS_PER_SECTOR:
+        time.sleep(SECONDS_PER_SECTOR)
+Out.flush()
+"""
+
+    def __init__(
+            self,
+            Path: Path,
+            Sectors: int
+    ):
+        self._Path = Path
+        self._Sectors = Sectors
+
+    @property
+    def path(
+            self
+    ) -> Path:
+        return self._Path
+
+    def calls(
+            self
+    ) -> List[List[str]]:
+        """Return the arguments of each run so far."""
+        Log = self._Path.parent / 'cdparanoia.log'
+        if not Log.exists():
+            return []
+        return [ Line.split(' ') for Line in Log.read_text().splitlines() ]
+
+    def pcm(
+            self,
+            Number: int
+    ) -> bytes:
+        """Return the PCM data written for a track."""
+        return (bytes((Number * 7 + Index) % 256 for Index in range(2352)) *
+                self._Sectors)
+
+@pytest.fixture
+def fakeCDParanoiaFactory(
+        scriptFactory
+) -> Callable[..., FakeCDParanoia]:
+    """ Return a factory to create a FakeCDParanoia.
+
+    :param scriptFactory: A script factory
+    :returns: A FakeCDParanoia factory
+
+    """
+    def makeCDParanoia(
+            Sectors: int = 75,
+            SecondsPerSector: float = 0,
+            FailTracks: Sequence[int] = (),
+            BurstErrors: Optional[Dict[int, Sequence[int]]] = None
+    ) -> FakeCDParanoia:
+        """ Create a FakeCDParanoia.
+
+        :param Sectors: The number of sectors in each track
+        :param SecondsPerSector: Time to spend "reading" each sector
+        :param FailTracks: Tracks that cannot be read
+        :param BurstErrors: For each track, the sectors that read wrong
+                            without paranoia
+        :returns: A FakeCDParanoia
+
+        """
+        Script = scriptFactory('cdparanoia', FakeCDParanoia.Source.format(
+            Sectors=Sectors,
+            SecondsPerSector=SecondsPerSector,
+            FailTracks=list(FailTracks),
+            BurstErrors={ Number: list(Indices) for Number, Indices
+                          in (BurstErrors or {}).items() }
+        ))
+        return FakeCDParanoia(Script, Sectors)
+
+    return makeCDParanoia
+
+FakeEncoderSource = """
+import shutil
+import sys
+
+Args = sys.argv[1:]
+if Args in ([ '--version' ], [ '-version' ]):
+    print('{Version}')
+    sys.exit(0)
+Output = Args[Args.index('-o') + 1]
+Input = Args[-1]
+with open(Output, 'wb') as Out:
+    if Input == '-':
+        shutil.copyfileobj(sys.stdin.buffer, Out)
+    else:
+        with open(Input, 'rb') as In:
+            shutil.copyfileobj(In, Out)
+"""
+
+@pytest.fixture
+def fakeEncoderFactory(
+        scriptFactory
+) -> Callable[[str], Path]:
+    """ Return a factory to create a fake encoder that copies its input, a file
+    or stdin, to the file named by -o, and prints its version.
+
+    :param scriptFactory: A script factory
+    :returns: A fake encoder factory
+
+    """
+    def makeEncoder(
+            Name: str = 'flac',
+            Version: str = 'fake 1.0'
+    ) -> Path:
+        return scriptFactory(Name, FakeEncoderSource.format(Version=Version))
+
+    return makeEncoder
+
+FakeArchiverSource = """
+import sys
+import zlib
+
+CORRUPT = {Corrupt}
+
+Args = sys.argv[1:]
+Input = [ Arg for Position, Arg in enumerate(Args)
+          if not Arg.startswith('-') and
+          (Position == 0 or Args[Position - 1] != '-o') ][0]
+with open(Input, 'rb') as In:
+    Data = In.read()
+if '--decode' in Args or '--raw' in Args:
+    # Decode to raw PCM on stdout.
+    PCM = zlib.decompress(Data)[44:]
+    if CORRUPT:
+        PCM = bytes([ PCM[0] ^ 1 ]) + PCM[1:]
+    sys.stdout.buffer.write(PCM)
+else:
+    Output = Args[Args.index('-o') + 1]
+    with open(Output, 'wb') as Out:
+        Out.write(zlib.compress(Data))
+"""
+
+@pytest.fixture
+def fakeArchiverFactory(
+        scriptFactory
+) -> Callable[..., Path]:
+    """ Return a factory to create a fake lossless encoder and decoder.  It
+    compresses a WAV file with zlib to the file named by -o, and decodes one
+    to raw PCM on stdout.
+
+    :param scriptFactory: A script factory
+    :returns: A fake archiver factory
+
+    """
+    def makeArchiver(
+            Name: str = 'flac',
+            Corrupt: bool = False
+    ) -> Path:
+        """ Create a fake archiver.
+
+        :param Name: The name of the command
+        :param Corrupt: Decode to audio that differs from what was encoded
+        :returns: The path to the fake archiver
+
+        """
+        return scriptFactory(Name, FakeArchiverSource.format(Corrupt=Corrupt))
+
+    return makeArchiver
+
+@pytest.fixture
+def accurateRipFactory(
+        tmp_path
+) -> Callable[..., str]:
+    """ Return a factory to create a local AccurateRip database.
+
+    :param tmp_path: A pytest tmp_path object
+    :returns: An AccurateRip database factory
+
+    """
+    Root = tmp_path / 'accuraterip'
+
+    def makeAccurateRip(
+            DiscID = None,
+            CRCs: Sequence[int] = (),
+            Confidence: int = 3
+    ) -> str:
+        """ Add a disc to the database.
+
+        :param DiscID: The AccurateRipDiscID of the disc, or None for an empty
+                       database
+        :param CRCs: The CRC of each track
+        :param Confidence: How many rips submitted the CRCs
+        :returns: The database URL
+
+        """
+        Root.mkdir(parents=True, exist_ok=True)
+        if DiscID is not None:
+            Data = struct.pack('<BIII', DiscID.TrackCount, DiscID.ID1,
+                               DiscID.ID2, DiscID.CDDBID)
+            for CRC in CRCs:
+                Data += struct.pack('<BII', Confidence, CRC, 0)
+            Entry = Root / DiscID.path
+            Entry.parent.mkdir(parents=True, exist_ok=True)
+            Entry.write_bytes(Data)
+        return Root.as_uri()
+
+    return makeAccurateRip
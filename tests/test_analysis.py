@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+import math
+import numpy as np
+import pytest
+
+import dartt.analysis as analysis
+import dartt.cue as cue
+
+def makeSine(
+        Seconds: float,
+        Level: float,
+        Frequency: float = 997.0
+) -> np.ndarray:
+    """Return a stereo sine at Level dBFS."""
+    Time = np.arange(round(Seconds * analysis.SampleRate)) / analysis.SampleRate
+    Samples = (10 ** (Level / 20) * 32767 *
+               np.sin(2 * np.pi * Frequency * Time)).astype('<i2')
+    return np.stack((Samples, Samples), axis=1)
+
+def measure(
+        Samples: np.ndarray,
+        Chunk: int = 100000
+) -> analysis.LoudnessMeter:
+    Meter = analysis.LoudnessMeter()
+    for Start in range(0, len(Samples), Chunk):
+        Meter.feed(Samples[Start:Start + Chunk])
+    return Meter
+
+@pytest.mark.parametrize('Frequency, Level', [
+    (997.0, -23.0),
+    (997.0, -33.0),
+    (25.0, None),
+])
+def test_analysis_sine(
+        Frequency: float,
+        Level: float
+):
+    Samples = makeSine(20, Level if Level is not None else -23.0, Frequency)
+    Meter = measure(Samples)
+    if Level is None:
+        # K-weighting all but removes a 25 Hz tone.
+        assert Meter.Histogram.Loudness < -30
+    else:
+        assert Meter.Histogram.Loudness == pytest.approx(Level, abs=0.1)
+    assert Meter.Peak == pytest.approx(np.abs(Samples).max() / 32768)
+
+def test_analysis_chunks():
+    # The result does not depend on how the audio is fed.
+    Samples = makeSine(5, -20.0)
+    Loudness = [ measure(Samples, Chunk).Histogram.Loudness
+                 for Chunk in (1000, 4410, 65536, len(Samples)) ]
+    assert max(Loudness) - min(Loudness) < 1e-9
+
+def test_analysis_gating():
+    # The EBU Tech 3341 gating case: the quiet parts are gated out.
+    Samples = np.concatenate((makeSine(10, -36.0), makeSine(60, -23.0),
+                              makeSine(10, -36.0)))
+    assert measure(Samples).Histogram.Loudness == pytest.approx(-23.0, abs=0.1)
+
+    # Silence is gated out entirely.
+    Silence = analysis.LoudnessMeter()
+    Silence.feed(np.zeros((analysis.SampleRate, 2), dtype='<i2'))
+    assert Silence.Histogram.Count == 0
+    assert Silence.Histogram.Loudness is None
+
+def test_analysis_album():
+    Loud = makeSine(10, -20.0)
+    Quiet = makeSine(30, -30.0)
+    Album = (measure(Loud).Histogram + measure(Quiet).Histogram).Loudness
+    # Adding histograms matches measuring the album in one go, but for the
+    # blocks that would straddle the tracks.
+    assert Album == pytest.approx(
+        measure(np.concatenate((Loud, Quiet))).Histogram.Loudness, abs=0.05
+    )
+    assert Album == pytest.approx(
+        10 * math.log10((10 * 10 ** -2 + 30 * 10 ** -3) / 40), abs=0.1
+    )
+
+def test_analysis_tracks(
+        tmp_path
+):
+    Loud = makeSine(6, -20.0)
+    Quiet = makeSine(4, -30.0)
+    ImagePath = tmp_path / 'Disc.wav'
+    Audio = Loud.tobytes() + Quiet.tobytes()
+    ImagePath.write_bytes(cue.getWavHeader(len(Audio)) + Audio)
+
+    Gains, Silences = analysis.analyzeTracks([
+        (1, [ (ImagePath, 44, len(Loud.tobytes())) ]),
+        # Silence before the track counts as part of it.
+        (2, [ (None, 0, 2 * analysis.SampleRate * 4),
+              (ImagePath, 44 + len(Loud.tobytes()), len(Quiet.tobytes())) ]),
+    ], 2)
+
+    assert Gains[1].TrackGain == pytest.approx(2.0, abs=0.1)
+    # The blocks running out of the silence are a little quieter.
+    assert Gains[2].TrackGain == pytest.approx(12.0, abs=0.25)
+    assert Gains[1].AlbumGain == Gains[2].AlbumGain
+    assert 2.0 < Gains[1].AlbumGain < 12.0
+    assert Gains[2].TrackPeak == pytest.approx(10 ** (-30 / 20), rel=0.01)
+    assert Gains[1].AlbumPeak == Gains[1].TrackPeak
+
+    # The silence is found in the same pass.
+    assert Silences[1].Leading == 0
+    assert Silences[2].Leading == 2 * analysis.SampleRate
+    assert Silences[2].Trailing == 0
+    assert analysis.findLeadingGaps(Silences) == [ 2 ]
+
+    assert analysis.analyzeTracks([], 2) == ({}, {})
+
+@pytest.mark.parametrize('Lead, Tone, Trail', [
+    (0, 44100, 0),
+    (588 * 75, 588 * 150, 588 * 30),
+    # Silence that ends partway through a window.
+    (1000, 5000, 3000),
+    (0, 0, 44100),
+])
+def test_analysis_silence(
+        Lead: int,
+        Tone: int,
+        Trail: int
+):
+    Silence = np.zeros((Lead, 2), dtype='<i2')
+    # Dither below the threshold is still silence.
+    Noise = (np.random.default_rng(1).standard_normal((Trail, 2)) *
+             8).astype('<i2')
+    Samples = np.concatenate((Silence, makeSine(Tone / 44100, -20.0), Noise))
+
+    for Chunk in (1000, 100000):
+        Scanner = analysis.SilenceScanner()
+        for Start in range(0, len(Samples), Chunk):
+            Scanner.feed(Samples[Start:Start + Chunk])
+        Result = Scanner.finish()
+
+        assert Result.Length == len(Samples)
+        if Tone == 0:
+            assert Result.IsSilent
+            assert Result.Audible == (len(Samples), 0)
+            continue
+        assert not Result.IsSilent
+        # Silence is found a window at a time.
+        assert Lead - 588 < Result.Leading <= Lead
+        assert Trail - 588 < Result.Trailing <= Trail
+        Start, Length = Result.Audible
+        assert Start == Result.Leading
+        assert Start + Length + Result.Trailing == len(Samples)
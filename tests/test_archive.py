@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import pytest
+import threading
+from typing import Callable
+import zlib
+
+import dartt.archive as archive
+import dartt.audiocd as audiocd
+import dartt.index as index
+import dartt.manifest as manifest
+import dartt.musicbrainz as mb
+import dartt.optical as optical
+import dartt.ripper as ripper
+
+def ripCD(
+        monkeypatch,
+        Config,
+        MB,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable
+):
+    DiscID = DiscIDFactory()
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    return CD, CD.rip(Config)
+
+def test_archive_compress(
+        monkeypatch,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeArchiverFactory: Callable
+):
+    Config = configFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Archiver = fakeArchiverFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = ''
+    Config['audio']['archive_format'] = 'flac'
+    Config['audio']['archive_encoder'] = str(Archiver)
+    Config['audio']['archive_decoder'] = str(Archiver)
+
+    CD, Tracks = ripCD(monkeypatch, Config, MB, devicesFactory, DiscIDFactory,
+                       commandFactory)
+
+    assert len(Tracks) == len(MB.releaseTracks())
+    Album = Tracks[0].RippedPath.parent
+    assert [ Entry.name for Entry in sorted(Album.iterdir()) ] == [
+        '00. Track 0.flac', '01. Track 1.flac', 'manifest.json'
+    ]
+
+    Manifest = manifest.AlbumManifest(Album).read()
+    for Track in Tracks:
+        PCM = CDParanoia.pcm(Track.Number)
+        assert zlib.decompress(Track.RippedPath.read_bytes())[44:] == PCM
+        assert (Manifest[Track.RippedPath.name]['sha256'] ==
+                Track.Checksums['sha256'] ==
+                hashlib.sha256(PCM).hexdigest())
+
+    # The index points at the compressed tracks.
+    Index = index.getArchiveIndex(Config)
+    assert Index.isArchived(CD.id)
+    assert ([ TrackPath for _, _, TrackPath, _ in Index.getTracks(CD.id) ] ==
+            [ Track.RippedPath for Track in Tracks ])
+
+def test_archive_compress_mismatch(
+        monkeypatch,
+        caplog,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeArchiverFactory: Callable
+):
+    Config = configFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = ''
+    Config['audio']['archive_format'] = 'wavpack'
+    Config['audio']['archive_encoder'] = str(fakeArchiverFactory('wavpack'))
+    Config['audio']['archive_decoder'] = str(
+        fakeArchiverFactory('wvunpack', Corrupt=True)
+    )
+
+    CD, Tracks = ripCD(monkeypatch, Config, MB, devicesFactory, DiscIDFactory,
+                       commandFactory)
+
+    # Tracks that do not decode to the ripped audio stay as WAV files.
+    assert all(Track.RippedPath.suffix == '.wav' for Track in Tracks)
+    Album = Tracks[0].RippedPath.parent
+    assert [ Entry.name for Entry in sorted(Album.iterdir()) ] == [
+        '00. Track 0.wav', '01. Track 1.wav', 'manifest.json'
+    ]
+    assert 'does not decode to the ripped audio' in caplog.text
+    assert index.getArchiveIndex(Config).isArchived(CD.id)
+
+def test_archive_compress_while_ripping(
+        monkeypatch,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeArchiverFactory: Callable
+):
+    Config = configFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Archiver = fakeArchiverFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = ''
+    Config['audio']['archive_format'] = 'flac'
+    Config['audio']['archive_encoder'] = str(Archiver)
+    Config['audio']['archive_decoder'] = str(Archiver)
+
+    # The last track is only ripped once the first has been compressed.
+    Encoded = threading.Event()
+    Overlapped = []
+    encodeTrack = archive.ArchiveCompressor.encodeTrack
+    ripTrack = ripper.CDParanoiaRipper._ripTrack
+
+    def encodeAndSignal(Self, Track):
+        Partial = encodeTrack(Self, Track)
+        Encoded.set()
+        return Partial
+
+    def waitAndRip(Self, Disc, Number, *Args, **KWArgs):
+        if Number == Disc.getTrackNumbers()[-1]:
+            Overlapped.append(Encoded.wait(timeout=5))
+        return ripTrack(Self, Disc, Number, *Args, **KWArgs)
+
+    monkeypatch.setattr(archive.ArchiveCompressor, 'encodeTrack',
+                        encodeAndSignal)
+    monkeypatch.setattr(ripper.CDParanoiaRipper, '_ripTrack', waitAndRip)
+
+    _, Tracks = ripCD(monkeypatch, Config, MB, devicesFactory, DiscIDFactory,
+                      commandFactory)
+
+    assert Overlapped == [ True ]
+    assert all(Track.RippedPath.suffix == '.flac' for Track in Tracks)
+
+def test_archive_abstract():
+    with pytest.raises(TypeError):
+        archive.ArchiveCompressor(None)
+
+def test_archive_unknown_format(
+        configFactory: Callable
+):
+    Config = configFactory()
+    assert archive.createArchiveCompressor(Config) is None
+
+    Config['audio']['archive_format'] = 'shorten'
+    with pytest.raises(RuntimeError, match='Unknown audio archive format'):
+        archive.createArchiveCompressor(Config)
@@ -20,12 +20,22 @@
 # You should have received a copy of the GNU Affero General Public License along
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
+import contextlib
+import hashlib
+import musicbrainzngs
+import numpy as np
+from pathlib import Path
+import pytest
 from typing import Callable
 
 import dartt.audiocd  as audiocd
 import dartt.config as config
+import dartt.cue as cue
+import dartt.disc as disc
+import dartt.index as index
 import dartt.musicbrainz as mb
 import dartt.optical as optical
+import dartt.verify as verify
 
 def test_audiocd(
         tmp_path,
@@ -68,3 +78,365 @@ def test_audiocd(
             assert Track.Number == MBTrack['number']
             assert Track.Title == MBTrack['title']
             assert Track.Artist == MBTrack['artist']
+
+def test_audiocd_rip_archived(
+        monkeypatch,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeEncoderFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+    Config['audio']['analyze'] = True
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    Tracks = CD.rip(Config)
+    assert len(Tracks) == len(MB.releaseTracks())
+    assert len(CDParanoia.calls()) == len(MB.releaseTracks())
+    assert all(Track.ReplayGain is not None for Track in Tracks)
+
+    Index = index.getArchiveIndex(Config)
+    assert Index.isArchived(CD.id)
+    assert Index.getReleases() == [ (CD.getDiscInfo().ID,
+                                     MB.releaseArtistName(),
+                                     MB.releaseTitle()) ]
+    for (Number, Title, TrackPath, SHA256), Track in zip(
+            Index.getTracks(CD.id), Tracks):
+        assert Number == Track.Number
+        assert Title == Track.Title
+        assert TrackPath == Track.RippedPath
+        assert SHA256 == hashlib.sha256(TrackPath.read_bytes()[44:]).hexdigest()
+
+    # The tags are kept for retranscodes, ReplayGain and all.
+    Recorded = Index.getTrackTags(CD.id)
+    assert sorted(Recorded) == [ int(Track.Number) for Track in Tracks ]
+    for Tags in Recorded.values():
+        assert Tags['date'] == MB.releaseDate()
+        assert 'replaygain_track_gain' in Tags
+
+    # The second time around nothing is read, nor looked up.
+    assert CD.rip(Config) == []
+    assert len(CDParanoia.calls()) == len(MB.releaseTracks())
+    Lookups = []
+    with monkeypatch.context() as M:
+        M.setattr(MBrainz, 'getDiscInfoAsync', Lookups.append)
+        M.setattr('discid.read', lambda Device: DiscID)
+        assert audiocd.AudioCD(Drive, MBrainz).rip(Config) == []
+    assert Lookups == []
+
+    Config.setOption('force', True)
+    assert len(CD.rip(Config)) == len(MB.releaseTracks())
+    assert len(CDParanoia.calls()) == 2 * len(MB.releaseTracks())
+
+    # A track that goes missing from the archive gets the disc ripped again.
+    Config.setOption('force', False)
+    Tracks[0].RippedPath.unlink()
+    assert not Index.isArchived(CD.id)
+
+def test_audiocd_rip_failed_track(
+        monkeypatch,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeEncoderFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    Failed = MB.releaseTracks()[-1]['number']
+    CDParanoia = fakeCDParanoiaFactory(FailTracks=[ Failed ])
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    Tracks = CD.rip(Config)
+    assert [ Track.Number for Track in Tracks ] == [
+        MBTrack['number'] for MBTrack in MB.releaseTracks()[:-1] ]
+
+    # The disc is not indexed, so the next rip reads it again.
+    assert not index.getArchiveIndex(Config).isArchived(CD.id)
+    Calls = len(CDParanoia.calls())
+    assert len(CD.rip(Config)) == len(Tracks)
+    assert len(CDParanoia.calls()) > Calls
+
+def test_audiocd_rip_lookup_failed(
+        monkeypatch,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeEncoderFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+
+    def lookup(*args, **kwargs):
+        raise musicbrainzngs.WebServiceError('lookup failed')
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr('musicbrainzngs.get_releases_by_discid', lookup)
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        assert CD.getDiscInfo().Tracks == []
+
+    # The tracks are still archived, named for their numbers.
+    Tracks = CD.rip(Config)
+    assert len(Tracks) == len(MB.releaseTracks())
+    AlbumPath = Path(Config.getAudioArchiveDir()) / 'Unknown Artist' / CD.id
+    for Track, MBTrack in zip(Tracks, MB.releaseTracks()):
+        Number = MBTrack['number']
+        Name = f'{Number:02}. Track {Number:02}'
+        assert Track.RippedPath == AlbumPath / f'{Name}.wav'
+        assert Track.RippedPath.exists()
+        assert Track.TranscodedPath.exists()
+
+def test_audiocd_rip_verify(
+        monkeypatch,
+        capsys,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        accurateRipFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = ''
+    Config['audio']['verify'] = True
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    Tracks = [ np.frombuffer(CDParanoia.pcm(Track['number']), dtype='<u4')
+               for Track in MB.releaseTracks() ]
+    CRCs = [ verify.accurateRipCRCs([ Tracks[0] ], True, False)[0],
+             verify.accurateRipCRCs([ Tracks[1] ], False, True)[1] ]
+    Config['audio']['accuraterip_url'] = accurateRipFactory(
+        CD.getAccurateRipID(), CRCs, 2
+    )
+
+    Ripped = CD.rip(Config)
+
+    # Verification runs after the rip.
+    Out = capsys.readouterr().out
+    assert Out.count('accurate (confidence 2)') == len(Tracks)
+
+    Results = CD.verify(Config, Ripped)
+    assert [ Result.Number for Result in Results ] == [
+        Track['number'] for Track in MB.releaseTracks()
+    ]
+    assert all(Result.Confidence == 2 for Result in Results)
+
+    # Nothing is looked up offline.
+    Config.setOption('offline', True)
+    assert all(Result.Confidence is None
+               for Result in CD.verify(Config, Ripped))
+
+def test_audiocd_rip_image(
+        monkeypatch,
+        capsys,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeEncoderFactory: Callable,
+        accurateRipFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+    Config['audio']['archive_layout'] = 'image'
+    Config['audio']['verify'] = True
+    Config['audio']['analyze'] = True
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    PCM = [ CDParanoia.pcm(Track['number']) for Track in MB.releaseTracks() ]
+    Samples = [ np.frombuffer(Data, dtype='<u4') for Data in PCM ]
+    CRCs = [ verify.accurateRipCRCs([ Samples[0] ], True, False)[0],
+             verify.accurateRipCRCs([ Samples[1] ], False, True)[1] ]
+    Config['audio']['accuraterip_url'] = accurateRipFactory(
+        CD.getAccurateRipID(), CRCs, 2
+    )
+
+    Tracks = CD.rip(Config)
+    assert len(Tracks) == len(MB.releaseTracks())
+
+    # The whole disc is read at once.
+    Calls = CDParanoia.calls()
+    assert len(Calls) == 1
+    assert Calls[0][-2] == '0-1'
+
+    # Every track is served from one image described by one CUE sheet.
+    ImagePath = Tracks[0].RippedPath
+    assert ImagePath.name == f'{MB.releaseTitle()}.wav'
+    assert all(Track.RippedPath == ImagePath for Track in Tracks)
+    assert ImagePath.read_bytes()[44:] == b''.join(PCM)
+
+    Sheet = cue.CueSheet(ImagePath.with_suffix('.cue'))
+    assert [ Track.Number for Track in Sheet.Tracks ] == [
+        Track['number'] for Track in MB.releaseTracks()
+    ]
+
+    for Track, Data in zip(Tracks, PCM):
+        assert (Track.TranscodedPath.name ==
+                f'{Track.Number:>02}. {Track.Title}.flac')
+        assert Track.TranscodedPath.read_bytes()[44:] == Data
+        assert Track.Checksums['sha256'] == hashlib.sha256(Data).hexdigest()
+
+    # Each track is verified and measured on its own.
+    Out = capsys.readouterr().out
+    assert Out.count('accurate (confidence 2)') == len(Tracks)
+    assert all(Track.ReplayGain.TrackGain is not None for Track in Tracks)
+    assert len({ Track.ReplayGain.AlbumGain for Track in Tracks }) == 1
+    assert all(Track.Silence.Leading == 0 for Track in Tracks)
+
+    Index = index.getArchiveIndex(Config)
+    assert Index.isArchived(CD.id)
+    assert [ Number for Number, *_ in Index.getTracks(CD.id) ] == [
+        Track['number'] for Track in MB.releaseTracks()
+    ]
+
+    # The image has no audio for a track its CUE sheet does not list.
+    Missing = disc.ImageTrack(ImagePath, ImagePath.with_suffix('.cue'),
+                              mb.TrackInfo({
+                                  'number': 9,
+                                  'recording': {
+                                      'title': 'Nine',
+                                      'artist-credit-phrase': 'Nobody'
+                                  }
+                              }))
+    with (contextlib.ExitStack() as Stack,
+          pytest.raises(cue.CueSheetError, match='no track 9')):
+        CD._getTrackSamples(Missing, Stack)
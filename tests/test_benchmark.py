@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+End to end throughput of main() with simulated drives, a fake cdparanoia that
+writes real PCM and a fake encoder.  Run with --bench; see conftest.py for the
+options.  Results are written as JSON so that runs can be compared between
+commits.
+"""
+
+import copy
+import json
+from pathlib import Path
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Dict
+
+import pytest
+
+from dartt.__about__ import __version__
+import dartt.audiocd as audiocd
+from dartt.main import main
+import dartt.musicbrainz as mb
+import dartt.ripper as ripper
+import dartt.scheduler as scheduler
+import dartt.transcoder as transcoder
+
+class StageTimer:
+    """Time calls to the methods that make up each stage of the pipeline."""
+    def __init__(self):
+        self._Times = dict()
+        self._Lock = threading.Lock()
+
+    def wrap(
+            self,
+            monkeypatch,
+            Class: type,
+            Method: str,
+            Stage: str
+    ):
+        Original = getattr(Class, Method)
+        Timer = self
+
+        def timed(*Args, **KWArgs):
+            Start = time.perf_counter()
+            try:
+                return Original(*Args, **KWArgs)
+            finally:
+                Timer.record(Stage, time.perf_counter() - Start)
+
+        monkeypatch.setattr(Class, Method, timed)
+
+    def record(
+            self,
+            Stage: str,
+            Seconds: float
+    ):
+        with self._Lock:
+            self._Times.setdefault(Stage, []).append(Seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the count and latency distribution of each stage, in
+        seconds."""
+        Summary = dict()
+        for Stage, Recorded in sorted(self._Times.items()):
+            Times = sorted(Recorded)
+            Summary[Stage] = {
+                'count': len(Times),
+                'total': sum(Times),
+                'mean': statistics.fmean(Times),
+                'p50': Times[len(Times) // 2],
+                'p95': Times[min(len(Times) - 1, int(len(Times) * 0.95))],
+                'max': Times[-1],
+            }
+        return Summary
+
+def getPeakRSS() -> Dict[str, int]:
+    """Return peak resident set sizes in KiB.  The pipeline runs inside the
+    pytest process, so its figure includes pytest itself; the child figure is
+    the largest single ripper or encoder process, not the sum of them."""
+    return {
+        'pytest_process': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'largest_child': resource.getrusage(
+            resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+@pytest.mark.benchmark
+def test_benchmark_main(
+        monkeypatch,
+        request,
+        configFactory: Callable,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeEncoderFactory: Callable
+):
+    Options = request.config
+    Drives = Options.getoption('--bench-drives')
+    Sectors = Options.getoption('--bench-sectors')
+    Speed = Options.getoption('--bench-speed')
+
+    Config = configFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory(
+        Sectors=Sectors,
+        SecondsPerSector=1 / (75 * Speed) if Speed else 0
+    )
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+
+    Names = [ f'sr{Drive}' for Drive in range(Drives) ]
+    Nodes = [ f'/dev/{Name}' for Name in Names ]
+
+    def getReleases(DiscID: str, **KWArgs) -> dict:
+        # Each drive holds a different album.
+        Info = copy.deepcopy(MB.info)
+        for Release in Info['disc']['release-list']:
+            Release['title'] = f'{Release["title"]} {DiscID}'
+        return Info
+
+    Timer = StageTimer()
+    Timer.wrap(monkeypatch, audiocd.AudioCD, 'readDiscID', 'disc_id')
+    Timer.wrap(monkeypatch, mb.MusicBrainz, 'getDiscInfo', 'lookup')
+    Timer.wrap(monkeypatch, ripper.CDParanoiaRipper, '_ripTrack', 'rip_track')
+    Timer.wrap(monkeypatch, transcoder.AudioTranscoder, 'transcodeTrack',
+               'transcode_track')
+    Timer.wrap(monkeypatch, scheduler.DriveScheduler, 'ripDrive', 'disc')
+
+    monkeypatch.setattr('dartt.config.readConfig', lambda: Config)
+    monkeypatch.setattr(
+        'pyudev.Context.list_devices',
+        lambda s, **kwargs: devicesFactory(Names, Nodes, 'CD')
+    )
+    monkeypatch.setattr('musicbrainzngs.get_releases_by_discid', getReleases)
+    monkeypatch.setattr(
+        'discid.read', lambda Device: DiscIDFactory(f'bench-{Path(Device).name}')
+    )
+    monkeypatch.setattr('sys.argv', [ sys.argv[0] ])
+
+    with monkeypatch.context() as M:
+        # Authenticate the shared client now; the rips need the real
+        # sh.Command.
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+        mb.getMusicBrainz(Config)
+
+    Start = time.perf_counter()
+    assert main() is None
+    Elapsed = time.perf_counter() - Start
+
+    Stages = Timer.summary()
+    Tracks = len(MB.releaseTracks())
+    assert Stages['disc']['count'] == Drives
+    assert Stages['rip_track']['count'] == Drives * Tracks
+    assert Stages['transcode_track']['count'] == Drives * Tracks
+
+    Results = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'parameters': {
+            'drives': Drives,
+            'tracks_per_disc': Tracks,
+            'sectors_per_track': Sectors,
+            'speed': Speed,
+        },
+        'elapsed': Elapsed,
+        'discs_per_hour': Drives / Elapsed * 3600,
+        'audio_seconds_per_second': Drives * Tracks * Sectors / 75 / Elapsed,
+        'stages': Stages,
+        'peak_rss_kib': getPeakRSS(),
+    }
+
+    Output = Path(Options.getoption('--bench-json'))
+    Output.write_text(json.dumps(Results, indent=2) + '\n')
+    print(f'\n{Results["discs_per_hour"]:.0f} discs per hour; '
+          f'results in {Output}')
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+import pytest
+
+import dartt.cue as cue
+
+def writeImage(
+        Path: Path,
+        Sectors: int,
+        SectorSize: int = 2352
+):
+    Path.write_bytes(bytes(Sectors * SectorSize))
+
+def test_cue_single_file(
+        tmp_path
+):
+    writeImage(tmp_path / 'disc.bin', 1000)
+    Cue = tmp_path / 'disc.cue'
+    Cue.write_text('''REM GENRE Rock
+PERFORMER "A. Great Artist"
+FILE "disc.bin" BINARY
+  TRACK 01 AUDIO
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    INDEX 00 00:04:00
+    INDEX 01 00:06:00
+  TRACK 03 AUDIO
+    INDEX 01 00:10:00
+''')
+
+    Sheet = cue.CueSheet(Cue)
+
+    assert [ Track.Number for Track in Sheet.Tracks ] == [ 1, 2, 3 ]
+    assert (Sheet.FirstTrack, Sheet.LastTrack) == (1, 3)
+    assert Sheet.Offsets == [ 0, 450, 750 ]
+    assert Sheet.LeadOut == 1000
+
+    # The gap before a track belongs to the track before it.
+    Bin = tmp_path / 'disc.bin'
+    assert Sheet.getExtents(1) == [ (Bin, 0, 450 * 2352) ]
+    assert Sheet.getExtents(2) == [ (Bin, 450 * 2352, 300 * 2352) ]
+    assert Sheet.getExtents(3) == [ (Bin, 750 * 2352, 250 * 2352) ]
+    assert Sheet.getExtents(4) is None
+
+def test_cue_quotes(
+        tmp_path
+):
+    writeImage(tmp_path / "Don't Stop.bin", 1000)
+    Cue = tmp_path / 'disc.cue'
+    # Only double quotes group words, and apostrophes are common in titles.
+    Cue.write_text('''PERFORMER Guns N' Roses
+TITLE "Don't Stop"
+FILE "Don't Stop.bin" BINARY
+  TRACK 01 AUDIO
+    TITLE Don't Stop
+    PERFORMER "O'Brien
+    INDEX 01 00:00:00
+''')
+
+    Sheet = cue.CueSheet(Cue)
+
+    assert Sheet.getExtents(1) == [ (tmp_path / "Don't Stop.bin", 0,
+                                     1000 * 2352) ]
+    assert cue.splitCueLine('TITLE "Don\'t Stop"') == [ 'TITLE', "Don't Stop" ]
+    assert cue.splitCueLine("TITLE Don't Stop") == [ 'TITLE', "Don't",
+                                                     'Stop' ]
+
+def test_cue_file_per_track(
+        tmp_path
+):
+    writeImage(tmp_path / 'data.bin', 300, 2048)
+    writeImage(tmp_path / 'Track 02.bin', 400)
+    writeImage(tmp_path / 'Track 03.bin', 500)
+    Cue = tmp_path / 'disc.cue'
+    Cue.write_text('''FILE "data.bin" BINARY
+  TRACK 01 MODE1/2048
+    INDEX 01 00:00:00
+FILE "Track 02.bin" BINARY
+  TRACK 02 AUDIO
+    INDEX 01 00:00:00
+FILE "Track 03.bin" BINARY
+  TRACK 03 AUDIO
+    INDEX 00 00:00:00
+    INDEX 01 00:01:00
+  TRACK 04 AUDIO
+    PREGAP 00:02:00
+    INDEX 01 00:03:00
+''')
+
+    Sheet = cue.CueSheet(Cue)
+
+    assert Sheet.Offsets == [ 0, 300, 775, 1075 ]
+    assert Sheet.LeadOut == 1350
+    assert not Sheet.getTrack(1).IsAudio
+
+    # The gap stored with track 3 and the silence before track 4 are read
+    # with the tracks before them.
+    Track2 = tmp_path / 'Track 02.bin'
+    Track3 = tmp_path / 'Track 03.bin'
+    assert Sheet.getExtents(1) is None
+    assert Sheet.getExtents(2) == [ (Track2, 0, 400 * 2352),
+                                    (Track3, 0, 75 * 2352) ]
+    assert Sheet.getExtents(3) == [ (Track3, 75 * 2352, 150 * 2352),
+                                    (None, 0, 150 * 2352) ]
+    assert Sheet.getExtents(4) == [ (Track3, 225 * 2352, 275 * 2352) ]
+
+def test_cue_image(
+        tmp_path
+):
+    Audio = bytes(Index % 251 for Index in range(1000 * 2352))
+    Image = tmp_path / 'Disc.wav'
+    Image.write_bytes(cue.getWavHeader(len(Audio)) + Audio)
+    Cue = tmp_path / 'Disc.cue'
+    cue.writeCueSheet(Cue, Image,
+                      [ (1, 0, 'One', 'A "Great" Artist'),
+                        (2, 450, 'Two', 'A "Great" Artist') ],
+                      'Disc', 'A "Great" Artist')
+
+    Sheet = cue.CueSheet(Cue)
+    assert Sheet.Offsets == [ 0, 450 ]
+    assert Sheet.LeadOut == 1000
+    assert Sheet.getExtents(2) == [ (Image, 44 + 450 * 2352, 550 * 2352) ]
+
+    # Tracks are served from the image without a copy.
+    with cue.CueImage(Sheet) as Images:
+        for Number, Start, End in ((1, 0, 450), (2, 450, 1000)):
+            Views = Images.getTrackViews(Number)
+            assert len(Views) == 1
+            assert Views[0].readonly
+            assert Views[0] == Audio[Start * 2352:End * 2352]
+            Views[0].release()
+        assert Images.getTrackViews(3) is None
+
+def test_cue_hidden_track(
+        tmp_path
+):
+    writeImage(tmp_path / 'disc.bin', 1000)
+    Cue = tmp_path / 'disc.cue'
+    Cue.write_text('''FILE "disc.bin" BINARY
+  TRACK 01 AUDIO
+    INDEX 00 00:00:00
+    INDEX 01 00:04:00
+  TRACK 02 AUDIO
+    INDEX 01 00:10:00
+''')
+
+    Sheet = cue.CueSheet(Cue)
+    Bin = tmp_path / 'disc.bin'
+    assert Sheet.getHiddenExtents() == [ (Bin, 0, 300 * 2352) ]
+    assert Sheet.getExtents(1) == [ (Bin, 300 * 2352, 450 * 2352) ]
+
+    Cue.write_text('''FILE "disc.bin" BINARY
+  TRACK 01 AUDIO
+    INDEX 01 00:00:00
+''')
+    assert cue.CueSheet(Cue).getHiddenExtents() is None
+
+def test_cue_slice_extents():
+    Extents = [ (Path('a'), 100, 50), (None, 0, 20), (Path('b'), 0, 30) ]
+    assert cue.sliceExtents(Extents, 0, 100) == Extents
+    assert cue.sliceExtents(Extents, 40, 20) == [ (Path('a'), 140, 10),
+                                                  (None, 0, 10) ]
+    assert cue.sliceExtents(Extents, 60, 40) == [ (None, 0, 10),
+                                                  (Path('b'), 0, 30) ]
+    assert cue.sliceExtents(Extents, 75, 0) == []
+
+@pytest.mark.parametrize('Text, Message', [
+    ('', 'no tracks'),
+    ('FILE "disc.bin" MOTOROLA\n  TRACK 01 AUDIO\n    INDEX 01 00:00:00\n',
+     'unsupported file'),
+    # disc.bin is not a WAV file.
+    ('FILE "disc.bin" WAVE\n  TRACK 01 AUDIO\n    INDEX 01 00:00:00\n',
+     'not a WAV file'),
+    ('FILE "disc.bin" BINARY\n  TRACK 01 AUDIO\n    INDEX 00 00:00:00\n',
+     'no INDEX 01'),
+    ('FILE "missing.bin" BINARY\n  TRACK 01 AUDIO\n    INDEX 01 00:00:00\n',
+     'missing'),
+    ('FILE "disc.bin" BINARY\n  TRACK 01 AUDIO\n    INDEX 01\n',
+     'malformed line'),
+    ('FILE "disc.bin" BINARY\n  TRACK one AUDIO\n    INDEX 01 00:00:00\n',
+     'malformed line'),
+])
+def test_cue_errors(
+        tmp_path,
+        Text: str,
+        Message: str
+):
+    writeImage(tmp_path / 'disc.bin', 10)
+    Cue = tmp_path / 'disc.cue'
+    Cue.write_text(Text)
+
+    with pytest.raises(cue.CueSheetError, match=Message):
+        cue.CueSheet(Cue)
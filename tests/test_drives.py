@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+from dartt.drives import (DriveCapabilities, DriveCapabilityStore,
+                          getModelKey)
+
+def test_store(
+        tmp_path
+):
+    StorePath = tmp_path / 'drives.toml'
+    Store = DriveCapabilityStore(StorePath)
+
+    # Unknown drives get the defaults.
+    assert Store.get('PLEXTOR', 'DVDR_PX-716A') == DriveCapabilities()
+
+    Store.set('PLEXTOR', 'DVDR_PX-716A', DriveCapabilities(30, True, 24))
+    Store.set('HL-DT-ST', 'DVDRAM_GH24NSD1', DriveCapabilities(6))
+
+    Store = DriveCapabilityStore(StorePath)
+    Capabilities = Store.get('PLEXTOR', 'DVDR_PX-716A')
+    assert Capabilities.ReadOffset == 30
+    assert Capabilities.C2
+    assert Capabilities.ReadSpeed == 24
+    assert Store.get('HL-DT-ST', 'DVDRAM_GH24NSD1') == DriveCapabilities(6)
+
+def test_model_key():
+    # Names from drive databases use spaces where udev uses underscores.
+    assert (getModelKey('PLEXTOR', 'DVDR   PX-716A') ==
+            getModelKey('PLEXTOR', 'DVDR___PX-716A'))
+
+def test_store_corrupt(
+        tmp_path
+):
+    StorePath = tmp_path / 'drives.toml'
+    StorePath.write_text('[oops')
+
+    Store = DriveCapabilityStore(StorePath)
+    assert Store.get('PLEXTOR', 'DVDR_PX-716A') == DriveCapabilities()
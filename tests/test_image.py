@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+from pathlib import Path
+import pytest
+import struct
+import sys
+from typing import Callable, Sequence
+
+from dartt.bluray import BluRay
+import dartt.cue as cue
+from dartt.device import DeviceNotReadyError
+from dartt.dvd import DVD
+import dartt.image as image
+from dartt.main import main
+import dartt.manifest as manifest
+
+def makeBinCue(
+        Directory: Path,
+        Sectors: int = 75
+) -> Path:
+    """Write a two track BIN/CUE image.  Tracks are numbered from zero like
+    the mock disc, and each sector of a track holds its own byte pattern."""
+    Bin = Directory / 'disc.bin'
+    Bin.write_bytes(b''.join(
+        bytes((Number * 7 + Index) % 256 for Index in range(2352)) * Sectors
+        for Number in (0, 1)
+    ))
+    Cue = Directory / 'disc.cue'
+    Cue.write_text('FILE "disc.bin" BINARY\n'
+                   '  TRACK 00 AUDIO\n'
+                   '    INDEX 01 00:00:00\n'
+                   '  TRACK 01 AUDIO\n'
+                   f'    INDEX 01 00:{Sectors // 75:02}:{Sectors % 75:02}\n')
+    return Cue
+
+def makeISO(
+        ImagePath: Path,
+        Names: Sequence[str]
+):
+    """Write an ISO 9660 image whose root directory holds Names."""
+    def record(Name: bytes, Extent: int = 18) -> bytes:
+        Length = 33 + len(Name) + (len(Name) + 1) % 2
+        return (struct.pack('<BBII', Length, 0, Extent, 0) +
+                struct.pack('<II', 2048, 0) + bytes(7) + b'\x02' +
+                bytes(6) + bytes([ len(Name) ]) + Name +
+                bytes((len(Name) + 1) % 2))
+
+    Descriptor = b'\x01CD001\x01' + bytes(149) + record(b'\x00')
+    Root = b''.join(record(Name) for Name in
+                    [ b'\x00', b'\x01' ] + [ Name.encode() for Name in Names ])
+    ImagePath.write_bytes(bytes(16 * 2048) +
+                          Descriptor.ljust(2048, b'\x00') +
+                          bytes(2048) + Root.ljust(2048, b'\x00'))
+
+@pytest.mark.parametrize('Names, Type', [
+    ([ 'AUDIO_TS', 'VIDEO_TS' ], DVD),
+    ([ 'BDMV', 'CERTIFICATE' ], BluRay),
+    ([ 'README.TXT;1' ], None),
+])
+def test_image_iso(
+        monkeypatch,
+        tmp_path,
+        configFactory: Callable,
+        commandFactory: Callable,
+        Names: Sequence[str],
+        Type
+):
+    Config = configFactory()
+    ISO = tmp_path / 'disc.iso'
+    makeISO(ISO, Names)
+
+    assert image.getISORootNames(ISO) == { Name.split(';')[0]
+                                           for Name in Names }
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+        Drive = image.ImageDevice(ISO, Config)
+    if Type is None:
+        with pytest.raises(DeviceNotReadyError):
+            Drive.open()
+    else:
+        assert isinstance(Drive.open(), Type)
+
+def test_image_audiocd_rip(
+        monkeypatch,
+        tmp_path,
+        configFactory: Callable,
+        MBFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = ''
+    MB = MBFactory()
+    Cue = makeBinCue(tmp_path)
+    Put = []
+
+    def put(First, Last, Sectors, Offsets):
+        Put.append((First, Last, Sectors, Offsets))
+        return DiscIDFactory()
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr('discid.put', put)
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        Drive = image.ImageDevice(Cue, Config)
+        CD = Drive.open()
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    # The disc ID comes from the CUE sheet's TOC, counting the lead-in.
+    assert isinstance(CD, image.ImageAudioCD)
+    assert Put == [ (0, 1, 300, [ 150, 225 ]) ]
+
+    Tracks = CD.rip(Config)
+
+    Data = (tmp_path / 'disc.bin').read_bytes()
+    assert [ Track.Number for Track in Tracks ] == [ 0, 1 ]
+    for Position, Track in enumerate(Tracks):
+        PCM = Data[Position * 75 * 2352:(Position + 1) * 75 * 2352]
+        WAV = Track.RippedPath.read_bytes()
+        assert WAV[:4] == b'RIFF'
+        assert struct.unpack_from('<I', WAV, 40)[0] == len(PCM)
+        assert WAV[44:] == PCM
+        assert Track.Checksums['sha256'] == hashlib.sha256(PCM).hexdigest()
+        Entry = manifest.AlbumManifest(Track.RippedPath.parent).get(
+            Track.RippedPath
+        )
+        assert Entry['sha256'] == Track.Checksums['sha256']
+    assert not list(Tracks[0].RippedPath.parent.glob('*.part'))
+
+def test_image_audiocd_rip_image(
+        monkeypatch,
+        tmp_path,
+        configFactory: Callable,
+        MBFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = ''
+    Config['audio']['archive_layout'] = 'image'
+    MB = MBFactory()
+    Cue = makeBinCue(tmp_path)
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr('discid.put', lambda *args: DiscIDFactory())
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        CD = image.ImageDevice(Cue, Config).open()
+        CD.getDiscInfo()
+
+    Tracks = CD.rip(Config)
+
+    # The image is archived whole, with a CUE sheet of its own.
+    Data = (tmp_path / 'disc.bin').read_bytes()
+    ImagePath = Tracks[0].RippedPath
+    assert all(Track.RippedPath == ImagePath for Track in Tracks)
+    assert ImagePath.read_bytes()[44:] == Data
+    Sheet = cue.CueSheet(ImagePath.with_suffix('.cue'))
+    assert [ Track.Number for Track in Sheet.Tracks ] == [ 0, 1 ]
+
+    for Position, Track in enumerate(Tracks):
+        PCM = Data[Position * 75 * 2352:(Position + 1) * 75 * 2352]
+        assert Track.Checksums['sha256'] == hashlib.sha256(PCM).hexdigest()
+    assert (manifest.AlbumManifest(ImagePath.parent).get(ImagePath)['sha256']
+            == hashlib.sha256(Data).hexdigest())
+    assert not list(ImagePath.parent.glob('*.part'))
+
+def test_main_image(
+        monkeypatch,
+        capsys,
+        tmp_path,
+        configFactory: Callable,
+        MBFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = ''
+    MB = MBFactory()
+    Cue = makeBinCue(tmp_path)
+    Missing = tmp_path / 'missing.cue'
+
+    with monkeypatch.context() as M:
+        M.setattr('dartt.config.readConfig', lambda: Config)
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr('discid.put', lambda *args: DiscIDFactory())
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+        M.setattr('dartt.optical.detectOpticalDrives',
+                  lambda _: pytest.fail('drives were used'))
+        M.setattr('sys.argv', [ sys.argv[0], '--image', str(Cue),
+                                '--image', str(Missing) ])
+
+        # One image is ripped; the other is not there.
+        assert main() == 1
+
+    Out = capsys.readouterr().out
+    assert 'disc.cue: ripped 2 tracks' in Out
+    assert 'missing.cue' in Out
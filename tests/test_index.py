@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+from pathlib import Path
+
+from dartt.disc import AudioTrack
+from dartt.index import ArchiveIndex
+import dartt.musicbrainz as mb
+from dartt.transcoder import TranscodedTrack
+
+class MockTrack:
+    def __init__(self, Number: int, RippedPath: Path, SHA256: str):
+        self.Number = Number
+        self.Title = f'Track {Number}'
+        self.RippedPath = RippedPath
+        self.Checksums = { 'sha256': SHA256 }
+
+def makeTracks(Directory: Path, Count: int):
+    Directory.mkdir(parents=True, exist_ok=True)
+    Tracks = []
+    for Number in range(1, Count + 1):
+        TrackPath = Directory / f'{Number:02}.wav'
+        TrackPath.write_bytes(b'x' * Number)
+        Tracks.append(MockTrack(Number, TrackPath, f'hash{Number}'))
+    return Tracks
+
+def test_index(
+        tmp_path
+):
+    Index = ArchiveIndex(tmp_path / 'index.sqlite')
+    assert not Index.isArchived('frobnitz')
+    assert Index.getReleases() == []
+
+    Tracks = makeTracks(tmp_path / 'a', 3)
+    Index.addDisc('frobnitz', 'release-a', 'Title A', 'Artist A', Tracks)
+    Index.addDisc('weevoo', 'release-b', 'Title B', 'AGA', makeTracks(
+        tmp_path / 'b', 2))
+
+    # The index persists.
+    Index = ArchiveIndex(tmp_path / 'index.sqlite')
+    assert Index.isArchived('frobnitz')
+    assert Index.isArchived('weevoo')
+    assert Index.getReleases() == [ ('release-b', 'AGA', 'Title B'),
+                                    ('release-a', 'Artist A', 'Title A') ]
+    assert Index.getTracks('frobnitz') == [
+        (Track.Number, Track.Title, Track.RippedPath, f'hash{Track.Number}')
+        for Track in Tracks
+    ]
+    assert Index.findTrack('hash2') == [ ('frobnitz', 2), ('weevoo', 2) ]
+
+def test_index_track_tags(
+        tmp_path
+):
+    Index = ArchiveIndex(tmp_path / 'index.sqlite')
+    Tracks = makeTracks(tmp_path / 'a', 2)
+    Tags = { 1: { 'title': 'Track 1', 'replaygain_track_gain': '-1.00 dB' } }
+    Index.addDisc('frobnitz', 'release-a', 'Title A', 'Artist A', Tracks,
+                  Tags)
+    assert Index.getTrackTags('frobnitz') == Tags
+
+    # Hashes found later are kept.
+    Index.setTrackHash('frobnitz', 2, 'rehashed')
+    assert Index.findTrack('rehashed') == [ ('frobnitz', 2) ]
+
+def test_index_replace(
+        tmp_path
+):
+    Index = ArchiveIndex(tmp_path / 'index.sqlite')
+    Index.addDisc('frobnitz', 'release-a', 'Title', 'Artist',
+                  makeTracks(tmp_path / 'a', 3))
+    Index.addDisc('frobnitz', 'release-a', 'Title', 'Artist',
+                  makeTracks(tmp_path / 'b', 2))
+
+    assert [ Number for Number, *_ in Index.getTracks('frobnitz') ] == [ 1, 2 ]
+
+def test_index_changed(
+        tmp_path
+):
+    Index = ArchiveIndex(tmp_path / 'index.sqlite')
+    Tracks = makeTracks(tmp_path / 'a', 2)
+    Index.addDisc('frobnitz', None, None, None, Tracks)
+    assert Index.isArchived('frobnitz')
+
+    Tracks[1].RippedPath.write_bytes(b'truncated')
+    assert not Index.isArchived('frobnitz')
+
+def test_index_transcodes(
+        tmp_path
+):
+    Index = ArchiveIndex(tmp_path / 'index.sqlite')
+    Tracks = [ AudioTrack(Track.RippedPath,
+                          mb.TrackInfo({ 'number': Track.Number,
+                                         'recording': {
+                                             'title': Track.Title,
+                                             'artist-credit-phrase': 'AGA' } }),
+                          Track.Checksums)
+               for Track in makeTracks(tmp_path / 'a', 3) ]
+    Index.addDisc('weevoo', 'release-b', 'Title B', 'AGA', [])
+    Index.addDisc('frobnitz', 'release-a', 'Title A', 'Artist A', [
+        TranscodedTrack(Tracks[0], tmp_path / 'm' / '01.flac', 1.0, 'print1'),
+        TranscodedTrack(Tracks[1], None, 0.0, 'print2'),
+        Tracks[2],
+    ])
+
+    assert Index.getDiscs() == [ ('frobnitz', 'release-a', 'Title A',
+                                  'Artist A'),
+                                 ('weevoo', 'release-b', 'Title B', 'AGA') ]
+    assert Index.getTranscode('frobnitz', 1) == (tmp_path / 'm' / '01.flac',
+                                                 'print1')
+    # Skipped tracks have no transcode, and untranscoded ones no record.
+    assert Index.getTranscode('frobnitz', 2) == (None, 'print2')
+    assert Index.getTranscode('frobnitz', 3) is None
+
+    Index.setTranscode('frobnitz', 3, tmp_path / 'm' / '03.flac', 'print3')
+    assert Index.getTranscode('frobnitz', 3) == (tmp_path / 'm' / '03.flac',
+                                                 'print3')
+
+    # Ripping the disc again replaces its transcodes.
+    Index.addDisc('frobnitz', 'release-a', 'Title A', 'Artist A', Tracks)
+    assert Index.getTranscode('frobnitz', 1) is None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+from dartt.journal import RipJournal
+
+def test_journal_roundtrip(
+        tmp_path
+):
+    JournalPath = tmp_path / 'journal.json'
+    Track = tmp_path / 'track.wav'
+    Track.write_bytes(b'x' * 100)
+
+    Journal = RipJournal(JournalPath, 'frobnitz')
+    assert Journal.getCompleted(1) is None
+    assert Journal.getPartial(1) is None
+
+    Journal.checkpoint(1, 0, 10)
+    Journal.complete(1, Track, sha256='abc')
+    Journal.checkpoint(2, 100, 150)
+
+    Journal = RipJournal(JournalPath, 'frobnitz')
+    assert Journal.getCompleted(1) == { 'path': str(Track), 'size': 100,
+                                        'sha256': 'abc' }
+    assert Journal.getPartial(1) is None
+    assert Journal.getPartial(2) == (100, 150)
+    assert Journal.getCompleted(2) is None
+
+def test_journal_other_disc(
+        tmp_path
+):
+    JournalPath = tmp_path / 'journal.json'
+    RipJournal(JournalPath, 'frobnitz').checkpoint(1, 0, 10)
+
+    assert RipJournal(JournalPath, 'weevoo').getPartial(1) is None
+
+def test_journal_corrupt(
+        tmp_path
+):
+    JournalPath = tmp_path / 'journal.json'
+    JournalPath.write_text('{"disc_id": "frob')
+
+    Journal = RipJournal(JournalPath, 'frobnitz')
+    assert Journal.getPartial(1) is None
+
+    # The journal is replaced on the next update.
+    Journal.checkpoint(1, 0, 10)
+    assert RipJournal(JournalPath, 'frobnitz').getPartial(1) == (0, 10)
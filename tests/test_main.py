@@ -68,3 +68,98 @@ def test_main_msg_level(
 
     for Text in Unexpected:
         assert Text not in caplog.text
+
+def test_main_daemon(
+        monkeypatch,
+        devicesFactory,
+        commandFactory
+):
+    Served = []
+
+    with monkeypatch.context() as M:
+        M.setattr('dartt.config.readConfig', lambda: None)
+        M.setattr('dartt.optical.detectOpticalDrives', lambda _: [])
+        M.setattr('dartt.optical.monitorOpticalDrives', lambda _: iter([]))
+        M.setattr(
+            'dartt.scheduler.DriveScheduler.serve',
+            lambda Self, Drives: Served.extend(Drives)
+        )
+        M.setattr('sys.argv', [ sys.argv[0], '--daemon' ])
+
+        assert main() is None
+
+    assert Served == []
+
+def test_main_read_offset(
+        monkeypatch,
+        capsys,
+        configFactory,
+        devicesFactory,
+        commandFactory
+):
+    Config = configFactory()
+
+    with monkeypatch.context() as M:
+        M.setattr('dartt.config.readConfig', lambda: Config)
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory([ 'sr0' ], [ '/dev/sr0' ], 'CD')
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+        M.setattr('sys.argv', [ sys.argv[0], '--read-offset', '6' ])
+
+        assert main() is None
+
+    assert 'read offset +6' in capsys.readouterr().out
+
+    from dartt.drives import DriveCapabilityStore
+    Store = DriveCapabilityStore(Config.getDriveCapabilitiesPath())
+    assert Store.get('HL-DT-ST', 'DVDRAM_GH24NSD1').ReadOffset == 6
+
+def test_main_read_offset_device(
+        monkeypatch,
+        capsys,
+        configFactory,
+        devicesFactory,
+        commandFactory
+):
+    Config = configFactory()
+
+    with monkeypatch.context() as M:
+        M.setattr('dartt.config.readConfig', lambda: Config)
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory([ 'sr0', 'sr1' ],
+                                               [ '/dev/sr0', '/dev/sr1' ],
+                                               'CD')
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        # The offset of one drive is not recorded for every drive.
+        M.setattr('sys.argv', [ sys.argv[0], '--read-offset', '6' ])
+        assert main() == 4
+        assert capsys.readouterr().out == ''
+
+        M.setattr('sys.argv', [ sys.argv[0], '--read-offset', '6',
+                                '--device', '/dev/sr1' ])
+        assert main() is None
+
+    Out = capsys.readouterr().out
+    assert 'sr1: ' in Out and 'sr0: ' not in Out
+
+def test_main_retranscode(
+        monkeypatch,
+        capsys
+):
+    from dartt.retranscode import RetranscodeSummary
+    Summary = RetranscodeSummary()
+    Summary.Failed = 1
+
+    with monkeypatch.context() as M:
+        M.setattr('dartt.config.readConfig', lambda: None)
+        M.setattr('dartt.retranscode.retranscode', lambda Config: Summary)
+        M.setattr('sys.argv', [ sys.argv[0], 'retranscode' ])
+
+        assert main() == 3
+
+    assert '1 failed' in capsys.readouterr().out
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import os
+import zlib
+
+from dartt.manifest import (AlbumManifest, HashingWriter, PCMHasher,
+                            SplitPCMHasher)
+
+def test_hasher_skips_header():
+    Header = os.urandom(44)
+    PCM = os.urandom(10 * 2352)
+    Hasher = PCMHasher()
+
+    # The header may be split across chunks.
+    Data = Header + PCM
+    for Index in range(0, len(Data), 13):
+        Hasher.update(Data[Index:Index + 13])
+
+    assert Hasher.Size == len(PCM)
+    assert Hasher.Checksums == {
+        'crc32': f'{zlib.crc32(PCM):08x}',
+        'sha256': hashlib.sha256(PCM).hexdigest()
+    }
+
+def test_split_hasher():
+    Header = os.urandom(44)
+    Parts = [ os.urandom(3 * 2352), os.urandom(2352), os.urandom(5 * 2352) ]
+    Hasher = SplitPCMHasher([ len(Part) for Part in Parts[:-1] ])
+
+    # Parts may be split across chunks, and chunks across parts.
+    Data = Header + b''.join(Parts)
+    for Index in range(0, len(Data), 1000):
+        Hasher.update(Data[Index:Index + 1000])
+
+    assert Hasher.Checksums['sha256'] == hashlib.sha256(Data[44:]).hexdigest()
+    assert [ Part.Checksums['sha256'] for Part in Hasher.Parts ] == [
+        hashlib.sha256(Part).hexdigest() for Part in Parts
+    ]
+
+def test_hashing_writer(
+        tmp_path
+):
+    Data = os.urandom(44 + 2352)
+    Hasher = PCMHasher()
+    with open(tmp_path / 'track.wav', 'wb') as File:
+        Writer = HashingWriter(File, Hasher)
+        Writer.write(Data[:100])
+        Writer.write(Data[100:])
+        Writer.flush()
+
+    assert (tmp_path / 'track.wav').read_bytes() == Data
+    assert Hasher.Checksums['sha256'] == hashlib.sha256(Data[44:]).hexdigest()
+
+def test_manifest(
+        tmp_path
+):
+    Manifest = AlbumManifest(tmp_path)
+    assert Manifest.read() == {}
+
+    for Number in (1, 2):
+        Hasher = PCMHasher(0)
+        Hasher.update(bytes([ Number ]) * 2352)
+        Manifest.add(tmp_path / f'{Number:02}. Track.wav', Hasher)
+
+    Entries = AlbumManifest(tmp_path).read()
+    assert sorted(Entries) == [ '01. Track.wav', '02. Track.wav' ]
+    assert Entries['02. Track.wav']['pcm_bytes'] == 2352
+    assert (Entries['02. Track.wav']['sha256'] ==
+            hashlib.sha256(b'\x02' * 2352).hexdigest())
+
+    # Compressing a track keeps its entry under the new name.
+    Manifest.rename(tmp_path / '02. Track.wav', tmp_path / '02. Track.flac')
+    Entries = AlbumManifest(tmp_path).read()
+    assert sorted(Entries) == [ '01. Track.wav', '02. Track.flac' ]
+    assert (Entries['02. Track.flac']['sha256'] ==
+            hashlib.sha256(b'\x02' * 2352).hexdigest())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+import time
+
+from dartt.mbcache import MusicBrainzCache
+
+def test_cache_roundtrip(
+        tmp_path,
+        MBFactory
+):
+    MB = MBFactory()
+    Cache = MusicBrainzCache(tmp_path / 'cache' / 'mb.sqlite', 60, 10)
+
+    assert Cache.get('frobnitz', 'weevoo') is None
+
+    Cache.put('frobnitz', 'weevoo', MB.info)
+
+    Result, Fresh = Cache.get('frobnitz', 'weevoo')
+    assert Result == MB.info
+    assert Fresh
+
+    # The TOC is part of the key.
+    assert Cache.get('frobnitz', 'other') is None
+
+def test_cache_persistent(
+        tmp_path,
+        MBFactory
+):
+    MB = MBFactory()
+    MusicBrainzCache(tmp_path / 'mb.sqlite', 60, 10).put('id', 'toc', MB.info)
+
+    Result, Fresh = MusicBrainzCache(tmp_path / 'mb.sqlite', 60, 10).get(
+        'id',
+        'toc'
+    )
+    assert Result == MB.info
+
+def test_cache_stale(
+        tmp_path,
+        monkeypatch,
+        MBFactory
+):
+    MB = MBFactory()
+    Cache = MusicBrainzCache(tmp_path / 'mb.sqlite', 60, 10)
+
+    Now = time.time()
+    with monkeypatch.context() as M:
+        M.setattr('time.time', lambda: Now - 120)
+        Cache.put('id', 'toc', MB.info)
+
+    Result, Fresh = Cache.get('id', 'toc')
+    assert Result == MB.info
+    assert not Fresh
+
+def test_cache_eviction(
+        tmp_path,
+        monkeypatch
+):
+    Cache = MusicBrainzCache(tmp_path / 'mb.sqlite', 60, 3)
+
+    Now = time.time()
+    with monkeypatch.context() as M:
+        for Index in range(3):
+            M.setattr('time.time', lambda Index=Index: Now + Index)
+            Cache.put(f'id{Index}', 'toc', { 'index': Index })
+
+        # Touch the oldest entry so that id1 becomes least recently used.
+        M.setattr('time.time', lambda: Now + 10)
+        Cache.get('id0', 'toc')
+
+        M.setattr('time.time', lambda: Now + 20)
+        Cache.put('id3', 'toc', { 'index': 3 })
+
+    assert len(Cache) == 3
+    assert Cache.get('id1', 'toc') is None
+    for Index in [0, 2, 3]:
+        assert Cache.get(f'id{Index}', 'toc')[0] == { 'index': Index }
@@ -21,6 +21,8 @@
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
 import pytest
+import threading
+import time
 from typing import Callable, Dict, Iterable, Sequence
 
 import dartt.musicbrainz as mb
@@ -103,3 +105,236 @@ def test_track_info(
             assert Track.Number == MBTrack['number']
             assert Track.Title == MBTrack['title']
             assert Track.Artist == MBTrack['artist']
+
+def test_lookup_cached(
+        monkeypatch,
+        MBFactory,
+        DiscIDFactory,
+        configFactory,
+):
+    MB = MBFactory()
+    DiscID = DiscIDFactory()
+    Config = configFactory()
+    Lookups = []
+
+    def lookup(*args, **kwargs):
+        Lookups.append(args)
+        return MB.info
+
+    with monkeypatch.context() as M:
+        M.setattr('musicbrainzngs.get_releases_by_discid', lookup)
+        M.setattr('sh.Command', lambda name: lambda *args: 'password')
+
+        First = mb.MusicBrainz(Config).getDiscInfo(DiscID)
+        Second = mb.MusicBrainz(Config).getDiscInfo(DiscID)
+
+        assert len(Lookups) == 1
+        assert str(First) == str(Second)
+
+def test_lookup_offline(
+        monkeypatch,
+        MBFactory,
+        DiscIDFactory,
+        configFactory,
+):
+    MB = MBFactory()
+    DiscID = DiscIDFactory()
+    Config = configFactory()
+
+    def lookup(*args, **kwargs):
+        raise AssertionError('Offline lookup used the network')
+
+    def password(*args):
+        raise AssertionError('Offline lookup authenticated')
+
+    with monkeypatch.context() as M:
+        M.setattr('musicbrainzngs.get_releases_by_discid', lookup)
+        M.setattr('sh.Command', lambda name: password)
+
+        Config.setOption('offline', True)
+
+        Info = mb.MusicBrainz(Config).getDiscInfo(DiscID)
+        assert Info.ID is None
+
+        mb.MusicBrainzCache(
+            Config.getMusicBrainzCachePath(),
+            Config.getMusicBrainzCacheTTL(),
+            Config.getMusicBrainzCacheMaxEntries()
+        ).put(DiscID.id, DiscID.toc_string, MB.info)
+
+        Info = mb.MusicBrainz(Config).getDiscInfo(DiscID)
+        assert Info.ID == MB.releaseID()
+
+def test_shared_client(
+        monkeypatch,
+        configFactory,
+):
+    Config = configFactory()
+    Calls = []
+
+    def password(*Args):
+        Calls.append(Args)
+        return 'password'
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda name: password)
+
+        Clients = []
+        Threads = [ threading.Thread(
+            target=lambda: Clients.append(mb.getMusicBrainz(Config))
+        ) for _ in range(4) ]
+        for Thread in Threads:
+            Thread.start()
+        for Thread in Threads:
+            Thread.join()
+
+        assert len(Calls) == 1
+        assert all(Client is Clients[0] for Client in Clients)
+        assert mb.getMusicBrainz(Config) is Clients[0]
+
+def test_scheduler_lookup(
+        musicbrainzServerFactory
+):
+    Server = musicbrainzServerFactory()
+    Scheduler = mb.RequestScheduler(Rate=100)
+
+    Info = mb.DiscInfo(Scheduler.lookupDisc('frobnitz', 'weevoo'))
+
+    assert Info.ID == 'release-id'
+    assert Info.Title == 'A Great Release'
+    assert len(Server.requests) == 1
+    assert Server.requests[0].startswith('/ws/2/discid/frobnitz')
+
+def test_scheduler_not_found(
+        musicbrainzServerFactory
+):
+    Server = musicbrainzServerFactory([ 404 ])
+    Scheduler = mb.RequestScheduler(Rate=100)
+
+    assert Scheduler.lookupDisc('frobnitz', 'weevoo') is None
+    assert len(Server.requests) == 1
+
+def test_scheduler_retry(
+        musicbrainzServerFactory
+):
+    Server = musicbrainzServerFactory([ 503, 503, 200 ])
+    Scheduler = mb.RequestScheduler(Rate=100, BackoffBase=0.01)
+
+    Info = mb.DiscInfo(Scheduler.lookupDisc('frobnitz', 'weevoo'))
+
+    assert Info.ID == 'release-id'
+    assert len(Server.requests) == 3
+
+def test_scheduler_circuit_breaker(
+        musicbrainzServerFactory
+):
+    Server = musicbrainzServerFactory([ 503 ])
+    Scheduler = mb.RequestScheduler(Rate=100, MaxRetries=2, BackoffBase=0.01,
+                                    FailureThreshold=3, ResetTimeout=0.2)
+
+    with pytest.raises(mb.MusicBrainzUnavailableError):
+        Scheduler.lookupDisc('frobnitz', 'weevoo')
+    assert len(Server.requests) == 3
+
+    # The circuit is open, so this fails without a request.
+    with pytest.raises(mb.MusicBrainzUnavailableError):
+        Scheduler.lookupDisc('frobnitz', 'weevoo')
+    assert len(Server.requests) == 3
+
+    # After the reset timeout a single trial request goes through.
+    time.sleep(0.3)
+    with pytest.raises(mb.MusicBrainzUnavailableError):
+        Scheduler.lookupDisc('frobnitz', 'weevoo')
+    assert len(Server.requests) == 4
+
+def test_scheduler_coalesce():
+    Scheduler = mb.RequestScheduler(Rate=100)
+    Started = threading.Event()
+    Release = threading.Event()
+    Calls = []
+
+    def request():
+        Calls.append(1)
+        Started.set()
+        Release.wait(timeout=5)
+        return { 'result': len(Calls) }
+
+    Results = []
+    def lookup():
+        Results.append(Scheduler.request(('discid', 'frobnitz'), request))
+
+    First = threading.Thread(target=lookup)
+    First.start()
+    Started.wait(timeout=5)
+    Others = [ threading.Thread(target=lookup) for _ in range(3) ]
+    for Thread in Others:
+        Thread.start()
+    # Give the other lookups time to find the in-flight request.
+    time.sleep(0.1)
+    Release.set()
+    for Thread in [ First ] + Others:
+        Thread.join()
+
+    assert len(Calls) == 1
+    assert Results == [ { 'result': 1 } ] * 4
+
+def test_token_bucket():
+    Bucket = mb.TokenBucket(Rate=50)
+
+    Start = time.monotonic()
+    for _ in range(6):
+        Bucket.acquire()
+
+    # The first token is available immediately; the rest arrive every 20ms.
+    assert time.monotonic() - Start >= 0.09
+
+def test_lookup_unavailable(
+        monkeypatch,
+        DiscIDFactory,
+        configFactory,
+        musicbrainzServerFactory
+):
+    DiscID = DiscIDFactory()
+    Config = configFactory()
+    musicbrainzServerFactory([ 503 ])
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda name: lambda *args: 'password')
+        M.setattr('time.sleep', lambda _: None)
+
+        # The disc is still ripped, without its info.
+        Info = mb.MusicBrainz(Config).getDiscInfo(DiscID)
+        assert Info.ID is None and Info.Tracks == []
+
+@pytest.mark.parametrize('Status', [ 400, 401 ])
+def test_lookup_rejected(
+        monkeypatch,
+        DiscIDFactory,
+        configFactory,
+        musicbrainzServerFactory,
+        Status
+):
+    DiscID = DiscIDFactory()
+    Config = configFactory()
+    Server = musicbrainzServerFactory([ Status ])
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda name: lambda *args: 'password')
+
+        Info = mb.MusicBrainz(Config).getDiscInfo(DiscID)
+        assert Info.ID is None
+
+    # Errors that are not transient are not retried.
+    assert len(Server.requests) == 1
+
+def test_shared_scheduler(
+        monkeypatch,
+        configFactory
+):
+    Config = configFactory()
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda name: lambda *args: 'password')
+        First = mb.MusicBrainz(Config)
+        Second = mb.MusicBrainz(Config)
+
+    assert First._Scheduler is Second._Scheduler is mb.getRequestScheduler()
@@ -131,3 +131,58 @@ def test_Device_open_failure(
         for Device in optical.detectOpticalDrives(Config):
             with pytest.raises(RuntimeError):
                 Disc = Device.open()
+
+def test_monitorOpticalDrives(
+        monkeypatch,
+        configFactory,
+        deviceFactory,
+        commandFactory
+):
+    Config = configFactory()
+
+    Events = [
+        deviceFactory('sr0', '/dev/sr0', 'CD', 'add'),
+        deviceFactory('sr0', '/dev/sr0', 'CD'),
+        deviceFactory('sr1', '/dev/sr1', ''),
+        deviceFactory('sr1', '/dev/sr1', 'DVD'),
+        deviceFactory('sr0', '/dev/sr0', 'CD', 'remove'),
+    ]
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        Drives = list(optical.monitorOpticalDrives(Config, Events))
+
+        assert [ Drive.id for Drive in Drives ] == [ 'sr0', 'sr1' ]
+        assert all(Drive.hasMedia for Drive in Drives)
+
+def test_shared_musicbrainz(
+        monkeypatch,
+        configFactory,
+        devicesFactory
+):
+    monkeypatch.setattr(
+        'pyudev.Context.list_devices',
+        lambda s, **kwargs: devicesFactory(
+            ['sr0', 'sr1', 'sr2', 'sr3'],
+            ['/dev/sr0', '/dev/sr1', '/dev/sr2', '/dev/sr3'],
+            'CD'
+        )
+    )
+
+    Config = configFactory()
+    Calls = []
+
+    def password(*Args):
+        Calls.append(Args)
+        return 'password'
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda Name: password)
+
+        Drives = optical.detectOpticalDrives(Config)
+        Drives += optical.detectOpticalDrives(Config)
+
+        assert len(Drives) == 8
+        assert len(Calls) == 1
+        assert len({ id(Drive._Musicbrainz) for Drive in Drives }) == 1
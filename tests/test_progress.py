@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+import io
+
+from dartt.progress import (CDParanoiaProgressParser, ProgressEvent,
+                            ProgressRenderer, addProgressConsumer,
+                            removeProgressConsumer)
+
+Output = """cdparanoia III release 10.2 (September 11, 2008)
+
+Ripping from sector   18295 (track  3 [0:00.00])
+\t  to sector   18297 (track  3 [0:00.02])
+
+outputting to track03.cdda.wav
+
+##: 0 [read] @ 21514920
+##: -2 [wrote] @ 21516095
+##: 2 [jitter] @ 21516200
+##: 3 [correction] @ 21516300
+##: -2 [wrote] @ 21517271
+##: 6 [skip] @ 21517400
+##: -2 [wrote] @ 21518447
+##: -1 [finished] @ 21518447
+
+Done.
+"""
+
+def test_parse():
+    Events = []
+    addProgressConsumer(Events.append)
+    try:
+        Parser = CDParanoiaProgressParser('sr0', 3)
+        # Feed in odd-sized chunks, as a pipe would deliver them.
+        for Index in range(0, len(Output), 7):
+            Parser.feed(Output[Index:Index + 7])
+    finally:
+        removeProgressConsumer(Events.append)
+
+    assert [ Event.Kind for Event in Events ] == [
+        'read', 'wrote', 'jitter', 'correction', 'wrote', 'skip', 'wrote',
+        'finished'
+    ]
+    assert all(Event.Drive == 'sr0' and Event.Track == 3 for Event in Events)
+    assert [ Event.Sector for Event in Events if Event.Kind == 'wrote' ] == [
+        18295, 18296, 18297
+    ]
+
+    Progress = Parser.Progress
+    assert Progress.FirstSector == 18295
+    assert Progress.LastSector == 18297
+    assert Progress.Sector == 18297
+    assert Progress.Fraction == 1.0
+    assert Progress.Errors == 2
+    assert Progress.Skips == 1
+    assert Progress.Counts['wrote'] == 3
+    assert Progress.BadSectors == { 18296, 18297 }
+
+def test_parse_unknown_function():
+    Events = []
+    addProgressConsumer(Events.append)
+    try:
+        CDParanoiaProgressParser('sr0', 1).feed('##: 42 [mystery] @ 1176\n')
+    finally:
+        removeProgressConsumer(Events.append)
+
+    assert len(Events) == 1
+    assert Events[0].Kind == 'mystery'
+    assert Events[0].Sector == 1
+
+def test_render_rate_limited():
+    Out = io.StringIO()
+    Renderer = ProgressRenderer(Interval=3600, Output=Out)
+
+    for Sector in range(100):
+        Renderer(ProgressEvent('sr0', 1, 'wrote', Sector))
+
+    # Only the first event is drawn within the interval.
+    assert Out.getvalue().count('\r') == 1
+
+def test_render_drives():
+    Out = io.StringIO()
+    Renderer = ProgressRenderer(Interval=0, Output=Out)
+
+    Renderer(ProgressEvent('sr0', 1, 'wrote', 10))
+    Renderer(ProgressEvent('sr1', 4, 'skip', 20))
+
+    Line = Out.getvalue().split('\r')[-1]
+    assert 'sr0 track 01' in Line
+    assert 'sr1 track 04' in Line
+    assert 'skips 1' in Line
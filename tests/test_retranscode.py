@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+from pathlib import Path
+import pytest
+from typing import Callable, List, Sequence
+
+import dartt.archive as archive
+import dartt.cue as cue
+from dartt.disc import AudioTrack
+import dartt.index as index
+import dartt.manifest as manifest
+import dartt.musicbrainz as mb
+from dartt.retranscode import RetranscodeCheckpoint, Retranscoder, retranscode
+
+def archiveDisc(
+        Config,
+        DiscID: str,
+        Count: int = 2,
+        Silent: Sequence[int] = ()
+) -> List[AudioTrack]:
+    """Archive and index a disc of short tracks, of digital silence for the
+    track numbers in Silent."""
+    Album = Path(Config.getAudioArchiveDir()) / 'Artist' / DiscID
+    Album.mkdir(parents=True)
+
+    Tracks = []
+    for Number in range(1, Count + 1):
+        Data = bytes([ 0 if Number in Silent else Number ]) * 588 * 4
+        TrackPath = Album / f'{Number:02}. Track {Number}.wav'
+        TrackPath.write_bytes(cue.getWavHeader(len(Data)) + Data)
+        Hasher = manifest.PCMHasher(0)
+        Hasher.update(Data)
+        Info = mb.TrackInfo({ 'number': Number,
+                              'recording': { 'title': f'Track {Number}',
+                                             'artist-credit-phrase':
+                                             'Artist' } })
+        Tracks.append(AudioTrack(TrackPath, Info, Hasher.Checksums))
+
+    index.getArchiveIndex(Config).addDisc(DiscID, f'release-{DiscID}',
+                                          f'Title {DiscID}', 'Artist', Tracks)
+    return Tracks
+
+def getOutput(
+        Config,
+        Track: AudioTrack
+) -> Path:
+    Relative = Track.RippedPath.relative_to(Config.getAudioArchiveDir())
+    return (Path(Config.getAudioTranscodeDir()) / Relative).with_suffix(
+        '.flac'
+    )
+
+@pytest.fixture
+def retranscodeConfig(
+        configFactory,
+        fakeEncoderFactory: Callable
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+    Config['audio']['transcode_jobs'] = 2
+    # The fake encoder writes WAV files, which cannot be tagged.
+    Config['audio']['tag'] = False
+    return Config
+
+def test_retranscode(
+        retranscodeConfig
+):
+    Config = retranscodeConfig
+    Tracks = archiveDisc(Config, 'frobnitz') + archiveDisc(Config, 'weevoo', 3)
+
+    Summary = retranscode(Config)
+
+    assert (Summary.Discs, Summary.Tracks, Summary.Retranscoded,
+            Summary.Failed) == (2, 5, 5, 0)
+    Index = index.getArchiveIndex(Config)
+    for Track in Tracks:
+        Output = getOutput(Config, Track)
+        assert Output.read_bytes() == Track.RippedPath.read_bytes()
+        assert Index.getTranscode(Track.RippedPath.parent.name,
+                                  Track.Number)[0] == Output
+
+    # The checkpoint goes once everything is up to date.
+    assert not Path(Config.getRetranscodeCheckpointPath()).exists()
+
+    # Nothing is stale now.
+    Summary = retranscode(Config)
+    assert (Summary.Tracks, Summary.Retranscoded) == (5, 0)
+
+def test_retranscode_tags(
+        monkeypatch,
+        retranscodeConfig
+):
+    Config = retranscodeConfig
+    Config['audio']['tag'] = True
+    Tracks = archiveDisc(Config, 'frobnitz')
+    Tags = { 1: { 'title': 'Track 1', 'artist': 'Guest',
+                  'albumartist': 'Artist', 'date': '2023',
+                  'replaygain_track_gain': '-1.00 dB' } }
+    index.getArchiveIndex(Config).addDisc('frobnitz', 'release-frobnitz',
+                                          'Title frobnitz', 'Artist', Tracks,
+                                          Tags)
+
+    Tagged = dict()
+    monkeypatch.setattr('dartt.tagging.tagFile',
+                        lambda FilePath, FileTags, Padding:
+                        Tagged.setdefault(FilePath, FileTags))
+    assert retranscode(Config).Retranscoded == 2
+
+    # The tags recorded when the disc was ripped are written again, and
+    # those of a disc indexed without tags come from the index.
+    assert Tagged[getOutput(Config, Tracks[0])] == Tags[1]
+    assert Tagged[getOutput(Config, Tracks[1])] == {
+        'title': 'Track 2',
+        'artist': 'Artist',
+        'album': 'Title frobnitz',
+        'albumartist': 'Artist',
+        'tracknumber': '2',
+        'tracktotal': '2',
+        'musicbrainz_albumid': 'release-frobnitz',
+        'musicbrainz_discid': 'frobnitz',
+    }
+
+def test_retranscode_stale(
+        retranscodeConfig
+):
+    Config = retranscodeConfig
+    Tracks = archiveDisc(Config, 'frobnitz', 3)
+    retranscode(Config)
+
+    # A missing transcode, and one made from other audio.
+    getOutput(Config, Tracks[0]).unlink()
+    Index = index.getArchiveIndex(Config)
+    Output, _ = Index.getTranscode('frobnitz', 3)
+    Index.setTranscode('frobnitz', 3, Output, 'stale')
+
+    Summary = retranscode(Config)
+    assert Summary.Retranscoded == 2
+    assert getOutput(Config, Tracks[0]).exists()
+    assert Index.getTranscode('frobnitz', 3)[1] != 'stale'
+
+def test_retranscode_settings(
+        retranscodeConfig,
+        fakeEncoderFactory: Callable
+):
+    Config = retranscodeConfig
+    archiveDisc(Config, 'frobnitz')
+    retranscode(Config)
+
+    Config['audio']['quality'] = 'Low'
+    assert retranscode(Config).Retranscoded == 2
+    assert retranscode(Config).Retranscoded == 0
+
+    # A new encoder version, installed under the same name.
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac', 'fake 2.0'))
+    Retranscode = Retranscoder(Config)
+    assert Retranscode.run().Retranscoded == 2
+
+def test_retranscode_skipped(
+        retranscodeConfig
+):
+    Config = retranscodeConfig
+    Config['audio']['skip_silent_tracks'] = True
+    Tracks = archiveDisc(Config, 'frobnitz', 3, Silent=[ 2 ])
+
+    Summary = retranscode(Config)
+    assert (Summary.Tracks, Summary.Retranscoded, Summary.Skipped,
+            Summary.Failed) == (3, 2, 1, 0)
+    assert not getOutput(Config, Tracks[1]).exists()
+    assert '1 skipped' in str(Summary)
+
+    # A skipped track is up to date.
+    Summary = retranscode(Config)
+    assert (Summary.Retranscoded, Summary.Skipped) == (0, 0)
+
+def test_retranscode_resume(
+        retranscodeConfig
+):
+    Config = retranscodeConfig
+    archiveDisc(Config, 'frobnitz')
+    Missing = archiveDisc(Config, 'weevoo')[1].RippedPath
+    Missing.rename(Missing.with_suffix('.bak'))
+
+    Summary = retranscode(Config)
+    assert (Summary.Retranscoded, Summary.Failed) == (3, 1)
+
+    # The checkpoint keeps the disc that is done.
+    CheckpointPath = Path(Config.getRetranscodeCheckpointPath())
+    assert CheckpointPath.read_text().split('\n')[1:] == [ 'frobnitz', '' ]
+
+    Missing.with_suffix('.bak').rename(Missing)
+    Summary = retranscode(Config)
+    assert (Summary.Discs, Summary.Resumed, Summary.Tracks,
+            Summary.Retranscoded, Summary.Failed) == (2, 1, 2, 1, 0)
+    assert not CheckpointPath.exists()
+
+def test_retranscode_checkpoint(
+        tmp_path
+):
+    CheckpointPath = tmp_path / 'retranscode.log'
+    Checkpoint = RetranscodeCheckpoint(CheckpointPath, { 'quality': [ '-8' ] })
+    Checkpoint.complete('frobnitz')
+    Checkpoint.complete('weevoo')
+    Checkpoint.close()
+
+    # A crash may cut the last line short.
+    with open(CheckpointPath, 'a') as File:
+        File.write('zar')
+
+    Checkpoint = RetranscodeCheckpoint(CheckpointPath, { 'quality': [ '-8' ] })
+    assert Checkpoint.isDone('frobnitz') and Checkpoint.isDone('weevoo')
+    assert not Checkpoint.isDone('zar')
+    assert len(Checkpoint) == 2
+    Checkpoint.complete('zarquon')
+    Checkpoint.close()
+    assert CheckpointPath.read_text().split('\n')[1:] == [
+        'frobnitz', 'weevoo', 'zarquon', ''
+    ]
+
+    # Other settings start over.
+    Checkpoint = RetranscodeCheckpoint(CheckpointPath, { 'quality': [ '-3' ] })
+    assert len(Checkpoint) == 0
+
+def test_retranscode_image(
+        retranscodeConfig
+):
+    Config = retranscodeConfig
+    Album = Path(Config.getAudioArchiveDir()) / 'Artist' / 'Title'
+    Album.mkdir(parents=True)
+    ImagePath = Album / 'Title.wav'
+    Audio = [ bytes([ 1 ]) * 2352 * 2, bytes([ 2 ]) * 2352 * 3 ]
+    ImagePath.write_bytes(cue.getWavHeader(sum(map(len, Audio))) +
+                          b''.join(Audio))
+    cue.writeCueSheet(ImagePath.with_suffix('.cue'), ImagePath,
+                      [ (1, 0, 'Track 1', 'Artist'),
+                        (2, 2, 'Track 2', 'Artist') ], 'Title', 'Artist')
+
+    # Without hashes, the tracks are hashed from the image.
+    Tracks = [ AudioTrack(ImagePath,
+                          mb.TrackInfo({ 'number': Number,
+                                         'recording': {
+                                             'title': f'Track {Number}',
+                                             'artist-credit-phrase':
+                                             'Artist' } }))
+               for Number in (1, 2) ]
+    index.getArchiveIndex(Config).addDisc('frobnitz', None, 'Title', 'Artist',
+                                          Tracks)
+
+    assert retranscode(Config).Retranscoded == 2
+    for Number, Data in enumerate(Audio, 1):
+        Output = (Path(Config.getAudioTranscodeDir()) / 'Artist' / 'Title' /
+                  f'{Number:02}. Track {Number}.flac')
+        assert Output.read_bytes() == cue.getWavHeader(len(Data)) + Data
+
+    # The hashes are recorded, so the image is not read again to check them.
+    Index = index.getArchiveIndex(Config)
+    assert all(SHA256 is not None
+               for _, _, _, SHA256 in Index.getTracks('frobnitz'))
+
+    assert retranscode(Config).Retranscoded == 0
+
+def test_retranscode_compressed(
+        retranscodeConfig,
+        fakeArchiverFactory: Callable
+):
+    Config = retranscodeConfig
+    Archiver = fakeArchiverFactory('flac-archive')
+    Config['audio']['archive_format'] = 'flac'
+    Config['audio']['archive_encoder'] = str(Archiver)
+    Config['audio']['archive_decoder'] = str(Archiver)
+
+    Tracks = archiveDisc(Config, 'frobnitz')
+    Audio = [ Track.RippedPath.read_bytes() for Track in Tracks ]
+    Compressed = archive.createArchiveCompressor(Config).compress(Tracks)
+    assert all(Track.RippedPath.suffix == '.flac' for Track in Compressed)
+    index.getArchiveIndex(Config).addDisc('frobnitz', None, 'Title', 'Artist',
+                                          Compressed)
+
+    assert retranscode(Config).Retranscoded == 2
+    for Track, Data in zip(Compressed, Audio):
+        assert getOutput(Config, Track).read_bytes() == Data
+
+    # Archives that do not decode to the archived audio are left alone.
+    Config['audio']['quality'] = 'Low'
+    Config['audio']['archive_decoder'] = str(
+        fakeArchiverFactory('flac-corrupt', Corrupt=True)
+    )
+    Summary = retranscode(Config)
+    assert (Summary.Retranscoded, Summary.Failed) == (0, 2)
@@ -20,14 +20,26 @@
 # You should have received a copy of the GNU Affero General Public License along
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
+import hashlib
+import numpy as np
 from pathlib import Path
 import sh
+import subprocess
+import threading
+import zlib
 from typing import Callable, Dict, Iterable, Sequence
 
 import dartt.audiocd as audiocd
+import dartt.drives as drives
+import dartt.journal as journal
+import dartt.manifest as manifest
 import dartt.musicbrainz as mb
 import dartt.optical as optical
+import dartt.progress as progress
 from dartt.ripper import CDParanoiaRipper
+from dartt.transcoder import createAudioTranscoder
+import dartt.verify as verify
+import pytest
 
 class MockRipper:
     class MockProcess:
@@ -37,12 +49,16 @@ class MockRipper:
     def __init__(self, CD: audiocd.AudioCD, RipPath: Path):
         self.CD  = CD
         self.RipPath = RipPath
+        self.Directories = []
 
     def __call__(self, *Args, **KWArgs):
-        for Track in self.CD.getTrackInfo():
-            File = Path.cwd() / f'track{Track.Number:02}.cdda.wav'
-            print(f'Ripping to {File}')
-            File.touch()
+        # cdparanoia is run once per track with the track as the span.
+        Number = int(Args[0][Args[0].index('--') + 1])
+        Directory = Path(KWArgs['_cwd'])
+        self.Directories.append(Directory)
+        File = Directory / f'track{Number:02}.cdda.wav'
+        print(f'Ripping to {File}')
+        File.touch()
         return MockRipper.MockProcess()
 
 def test_rip(
@@ -85,9 +101,10 @@ def test_rip(
 
         RipPath = Path(Config.getAudioArchiveDir())
 
+        Ripper = MockRipper(CD, RipPath)
         M.setattr(
             'sh.Command',
-            lambda Name: (MockRipper(CD, RipPath)
+            lambda Name: (Ripper
                           if Name == '/usr/bin/cdparanoia' else
                           commandFactory(Name, 'password')))
 
@@ -95,6 +112,12 @@ def test_rip(
 
         assert len(RippedTracks) == len(CDTracks)
 
+        # Tracks are staged on the archive filesystem and the staging area is
+        # cleaned up afterward.
+        for Directory in Ripper.Directories:
+            assert Directory.parent == RipPath
+            assert not Directory.exists()
+
         for RippedTrack, CDTrack in zip(RippedTracks, CDTracks):
             ExpectedPath = (RipPath / f'{CD.getArtists()[0]}' /
                             f'{CD.getTitle()}' /
@@ -104,3 +127,569 @@ def test_rip(
             assert RippedTrack.Title ==  CDTrack.Title
             assert RippedTrack.Artist == CDTrack.Artist
 
+
+def test_rip_unknown_artist(
+        configFactory
+):
+    Config = configFactory()
+
+    class UnknownDisc:
+        def getArtists(self):
+            return []
+
+        def getTitle(self):
+            return 'Title'
+
+    Ripper = CDParanoiaRipper(Config)
+    Info = mb.TrackInfo({ 'number': 1,
+                          'recording': { 'title': 'Track 1',
+                                         'artist-credit-phrase': 'Artist' } })
+    ArchivePath = Path(Config.getAudioArchiveDir())
+
+    assert (Ripper.getArchiveTrackPath(UnknownDisc(), Info) ==
+            ArchivePath / 'Unknown Artist' / 'Title' / '01. Track 1.wav')
+    assert (Ripper.getArchiveImagePath(UnknownDisc()) ==
+            ArchivePath / 'Unknown Artist' / 'Title' / 'Title.wav')
+
+def test_rip_overlaps_lookup(
+        tmp_path,
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    Ripping = threading.Event()
+
+    def lookup(*args, **kwargs):
+        # Do not answer until the ripper is running.
+        assert Ripping.wait(timeout=5)
+        return MB.info
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr('musicbrainzngs.get_releases_by_discid', lookup)
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+
+        class OverlappedRipper(MockRipper):
+            def __call__(self, *Args, **KWArgs):
+                Ripping.set()
+                return super().__call__(*Args, **KWArgs)
+
+        M.setattr(
+            'sh.Command',
+            lambda Name: (OverlappedRipper(CD, tmp_path)
+                          if Name == '/usr/bin/cdparanoia' else
+                          commandFactory(Name, 'password')))
+
+        RippedTracks = CDParanoiaRipper(Config).rip(CD)
+
+        assert len(RippedTracks) == len(MB.releaseTracks())
+
+def test_rip_tracks_streaming(
+        tmp_path,
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    Invocations = []
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+
+        class CountingRipper(MockRipper):
+            def __call__(self, *Args, **KWArgs):
+                Invocations.append(Args[0][Args[0].index('--') + 1])
+                return super().__call__(*Args, **KWArgs)
+
+        M.setattr(
+            'sh.Command',
+            lambda Name: (CountingRipper(CD, tmp_path)
+                          if Name == '/usr/bin/cdparanoia' else
+                          commandFactory(Name, 'password')))
+
+        Tracks = CDParanoiaRipper(Config).ripTracks(CD)
+
+        # Each track is handed over before the next one is read.
+        for Index, (Track, MBTrack) in enumerate(zip(Tracks,
+                                                     MB.releaseTracks())):
+            assert Track.Number == MBTrack['number']
+            assert Track.RippedPath.exists()
+            assert len(Invocations) == Index + 1
+
+@pytest.mark.parametrize('Archive', [ False, True ])
+def test_stream_tracks(
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        fakeEncoderFactory: Callable,
+        Archive
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Encoder = fakeEncoderFactory('flac')
+    Config['audio']['transcoder'] = str(Encoder)
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    Commands = []
+
+    class RecordingPopen(subprocess.Popen):
+        def __init__(self, Args, **KWArgs):
+            Commands.append((Args, KWArgs.get('stdin')))
+            super().__init__(Args, **KWArgs)
+
+    monkeypatch.setattr('subprocess.Popen', RecordingPopen)
+
+    Events = []
+    progress.addProgressConsumer(Events.append)
+    Transcoder = createAudioTranscoder(Config)
+    try:
+        Tracks = list(CDParanoiaRipper(Config).streamTracks(CD, Transcoder,
+                                                            Archive))
+    finally:
+        progress.removeProgressConsumer(Events.append)
+
+    assert len(Tracks) == len(MB.releaseTracks())
+    # The encoder reads another process's output, never a pipe fed from
+    # Python, and only tee writes the archived WAV.
+    Stages = [ Args[0] for Args, _ in Commands ]
+    Pipeline = ([ str(CDParanoia.path), 'tee', str(Encoder) ] if Archive else
+                [ str(CDParanoia.path), str(Encoder) ])
+    assert Stages == Pipeline * len(Tracks)
+    assert all(Stdin != subprocess.PIPE for _, Stdin in Commands)
+
+    ArchivePath = Path(Config.getAudioArchiveDir())
+    TranscodePath = Path(Config.getAudioTranscodeDir())
+    for Track, MBTrack in zip(Tracks, MB.releaseTracks()):
+        Name = f'{MBTrack["number"]:02}. {MBTrack["title"]}'
+        Expected = (TranscodePath / MB.releaseArtistName() /
+                    MB.releaseTitle() / f'{Name}.flac')
+        assert Track.TranscodedPath == Expected
+        # The fake encoder copies its input, so this is what came through the
+        # pipe.
+        Data = Expected.read_bytes()
+        assert Data[44:] == CDParanoia.pcm(MBTrack['number'])
+
+        WavPath = (ArchivePath / MB.releaseArtistName() / MB.releaseTitle() /
+                   f'{Name}.wav')
+        if Archive:
+            assert Track.RippedPath == WavPath
+            assert WavPath.read_bytes() == Data
+            Entry = manifest.AlbumManifest(WavPath.parent).get(WavPath)
+            assert Entry['sha256'] == hashlib.sha256(Data[44:]).hexdigest()
+            assert Entry['crc32'] == f'{zlib.crc32(Data[44:]):08x}'
+            assert Track.Checksums['sha256'] == Entry['sha256']
+        else:
+            assert Track.RippedPath is None
+            assert not WavPath.exists()
+
+        # cdparanoia's progress is parsed rather than printed.
+        Wrote = [ Event.Sector for Event in Events
+                  if Event.Track == MBTrack['number'] and Event.Kind == 'wrote' ]
+        First = MBTrack['number'] * 75
+        assert Wrote == list(range(First, First + 75))
+
+    # Nothing is left in staging.
+    assert not list(ArchivePath.glob('.dartt-staging-*'))
+    assert not list(TranscodePath.glob('.dartt-staging-*'))
+
+def test_rip_tracks_resume(
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    # Track 0 was finished before the interruption and must not be read again.
+    CDParanoia = fakeCDParanoiaFactory(FailTracks=[ 0 ])
+    Config['audio']['ripper'] = str(CDParanoia.path)
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        TrackInfos = CD.getTrackInfo()
+
+    Ripper = CDParanoiaRipper(Config)
+    StagingPath = Ripper.getStagingPath(CD)
+    StagingPath.mkdir(parents=True)
+    Journal = journal.RipJournal(StagingPath / 'journal.json', CD.id)
+
+    Header = b'H' * 44
+    Done = Ripper.getArchiveTrackPath(CD, TrackInfos[0])
+    Done.parent.mkdir(parents=True)
+    Done.write_bytes(Header + CDParanoia.pcm(0))
+    Journal.complete(0, Done, sha256='0')
+
+    # Track 1 got 30 sectors in, and the file has some unverified sectors
+    # past that.
+    Partial = Header + CDParanoia.pcm(1)[:30 * 2352] + b'\xff' * 3 * 2352
+    (StagingPath / 'track01.cdda.wav').write_bytes(Partial)
+    Journal.checkpoint(1, 75, 75 + 29)
+
+    Tracks = list(Ripper.ripTracks(CD))
+
+    assert [ Track.Number for Track in Tracks ] == [ 0, 1 ]
+    assert Tracks[0].RippedPath == Done
+    assert (Tracks[1].RippedPath.read_bytes() ==
+            Header + CDParanoia.pcm(1))
+
+    # The kept sectors and the newly read ones hash as one track.
+    Entry = manifest.AlbumManifest(Done.parent).get(Tracks[1].RippedPath)
+    assert Entry['sha256'] == hashlib.sha256(CDParanoia.pcm(1)).hexdigest()
+    assert Entry['pcm_bytes'] == len(CDParanoia.pcm(1))
+
+    # Only the rest of track 1 was read.
+    Calls = CDParanoia.calls()
+    assert len(Calls) == 1
+    assert '--output-raw-little-endian' in Calls[0]
+    assert Calls[0][Calls[0].index('--') + 1] == '1[.30]-1'
+
+    assert not StagingPath.exists()
+
+def test_rip_tracks_journal(
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory(SecondsPerSector=0.01)
+    Config['audio']['ripper'] = str(CDParanoia.path)
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    Checkpoints = []
+    Checkpoint = journal.RipJournal.checkpoint
+
+    def checkpoint(Self, Number, FirstSector, Sector):
+        Checkpoints.append((Number, FirstSector, Sector))
+        Checkpoint(Self, Number, FirstSector, Sector)
+
+    monkeypatch.setattr(journal.RipJournal, 'checkpoint', checkpoint)
+
+    Ripper = CDParanoiaRipper(Config)
+    Ripper.CheckpointInterval = 0
+    Tracks = Ripper.ripTracks(CD)
+    First = next(Tracks)
+
+    # Progress was recorded while the track was read.
+    assert Checkpoints
+    assert all(Checkpoint[:2] == (First.Number, First.Number * 75)
+               for Checkpoint in Checkpoints)
+    assert Checkpoints[-1][2] == First.Number * 75 + 74
+
+    # Stop after the first track, as if dartt had been killed.
+    JournalPath = Ripper.getStagingPath(CD) / 'journal.json'
+    Journal = journal.RipJournal(JournalPath, CD.id)
+    Completed = Journal.getCompleted(First.Number)
+    assert Completed['path'] == str(First.RippedPath)
+    # The hashes cover the audio, not the WAV header.
+    Data = First.RippedPath.read_bytes()[44:]
+    assert Completed['sha256'] == hashlib.sha256(Data).hexdigest()
+    assert Completed['crc32'] == f'{zlib.crc32(Data):08x}'
+    assert First.Checksums == { 'sha256': Completed['sha256'],
+                                'crc32': Completed['crc32'] }
+    # Finishing the track clears its checkpoint.
+    assert Journal.getPartial(First.Number) is None
+    assert JournalPath.exists()
+
+def test_rip_tracks_drive_capabilities(
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable
+):
+    Config = configFactory()
+    DiscID = DiscIDFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    drives.getDriveCapabilityStore(Config).set(
+        'HL-DT-ST', 'DVDRAM_GH24NSD1', drives.DriveCapabilities(6, False, 8)
+    )
+
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+
+    assert Drive.Capabilities.ReadOffset == 6
+
+    list(CDParanoiaRipper(Config).ripTracks(CD))
+
+    # Each rip reads from the disc's drive with its offset corrected.
+    Calls = CDParanoia.calls()
+    assert len(Calls) == len(MB.releaseTracks())
+    for Call in Calls:
+        Options = ' '.join(Call[:Call.index('--')])
+        assert f'--force-cdrom-device {Drive.path}' in Options
+        assert '--sample-offset 6' in Options
+        assert '--force-read-speed 8' in Options
+
+def makeAdaptiveCD(
+        monkeypatch,
+        Config,
+        MB,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable
+) -> audiocd.AudioCD:
+    DiscID = DiscIDFactory()
+    with monkeypatch.context() as M:
+        M.setattr(
+            'pyudev.Context.list_devices',
+            lambda s, **kwargs: devicesFactory(
+                ('sr0', '/dev/sr0'),
+                ('sr0', '/dev/sr0'),
+                'CD'
+            )
+        )
+        M.setattr(
+            'musicbrainzngs.get_releases_by_discid',
+            lambda *args, **kwargs: MB.info
+        )
+        M.setattr(
+            'discid.read', lambda Device: DiscID
+        )
+        M.setattr('sh.Command', lambda Name: commandFactory(Name, 'password'))
+
+        MBrainz = mb.MusicBrainz(Config)
+        Drive = optical.detectOpticalDrives(Config)[0]
+        CD = audiocd.AudioCD(Drive, MBrainz)
+        # Finish the lookup while it is mocked.
+        CD.getDiscInfo()
+    return CD
+
+def test_rip_tracks_adaptive_accurate(
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        accurateRipFactory: Callable
+):
+    Config = configFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory()
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['rip_mode'] = 'adaptive'
+    CD = makeAdaptiveCD(monkeypatch, Config, MB, devicesFactory,
+                        DiscIDFactory, commandFactory)
+
+    Samples = [ np.frombuffer(CDParanoia.pcm(Track['number']), dtype='<u4')
+                for Track in MB.releaseTracks() ]
+    CRCs = [ verify.accurateRipCRCs([ Samples[0] ], True, False)[0],
+             verify.accurateRipCRCs([ Samples[1] ], False, True)[0] ]
+    Config['audio']['accuraterip_url'] = accurateRipFactory(
+        CD.getAccurateRipID(), CRCs
+    )
+
+    Tracks = list(CDParanoiaRipper(Config).ripTracks(CD))
+
+    assert [ Track.RippedPath.read_bytes()[44:] for Track in Tracks ] == [
+        CDParanoia.pcm(Track['number']) for Track in MB.releaseTracks()
+    ]
+    # Tracks that match AccurateRip are read once, without paranoia.
+    Calls = CDParanoia.calls()
+    assert len(Calls) == len(Tracks)
+    assert all('--disable-paranoia' in Call for Call in Calls)
+
+@pytest.mark.parametrize('BurstErrors, Repairs', [
+    ({}, []),
+    ({ 1: [ 3, 4, 10 ] }, [ '1[.3]-1[.4]', '1[.10]-1[.10]' ]),
+    # Too many bad sectors to repair one by one.
+    ({ 1: list(range(0, 75, 2)) }, [ '1' ]),
+])
+def test_rip_tracks_adaptive_repair(
+        monkeypatch,
+        configFactory,
+        MBFactory: Callable,
+        devicesFactory: Callable,
+        DiscIDFactory: Callable,
+        commandFactory: Callable,
+        fakeCDParanoiaFactory: Callable,
+        accurateRipFactory: Callable,
+        BurstErrors: Dict[int, Sequence[int]],
+        Repairs: Sequence[str]
+):
+    Config = configFactory()
+    MB = MBFactory()
+    CDParanoia = fakeCDParanoiaFactory(BurstErrors=BurstErrors)
+    Config['audio']['ripper'] = str(CDParanoia.path)
+    Config['audio']['rip_mode'] = 'adaptive'
+    # The disc is not in AccurateRip.
+    Config['audio']['accuraterip_url'] = accurateRipFactory()
+    CD = makeAdaptiveCD(monkeypatch, Config, MB, devicesFactory,
+                        DiscIDFactory, commandFactory)
+
+    Tracks = list(CDParanoiaRipper(Config).ripTracks(CD))
+
+    for Track in Tracks:
+        PCM = CDParanoia.pcm(Track.Number)
+        assert Track.RippedPath.read_bytes()[44:] == PCM
+        # Repaired tracks are hashed again.
+        Entry = manifest.AlbumManifest(Track.RippedPath.parent).get(
+            Track.RippedPath
+        )
+        assert Entry['sha256'] == hashlib.sha256(PCM).hexdigest()
+
+    # Each track is burst read twice, then only the bad sectors are read
+    # with paranoia.
+    Calls = CDParanoia.calls()
+    Burst = [ Call for Call in Calls if '--disable-paranoia' in Call ]
+    Paranoia = [ Call[Call.index('--') + 1] for Call in Calls
+                 if '--disable-paranoia' not in Call ]
+    assert len(Burst) == 2 * len(Tracks)
+    assert Paranoia == list(Repairs)
+    # The re-read sectors are written into the WAV file in its byte order.
+    assert all('--output-raw-little-endian' in Call for Call in Calls
+               if '-' in Call[Call.index('--') + 1])
+    assert not list(Tracks[0].RippedPath.parent.glob('*.check'))
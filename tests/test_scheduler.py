@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+import threading
+
+from dartt.device import Device, DeviceNotReadyError
+from dartt.scheduler import DriveScheduler
+
+class MockMedia:
+    def __init__(self, Tracks, Barrier = None):
+        self._Tracks = Tracks
+        self._Barrier = Barrier
+
+    def rip(self, Config):
+        if self._Barrier:
+            # Every drive must be ripping at the same time to get past this.
+            self._Barrier.wait(timeout=5)
+        return self._Tracks
+
+class MockDrive(Device):
+    def __init__(self, Name: str, Media = None, Error: Exception = None):
+        self._Name = Name
+        self._Media = Media
+        self._Error = Error
+
+    def __repr__(self) -> str:
+        return self._Name
+
+    @property
+    def id(self) -> str:
+        return self._Name
+
+    def open(self):
+        if self._Error:
+            raise self._Error
+        if self._Media is None:
+            raise DeviceNotReadyError(f'/dev/{self._Name}')
+        return self._Media
+
+def test_scheduler_concurrent(
+        configFactory
+):
+    Config = configFactory()
+    Barrier = threading.Barrier(3)
+    Drives = [ MockDrive(f'sr{Index}', MockMedia([Index], Barrier))
+               for Index in range(3) ]
+
+    Summary = DriveScheduler(Config).run(Drives)
+
+    assert len(Summary.Results) == 3
+    assert not Summary.Failed
+    assert (sorted(Result.Tracks for Result in Summary.Results) ==
+            [ [0], [1], [2] ])
+
+def test_scheduler_not_ready(
+        configFactory
+):
+    Config = configFactory()
+    Drives = [ MockDrive('sr0', MockMedia(['a'])),
+               MockDrive('sr1'),
+               MockDrive('sr2', MockMedia(['b', 'c'])) ]
+
+    Summary = DriveScheduler(Config).run(Drives)
+
+    assert len(Summary.Results) == 3
+    assert [ Result.Drive.id for Result in Summary.NotReady ] == [ 'sr1' ]
+    Ripped = { Result.Drive.id: Result.Tracks for Result in Summary.Results
+               if Result.Succeeded }
+    assert Ripped == { 'sr0': ['a'], 'sr2': ['b', 'c'] }
+    assert 'Ripped 2 of 3 drives' in str(Summary)
+
+def test_scheduler_error(
+        configFactory
+):
+    Config = configFactory()
+    Drives = [ MockDrive('sr0', Error=RuntimeError('drive on fire')),
+               MockDrive('sr1', MockMedia(['a'])) ]
+
+    Summary = DriveScheduler(Config).run(Drives)
+
+    assert len(Summary.Failed) == 1
+    assert not Summary.NotReady
+    assert 'drive on fire' in str(Summary.Failed[0])
+
+def test_scheduler_serve(
+        configFactory
+):
+    Config = configFactory()
+    Event = threading.Event()
+
+    class BlockingMedia:
+        def rip(self, Config):
+            Event.wait(timeout=5)
+            return ['a']
+
+    def events():
+        # The second event for sr0 arrives while it is still ripping and must
+        # not start a second rip.
+        yield MockDrive('sr0', BlockingMedia())
+        yield MockDrive('sr0', BlockingMedia())
+        yield MockDrive('sr1', MockMedia(['b']))
+        Event.set()
+
+    Summary = DriveScheduler(Config).serve(events())
+
+    assert sorted(Result.Drive.id for Result in Summary.Results) == [ 'sr0',
+                                                                       'sr1' ]
+    assert not Summary.Failed
+
+def test_scheduler_serve_counts(
+        configFactory,
+        capsys
+):
+    Config = configFactory()
+    Drives = [ MockDrive('sr0', MockMedia(['a'])),
+               MockDrive('sr1', Error=RuntimeError('drive on fire')),
+               MockDrive('sr2', MockMedia(['b'])) ]
+
+    # A scheduler that serves forever keeps counts rather than results, and
+    # leaves the terminal to the progress line.
+    Summary = DriveScheduler(Config, Retain=False).serve(iter(Drives))
+
+    assert Summary.Results == []
+    assert (Summary.Count, Summary.FailedCount) == (3, 1)
+    assert str(Summary) == 'Ripped 2 of 3 drives'
+    assert capsys.readouterr().out == ''
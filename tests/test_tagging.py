@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+
+import mutagen
+import mutagen.apev2
+import mutagen.flac
+import mutagen.id3
+import mutagen.mp4
+from pathlib import Path
+import pytest
+import struct
+from typing import Callable
+
+import dartt.analysis as analysis
+from dartt.disc import AudioTrack
+import dartt.musicbrainz as mb
+import dartt.tagging as tagging
+from dartt.transcoder import TranscodedTrack
+
+# Stands in for encoded audio, which taggers never read.
+Audio = bytes(range(256)) * 64
+
+def makeFLAC(FilePath: Path):
+    Info = (struct.pack('>HH', 4096, 4096) + bytes(6) +
+            ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, 'big') +
+            bytes(16))
+    FilePath.write_bytes(b'fLaC' + bytes([ 0x80 ]) +
+                         len(Info).to_bytes(3, 'big') + Info + Audio)
+
+def makeM4A(FilePath: Path):
+    def atom(Name: bytes, Data: bytes) -> bytes:
+        return struct.pack('>I4s', 8 + len(Data), Name) + Data
+
+    Header = bytes(4) + struct.pack('>IIII', 0, 0, 44100, 44100)
+    Track = atom(b'trak', atom(b'mdia',
+                               atom(b'mdhd', Header + bytes(4)) +
+                               atom(b'hdlr', bytes(8) + b'soun' +
+                                    bytes(13))))
+    FilePath.write_bytes(atom(b'ftyp', b'M4A \0\0\0\0M4A mp42isom') +
+                         atom(b'moov', atom(b'mvhd', Header + bytes(80)) +
+                              Track) +
+                         atom(b'mdat', Audio))
+
+def makeRaw(FilePath: Path):
+    FilePath.write_bytes(Audio)
+
+def readTags(FilePath: Path) -> dict:
+    """Read tags back, named as Vorbis comments."""
+    if FilePath.suffix == '.flac':
+        Tags = mutagen.flac.FLAC(FilePath).tags
+        return { Name.lower(): Value[0]
+                 for Name, Value in Tags.as_dict().items() }
+    if FilePath.suffix == '.mp3':
+        Tags = mutagen.id3.ID3(FilePath)
+        return { 'title': Tags['TIT2'].text[0],
+                 'tracknumber': Tags['TRCK'].text[0],
+                 'replaygain_track_gain':
+                 Tags['TXXX:REPLAYGAIN_TRACK_GAIN'].text[0] }
+    if FilePath.suffix == '.m4a':
+        Tags = mutagen.mp4.MP4(FilePath).tags
+        return { 'title': Tags['\xa9nam'][0],
+                 'tracknumber': Tags['trkn'][0],
+                 'replaygain_track_gain': bytes(
+                     Tags['----:com.apple.iTunes:replaygain_track_gain'][0]
+                 ).decode() }
+    Tags = mutagen.apev2.APEv2(FilePath)
+    return { 'title': str(Tags['Title']),
+             'tracknumber': str(Tags['Track']),
+             'replaygain_track_gain': str(Tags['REPLAYGAIN_TRACK_GAIN']) }
+
+def makeTrack(MB, Number: int = 0) -> AudioTrack:
+    Info = mb.DiscInfo(MB.info)
+    Track = AudioTrack(Path('/archive/track.wav'), Info.Tracks[Number])
+    Track.setReplayGain(analysis.ReplayGain(-3.5, 0.9, -4.25, 0.95))
+    return Track
+
+def test_tags(
+        MBFactory: Callable
+):
+    MB = MBFactory()
+    Info = mb.DiscInfo(MB.info)
+    Tags = tagging.getTrackTags(makeTrack(MB), Info, 'frobnitz')
+
+    assert Tags['title'] == MB.releaseTracks()[0]['title']
+    assert Tags['album'] == MB.releaseTitle()
+    assert Tags['albumartist'] == MB.releaseArtistName()
+    assert Tags['tracknumber'] == '0'
+    assert Tags['tracktotal'] == f'{len(MB.releaseTracks())}'
+    assert Tags['musicbrainz_albumid'] == Info.ID
+    assert Tags['musicbrainz_discid'] == 'frobnitz'
+    assert Tags['replaygain_track_gain'] == '-3.50 dB'
+    assert Tags['replaygain_album_peak'] == '0.950000'
+
+    # Opus files carry R128 gains instead.
+    Opus = tagging.getOpusTags(Tags)
+    assert Opus['r128_track_gain'] == f'{round(-8.5 * 256)}'
+    assert Opus['r128_album_gain'] == f'{round(-9.25 * 256)}'
+    assert not any(Name.startswith('replaygain_') for Name in Opus)
+
+@pytest.mark.parametrize('Extension, make, Number, Padded', [
+    ('flac', makeFLAC, '1', True),
+    ('mp3', makeRaw, '1/2', True),
+    ('m4a', makeM4A, (1, 2), True),
+    ('wv', makeRaw, '1/2', False),
+])
+def test_tag_file(
+        tmp_path,
+        MBFactory: Callable,
+        Extension: str,
+        make: Callable,
+        Number,
+        Padded: bool
+):
+    MB = MBFactory()
+    FilePath = tmp_path / f'track.{Extension}'
+    make(FilePath)
+    Tags = tagging.getTrackTags(makeTrack(MB, 1), mb.DiscInfo(MB.info),
+                                'frobnitz')
+
+    assert tagging.tagFile(FilePath, Tags, 4096)
+    Read = readTags(FilePath)
+    assert Read['title'] == Tags['title']
+    assert Read['tracknumber'] == Number
+    assert Read['replaygain_track_gain'] == '-3.50 dB'
+    assert Audio in FilePath.read_bytes()
+
+    # A longer title fits in the padding, so the file keeps its size.
+    Size = FilePath.stat().st_size
+    Tags['title'] = Tags['title'] * 10
+    assert tagging.tagFile(FilePath, Tags, 4096)
+    assert readTags(FilePath)['title'] == Tags['title']
+    if Padded:
+        assert FilePath.stat().st_size == Size
+    assert Audio in FilePath.read_bytes()
+
+def test_tag_file_errors(
+        tmp_path
+):
+    Unknown = tmp_path / 'track.xyz'
+    makeRaw(Unknown)
+    assert not tagging.tagFile(Unknown, { 'title': 'x' }, 4096)
+
+    # Not really a FLAC file.
+    Bad = tmp_path / 'track.flac'
+    makeRaw(Bad)
+    assert not tagging.tagFile(Bad, { 'title': 'x' }, 4096)
+    assert Bad.read_bytes() == Audio
+
+def test_tag_tracks(
+        tmp_path,
+        configFactory: Callable,
+        MBFactory: Callable
+):
+    Config = configFactory()
+    MB = MBFactory()
+    Info = mb.DiscInfo(MB.info)
+
+    Tracks = []
+    for Number, TrackInfo in enumerate(Info.Tracks):
+        FilePath = tmp_path / f'{Number}.flac'
+        makeFLAC(FilePath)
+        Tracks.append(TranscodedTrack(AudioTrack(None, TrackInfo), FilePath,
+                                      0.0))
+    # Tracks that were not transcoded are left alone.
+    Tracks.append(TranscodedTrack(AudioTrack(None, Info.Tracks[0]), None,
+                                  0.0))
+    Tracks.append(AudioTrack(tmp_path / 'archived.wav', Info.Tracks[0]))
+
+    assert tagging.tagTracks(Tracks, Info, 'frobnitz', Config) == len(
+        Info.Tracks
+    )
+    for Track in Tracks[:len(Info.Tracks)]:
+        assert readTags(Track.TranscodedPath)['title'] == Track.Title
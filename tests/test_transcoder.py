@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import os
+from pathlib import Path
+import pytest
+import threading
+from typing import Callable
+
+from dartt.config import Config
+import dartt.cue as cue
+from dartt.disc import AudioTrack
+import dartt.musicbrainz as mb
+import dartt.transcoder as transcoder
+
+def makeTracks(
+        Config,
+        MB
+):
+    ArchivePath = (Path(Config.getAudioArchiveDir()) / MB.releaseArtistName() /
+                   MB.releaseTitle())
+    ArchivePath.mkdir(parents=True)
+
+    Tracks = []
+    for Track in MB.info['disc']['release-list'][0]['medium-list'][0][
+            'track-list']:
+        Info = mb.TrackInfo(Track)
+        TrackPath = ArchivePath / f'{Info.Number:>02}. {Info.Title}.wav'
+        TrackPath.touch()
+        Tracks.append(AudioTrack(TrackPath, Info))
+    return Tracks
+
+class MockEncoder:
+    def __init__(self, Barrier = None):
+        self.Calls = []
+        self._Lock = threading.Lock()
+        self._Barrier = Barrier
+
+    def __call__(self, *Args):
+        with self._Lock:
+            self.Calls.append(Args)
+        if self._Barrier:
+            # All tracks must be encoding at once to get past this.
+            self._Barrier.wait(timeout=5)
+        # Every encoder names the output after its input.
+        Output = [ Arg for Arg in Args if Arg.endswith(f'.{self.Extension}') ]
+        Path(Output[0]).touch()
+        return ''
+
+@pytest.mark.parametrize(
+    'Transcoder', Config.audioTranscoders
+)
+def test_create_transcoder(
+        configFactory,
+        Transcoder
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = f'/usr/bin/{Transcoder}'
+
+    Coder = transcoder.createAudioTranscoder(Config)
+
+    assert isinstance(Coder, transcoder.AudioTranscoders[Transcoder])
+    for Quality in Config.qualities:
+        assert Quality in Coder.Qualities
+
+def test_create_no_transcoder(
+        configFactory
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = ''
+
+    assert transcoder.createAudioTranscoder(Config) is None
+
+def test_create_unknown_transcoder(
+        configFactory
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = '/usr/bin/bogus'
+
+    with pytest.raises(RuntimeError):
+        transcoder.createAudioTranscoder(Config)
+
+@pytest.mark.parametrize(
+    'Quality,Expected',
+    [ ('Very High', '-8'), ('High', '-6'), ('Medium', '-5'), ('Low', '-3') ]
+)
+def test_quality(
+        configFactory,
+        Quality,
+        Expected
+):
+    Config = configFactory()
+    Config['audio']['quality'] = Quality
+
+    Coder = transcoder.createAudioTranscoder(Config)
+    Args = Coder.arguments(Path('in.wav'), Path('out.flac'))
+
+    assert Expected in Args
+    assert Args[-2:] == [ 'out.flac', 'in.wav' ]
+
+def test_transcode(
+        monkeypatch,
+        configFactory,
+        MBFactory
+):
+    Config = configFactory()
+    Config['audio']['transcode_jobs'] = 4
+    MB = MBFactory()
+    Tracks = makeTracks(Config, MB)
+
+    Encoder = MockEncoder(threading.Barrier(len(Tracks)))
+    Encoder.Extension = 'flac'
+
+    with monkeypatch.context() as M:
+        M.setattr('sh.Command', lambda Name: Encoder)
+
+        Transcoded = transcoder.createAudioTranscoder(Config).transcode(
+            iter(Tracks)
+        )
+
+    assert len(Encoder.Calls) == len(Tracks)
+    assert len(Transcoded) == len(Tracks)
+    for Track, Result in zip(Tracks, Transcoded):
+        Expected = (Path(Config.getAudioTranscodeDir()) /
+                    MB.releaseArtistName() / MB.releaseTitle() /
+                    f'{Track.Number:>02}. {Track.Title}.flac')
+        assert Result.TranscodedPath == Expected
+        assert Expected.exists()
+        assert Result.RippedPath == Track.RippedPath
+        assert Result.Number == Track.Number
+        assert Result.Elapsed >= 0
+
+def test_transcode_silence(
+        configFactory,
+        MBFactory,
+        fakeEncoderFactory: Callable
+):
+    Config = configFactory()
+    Config['audio']['transcoder'] = str(fakeEncoderFactory('flac'))
+    Config['audio']['trim_silence'] = True
+    Config['audio']['skip_silent_tracks'] = True
+    MB = MBFactory()
+    Tracks = makeTracks(Config, MB)
+
+    # A tone with silence around it, and a track of silence.
+    Tone = np.full((588 * 20, 2), 1000, dtype='<i2').tobytes()
+    Audio = [ bytes(588 * 4 * 30) + Tone + bytes(588 * 4 * 10),
+              bytes(588 * 4 * 30) ]
+    for Track, Data in zip(Tracks, Audio):
+        Track.RippedPath.write_bytes(cue.getWavHeader(len(Data)) + Data)
+
+    Transcoded = transcoder.createAudioTranscoder(Config).transcode(Tracks)
+
+    Audible, Silent = Transcoded
+    assert Audible.TranscodedPath.read_bytes()[44:] == Tone
+    assert (Audible.Silence.Leading, Audible.Silence.Trailing) == (588 * 30,
+                                                                   588 * 10)
+    assert Silent.TranscodedPath is None
+    assert Silent.Silence.IsSilent
+
+    # The archive keeps the silence.
+    assert Tracks[0].RippedPath.read_bytes()[44:] == Audio[0]
+
+def test_fingerprint(
+        configFactory,
+        fakeEncoderFactory: Callable
+):
+    Config = configFactory()
+    Encoder = fakeEncoderFactory('flac')
+    Config['audio']['transcoder'] = str(Encoder)
+    Track = AudioTrack(Path('in.wav'), None, { 'sha256': 'abc' })
+
+    Coder = transcoder.createAudioTranscoder(Config)
+    assert Coder.Version == 'fake 1.0'
+    Fingerprint = Coder.getFingerprint(Track)
+    assert Fingerprint == transcoder.createAudioTranscoder(
+        Config
+    ).getFingerprint(AudioTrack(Path('other.wav'), None, { 'sha256': 'abc' }))
+
+    # Tracks without a hash cannot be fingerprinted.
+    assert Coder.getFingerprint(AudioTrack(Path('in.wav'), None)) is None
+
+    # Other audio, quality or encoder version make another fingerprint.
+    assert Coder.getFingerprint(
+        AudioTrack(Path('in.wav'), None, { 'sha256': 'def' })
+    ) != Fingerprint
+
+    Config['audio']['quality'] = 'Low'
+    assert transcoder.createAudioTranscoder(Config).getFingerprint(
+        Track
+    ) != Fingerprint
+    Config['audio']['quality'] = 'Very High'
+
+    Modified = Encoder.stat().st_mtime_ns + 1_000_000_000
+    fakeEncoderFactory('flac', 'fake 1.1')
+    os.utime(Encoder, ns=(Modified, Modified))
+    assert Coder.Version == 'fake 1.1'
+    assert Coder.getFingerprint(Track) != Fingerprint
@@ -21,7 +21,11 @@
 # with dartt. If not, see <https://www.gnu.org/licenses/>.
 
 import dartt.utils as utils
+import errno
+import os
 import pytest
+from pathlib import Path
+import threading
 
 @pytest.mark.parametrize(
     'Value,Expected',
@@ -150,3 +154,129 @@ def test_menu_loop(
     assert Result == 'three'
 
     LoopCounter.validate()
+
+@pytest.fixture
+def twoFilesystems(
+        tmp_path,
+        monkeypatch
+):
+    """Make renames between two directories fail as if they were on different
+    filesystems."""
+    First = tmp_path / 'first'
+    Second = tmp_path / 'second'
+    First.mkdir()
+    Second.mkdir()
+
+    Rename = os.rename
+
+    def rename(Source, Destination):
+        if First in Path(Source).parents and Second in Path(Destination).parents:
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        Rename(Source, Destination)
+
+    monkeypatch.setattr('os.rename', rename)
+    return First, Second
+
+def test_moveFile_rename(
+        tmp_path,
+        monkeypatch
+):
+    Source = tmp_path / 'source.wav'
+    Destination = tmp_path / 'destination.wav'
+    Source.write_bytes(b'data' * 1000)
+
+    def copy(*Args):
+        raise AssertionError('Same-filesystem move copied the file')
+
+    monkeypatch.setattr('dartt.utils.copyFile', copy)
+
+    utils.moveFile(Source, Destination)
+
+    assert not Source.exists()
+    assert Destination.read_bytes() == b'data' * 1000
+
+def test_moveFile_cross_device(
+        twoFilesystems
+):
+    First, Second = twoFilesystems
+    Source = First / 'source.wav'
+    Destination = Second / 'destination.wav'
+    Data = os.urandom(3 * 1024 * 1024 + 17)
+    Source.write_bytes(Data)
+
+    utils.moveFile(Source, Destination)
+
+    assert not Source.exists()
+    assert Destination.read_bytes() == Data
+
+def test_copyFile_sendfile_fallback(
+        tmp_path,
+        monkeypatch
+):
+    Source = tmp_path / 'source.wav'
+    Destination = tmp_path / 'destination.wav'
+    Data = os.urandom(1024 * 1024 + 3)
+    Source.write_bytes(Data)
+
+    CopyFileRange = os.copy_file_range
+    Calls = []
+
+    def copyFileRange(In, Out, Count, *Args):
+        # Copy a little, then fail as copy_file_range does across some
+        # filesystems.
+        if not Calls:
+            Calls.append(Count)
+            return CopyFileRange(In, Out, 4096, *Args)
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr('os.copy_file_range', copyFileRange)
+
+    utils.copyFile(Source, Destination)
+
+    assert Calls
+    assert Destination.read_bytes() == Data
+
+def test_copyFile_append(
+        tmp_path
+):
+    Source = tmp_path / 'source.raw'
+    Destination = tmp_path / 'destination.wav'
+    Head = os.urandom(4096 + 44)
+    Tail = os.urandom(65536 + 7)
+    Destination.write_bytes(Head)
+    Source.write_bytes(Tail)
+
+    utils.copyFile(Source, Destination, Append=True)
+
+    assert Destination.read_bytes() == Head + Tail
+
+def test_copyFileRange(
+        tmp_path
+):
+    Source = tmp_path / 'image.bin'
+    Destination = tmp_path / 'track.wav'
+    Data = os.urandom(5 * 2352)
+    Source.write_bytes(Data)
+    Destination.write_bytes(b'H' * 44)
+
+    utils.copyFileRange(Source, Destination, 2352, 2 * 2352)
+    # Ranges past the end of the source stop at its end.
+    utils.copyFileRange(Source, Destination, 4 * 2352, 2 * 2352)
+
+    assert (Destination.read_bytes() ==
+            b'H' * 44 + Data[2352:3 * 2352] + Data[4 * 2352:])
+
+def test_moveFile_error(
+        tmp_path
+):
+    with pytest.raises(FileNotFoundError):
+        utils.moveFile(tmp_path / 'missing', tmp_path / 'destination')
+
+def test_getPool():
+    Pool = utils.getPool('test', 2)
+    assert utils.getPool('test', 2) is Pool
+    assert utils.getPool('other', 2) is not Pool
+    assert utils.getPool('test', 3) is not Pool
+    assert Pool.submit(
+        lambda: threading.current_thread().name
+    ).result().startswith('dartt-test')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: 2023-present David A. Greene <dag@obbligato.org>
+
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Copyright 2023 David A. Greene
+
+# This file is part of dartt
+
+# dartt is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with dartt. If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pytest
+import struct
+import wave
+
+from dartt.verify import (AccurateRipDiscID, AccurateRipURLClient,
+                          DiscSamples, accurateRipCRCs,
+                          parseAccurateRipResponse, readSamples, verifyDisc)
+
+def referenceCRCs(Samples, First, Last):
+    """The AccurateRip CRCs, one sample at a time."""
+    Start = 5 * 588 - 1 if First else 0
+    End = len(Samples) - 5 * 588 if Last else len(Samples)
+    V1 = 0
+    V2 = 0
+    for Index in range(Start, End):
+        Product = int(Samples[Index]) * (Index + 1)
+        V1 = (V1 + Product) & 0xFFFFFFFF
+        V2 = (V2 + (Product & 0xFFFFFFFF) + (Product >> 32)) & 0xFFFFFFFF
+    return V1, V2
+
+def makeSamples(Count, Seed = 0):
+    return np.random.default_rng(Seed).integers(0, 1 << 32, Count,
+                                                dtype=np.uint32)
+
+def writeWav(WavPath, Samples):
+    with wave.open(str(WavPath), 'wb') as Wav:
+        Wav.setnchannels(2)
+        Wav.setsampwidth(2)
+        Wav.setframerate(44100)
+        Wav.writeframes(Samples.astype('<u4').tobytes())
+
+@pytest.mark.parametrize('First,Last', [ (False, False), (True, False),
+                                         (False, True), (True, True) ])
+def test_crcs(First, Last):
+    Samples = makeSamples(20000)
+
+    assert accurateRipCRCs([ Samples ], First, Last) == referenceCRCs(
+        Samples, First, Last)
+
+    # Segment boundaries do not matter.
+    assert accurateRipCRCs([ Samples[:7], Samples[7:12345], Samples[12345:] ],
+                           First, Last) == referenceCRCs(Samples, First, Last)
+
+def test_crcs_chunks(monkeypatch):
+    monkeypatch.setattr('dartt.verify.ChunkSamples', 1000)
+    Samples = makeSamples(9999)
+    assert accurateRipCRCs([ Samples ], True, True) == referenceCRCs(
+        Samples, True, True)
+
+@pytest.mark.parametrize('Offset', [ 0, 6, -6, 667, -1200, 3000 ])
+def test_disc_samples_offset(Offset):
+    Tracks = [ makeSamples(1000, 1), makeSamples(2000, 2), makeSamples(1500, 3) ]
+    Disc = np.concatenate(Tracks)
+    Padded = np.concatenate([ np.zeros(5000, dtype=np.uint32), Disc,
+                              np.zeros(5000, dtype=np.uint32) ])
+    Samples = DiscSamples(Tracks)
+
+    Start = 0
+    for Index, Track in enumerate(Tracks):
+        Segments = Samples.getSegments(Index, Offset)
+        Expected = Padded[5000 + Start + Offset:
+                          5000 + Start + Offset + len(Track)]
+        assert np.array_equal(np.concatenate(Segments), Expected)
+        Start += len(Track)
+
+def test_read_samples(tmp_path):
+    Samples = makeSamples(4321)
+    writeWav(tmp_path / 'track.wav', Samples)
+
+    assert np.array_equal(readSamples(tmp_path / 'track.wav'), Samples)
+
+def test_disc_id():
+    # Three tracks and a lead-out, with the two second lead-in.
+    DiscID = AccurateRipDiscID.fromTOC('1 3 20000 150 5000 12000')
+
+    assert DiscID.TrackCount == 3
+    assert DiscID.ID1 == 0 + 4850 + 11850 + 19850
+    assert DiscID.ID2 == 1 * 1 + 4850 * 2 + 11850 * 3 + 19850 * 4
+    Checksum = (2 + (6 + 6) + (1 + 6 + 0)) % 0xFF
+    assert DiscID.CDDBID == Checksum << 24 | (266 - 2) << 8 | 3
+    assert DiscID.path.startswith(
+        f'{DiscID.ID1 & 0xF:x}/{DiscID.ID1 >> 4 & 0xF:x}/'
+        f'{DiscID.ID1 >> 8 & 0xF:x}/dBAR-003-')
+
+def test_parse_response():
+    Data = b''
+    for CRCs in ([ 1, 2 ], [ 1, 3 ]):
+        Data += struct.pack('<BIII', 2, 0, 0, 0)
+        for CRC in CRCs:
+            Data += struct.pack('<BII', 5, CRC, 0)
+
+    assert parseAccurateRipResponse(Data, 2) == [ { 1: 10 }, { 2: 5, 3: 5 } ]
+
+def test_verify_disc(tmp_path, accurateRipFactory):
+    Tracks = [ makeSamples(588 * 20, 1), makeSamples(588 * 30, 2) ]
+    Paths = []
+    for Number, Samples in enumerate(Tracks, 1):
+        Paths.append((Number, tmp_path / f'{Number:02}.wav'))
+        writeWav(Paths[-1][1], Samples)
+
+    DiscID = AccurateRipDiscID.fromTOC('1 2 200 150 170')
+    CRCs = [ referenceCRCs(Tracks[0], True, False)[1],
+             referenceCRCs(Tracks[1], False, True)[0] ^ 1 ]
+    Client = AccurateRipURLClient(accurateRipFactory(DiscID, CRCs, 7))
+
+    Results = verifyDisc(Paths, DiscID, Client)
+
+    assert [ Result.Number for Result in Results ] == [ 1, 2 ]
+    assert Results[0].Accurate and Results[0].Confidence == 7
+    assert not Results[1].Accurate and Results[1].Confidence == 0
+
+def test_verify_disc_unknown(tmp_path, accurateRipFactory):
+    writeWav(tmp_path / '01.wav', makeSamples(588 * 20))
+    DiscID = AccurateRipDiscID.fromTOC('1 1 170 150')
+    Client = AccurateRipURLClient(accurateRipFactory())
+
+    Results = verifyDisc([ (1, tmp_path / '01.wav') ], DiscID, Client)
+
+    assert Results[0].Confidence is None
+    assert (Results[0].CRCv1, Results[0].CRCv2) == referenceCRCs(
+        readSamples(tmp_path / '01.wav'), True, True)